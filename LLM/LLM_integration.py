@@ -1,10 +1,37 @@
+import contextlib
+import json
 import re
 from enum import Enum
-from typing import List, Optional
+from typing import Callable, List, Optional, Tuple
 import requests
 
 from config_parser.config_parser import load_llm_config
-from store.user_history_store import UserHistoryStore
+from LLM.canned_responses import canned_output
+from LLM.overload import OverloadDetector, get_overload_detector
+from LLM.prompt_builder import PromptBuilder, estimate_tokens
+from LLM.provider_pool import get_provider_session
+from LLM.provider_router import PartialResponseError, ProviderRouter, get_provider_router
+from LLM.response_cache import ResponseCache, get_response_cache
+from LLM.scheduler import (PRIORITY_ESTABLISHED, PRIORITY_INTERACTIVE, PRIORITY_NEW, LLMScheduler,
+                           SchedulerOverloaded, get_scheduler)
+from LLM.single_flight import SingleFlight, get_single_flight
+from store.response_corpus import ResponseCorpus, get_response_corpus
+from store.user_history_store import get_user_history_store
+
+
+# trailing shell prompt of a response, e.g. "root@10.0.0.1:/tmp$ "
+PROMPT_REGEX = re.compile(r"[^\s@]+@[^\s:]+:([^\r\n$]*)\$ ?$")
+
+BATCH_PROMPT = (
+    "The following commands were pasted into the terminal and run one after another:\n{commands}\n"
+    "Respond with only a JSON array of {count} strings, one per command not marked as answered, in the same "
+    "order, each holding exactly what the terminal shows for that command: its output followed by the shell prompt."
+)
+JSON_ARRAY_REGEX = re.compile(r"\[.*\]", re.DOTALL)
+
+# sessions past these marks are scheduled ahead of fresh (mostly bot) sessions
+ESTABLISHED_MIN_COMMANDS = 5
+INTERACTIVE_MIN_KEYSTROKES = 20
 
 
 class Role(Enum):
@@ -30,6 +57,37 @@ class Message:
         return {"role": self.role, "content": self.content}
 
 
+class ProviderEndpoint:
+    """
+    one provider and model requests can be routed to
+    """
+
+    def __init__(self, provider: LLMProvider, model: str, api_key: Optional[str], api_endpoint: str,
+                 session: requests.Session):
+        self.provider = provider
+        self.model = model
+        self.api_key = api_key
+        self.api_endpoint = api_endpoint
+        self.session = session
+        self.name = f"{provider.value}:{model}"
+
+
+class StreamCleaner:
+    """
+    incremental version of LLMHoneypot._clean_content for streamed responses
+    """
+
+    def __init__(self):
+        self._started = False
+
+    def feed(self, delta: str) -> str:
+        content = delta.replace('\n', '\r\n')
+        if not self._started:
+            content = content.lstrip('\r\n')
+            self._started = bool(content)
+        return content
+
+
 class LLMHoneypot:
 
     OPENAI_ENDPOINT = "https://api.openai.com/v1/chat/completions"
@@ -48,23 +106,52 @@ class LLMHoneypot:
         llm_config = load_llm_config(config)
         self.provider = LLMProvider(llm_config["llm_provider"])
         self.model = llm_config["llm_model"]
-        self.api_key = llm_config["api_key"]
         self.sys_prompt_text = llm_config["system_prompt"]
 
+        self.timeout = (llm_config["connect_timeout"], llm_config["read_timeout"])
+        self.stream = llm_config["stream"]
+        self.history_max_bytes = llm_config["session_history_max_bytes"]
+        self.history_trimmed = 0
+
+        cache_config = llm_config["response_cache"]
+        self.response_cache: Optional[ResponseCache] = None
+        if cache_config["enabled"]:
+            self.response_cache = get_response_cache(cache_config["max_entries"], cache_config["ttl"])
+
+        corpus_config = llm_config["response_corpus"]
+        self.corpus: Optional[ResponseCorpus] = None
+        if corpus_config["enabled"]:
+            self.corpus = get_response_corpus(corpus_config["path"])
+
+        self.single_flight: Optional[SingleFlight] = None
+        if llm_config["coalesce_requests"]:
+            self.single_flight = get_single_flight()
+
+        self.scheduler: Optional[LLMScheduler] = get_scheduler(llm_config["rate_limit"])
+        self.overload: Optional[OverloadDetector] = get_overload_detector(llm_config["overload"])
+        # commands answered in this session and input chunks looking like single keystrokes,
+        # used to tell interactive sessions from scripted ones
+        self.commands = 0
+        self.keystrokes = 0
+
+        budget_config = llm_config["prompt_budget"]
+        self.prompt_builder = PromptBuilder(
+            budget_config["max_tokens"],
+            budget_config["max_turns"],
+            budget_config["summarize"],
+        )
+
+        # how the last command was answered, reported alongside the command_input event
+        self.last_call: dict = {}
+
         self.username = username
         self.ssh_server_ip = ssh_server_ip
-        self.session = requests.Session()
-
-        if self.provider == LLMProvider.OPENAI:
-            self.api_endpoint = self.OPENAI_ENDPOINT
-        elif self.provider == LLMProvider.DEEPSEEK:
-            self.api_endpoint = self.DEEPSEEK_ENDPOINT
-        elif self.provider == LLMProvider.GROK:
-            self.api_endpoint = self.GROK_ENDPOINT
-        elif self.provider == LLMProvider.OLLAMA:
-            self.api_endpoint = self.OLLAMA_ENDPOINT
-
-        self.history_store = history_store or UserHistoryStore()
+        endpoints = [self._create_endpoint(provider_config, llm_config) for provider_config in llm_config["providers"]]
+        # health and latency of the endpoints are tracked across all sessions
+        self.router: ProviderRouter = get_provider_router(endpoints, llm_config["routing"])
+        self.session: requests.Session = endpoints[0].session
+
+        self.history_store = history_store or get_user_history_store()
         self.histories: List[Message] = self._load_user_history()
         self.sys_prompt_message = Message(Role.SYSTEM, self._get_system_prompt())
 
@@ -87,7 +174,30 @@ class LLMHoneypot:
         ]
 
         self.histories.extend(start_up)
+        self._history_bytes = sum(len(message.content) for message in self.histories)
+        self._trim_history()
+
+    def _create_endpoint(self, provider_config: dict, llm_config: dict) -> ProviderEndpoint:
+        provider = LLMProvider(provider_config["llm_provider"])
+
+        if provider == LLMProvider.OPENAI:
+            api_endpoint = self.OPENAI_ENDPOINT
+        elif provider == LLMProvider.DEEPSEEK:
+            api_endpoint = self.DEEPSEEK_ENDPOINT
+        elif provider == LLMProvider.GROK:
+            api_endpoint = self.GROK_ENDPOINT
+        elif provider == LLMProvider.OLLAMA:
+            api_endpoint = self.OLLAMA_ENDPOINT
+        else:
+            api_endpoint = None
 
+        session = get_provider_session(
+            provider.value,
+            llm_config["pool_size"],
+            llm_config["max_retries"],
+            llm_config["retry_backoff"],
+        )
+        return ProviderEndpoint(provider, provider_config["llm_model"], provider_config["api_key"], api_endpoint, session)
 
     def _get_system_prompt(self):
         return self.sys_prompt_text + f" User: {self.username} Server: {self.ssh_server_ip}"
@@ -106,39 +216,363 @@ class LLMHoneypot:
             {"role": assistant_msg.role, "message": assistant_msg.content},
         ])
 
+    def current_directory(self) -> str:
+        """
+        infers the working directory from the prompt ending the last response
+        """
+        for message in reversed(self.histories):
+            if message.role == Role.ASSISTANT.value:
+                directory = self._prompt_directory(message.content)
+                if directory is not None:
+                    return directory
+        return "~"
+
+    @staticmethod
+    def _prompt_directory(response: str) -> Optional[str]:
+        match = PROMPT_REGEX.search(response)
+        if match is None:
+            return None
+        return match.group(1) or "~"
+
     def build_prompt(self, command: str) -> List[Message]:
-        messages = []
-        messages.extend(self.histories)
-        messages.append(self.sys_prompt_message)
-        messages.append(Message(Role.USER, command))
-        return messages
+        return self.prompt_builder.build(
+            self.sys_prompt_message,
+            self.histories,
+            Message(Role.USER, command),
+            lambda summary: Message(Role.SYSTEM, summary),
+        )
+
+    def execute_model(self, command: str, on_chunk: Optional[Callable[[str], None]] = None) -> str:
+        """
+        :param command: command typed by the attacker
+        :param on_chunk: when streaming is enabled, called with each cleaned piece of the response as it arrives
+        :return: the full cleaned response
+        """
+        cwd = self.current_directory()
+        request_key = ResponseCache.make_key(command, self.username, self.ssh_server_ip, cwd)
+        response, source = self._lookup(command, cwd)
+
+        call_info = {}
+        if response is not None:
+            if self.overload is not None and self.overload.overloaded:
+                # cache and corpus are the first tiers of the fallback, their hits count as degraded while overloaded
+                self.overload.record_degraded(source)
+                call_info["degraded"] = True
+        elif self.overload is not None and self.overload.should_degrade():
+            response, source = self._degraded_response(command)
+            call_info["degraded"] = True
+        else:
+            try:
+                with self._tracked():
+                    response, source, call_info = self._call_llm(command, request_key, on_chunk)
+                # the directory the command ran in, the response corpus is indexed by it
+                call_info["cwd"] = cwd
+            except SchedulerOverloaded as e:
+                # a rejected request is answered like one made while overloaded, the session goes on
+                print(f"[LLM] {e}, answering without the LLM")
+                response, source = self._degraded_response(command)
+                call_info = {"degraded": True}
+
+        if source not in ("llm", "coalesced") and self.stream and on_chunk is not None:
+            # responses from the LLM have been relayed as they arrived
+            on_chunk(response)
+
+        self.record_exchange(command, response, source)
+        self.last_call.update(call_info)
 
-    def execute_model(self, command: str) -> str:
-        messages = self.build_prompt(command)
+        return response
 
-        response = self._api_caller(messages)
+    def execute_batch(self, commands: List[str]) -> Optional[List[Tuple[str, dict]]]:
+        """
+        answers several pasted commands at once: from the response cache and corpus where
+        possible, the remaining ones with a single LLM request; each command is recorded in
+        the history on its own, as if it had been sent separately
+        :return: (response, details for the command_input event) for the leading commands, usually
+                 all of them; the others have to be sent one by one, all of them when None is returned
+                 (the LLM is overloaded or its answer was unusable)
+        """
+        if self.overload is not None and self.overload.should_degrade():
+            return None
+
+        # answers are looked up assuming commands left to the LLM stay in their directory,
+        # which is checked against the LLM's answers once they are in
+        cwd = self.current_directory()
+        known = []
+        for command in commands:
+            response, source = self._lookup(command, cwd)
+            known.append((cwd, response, source))
+            if response is not None:
+                cwd = self._prompt_directory(response) or cwd
+        missing = [command for command, (_, response, _) in zip(commands, known) if response is None]
+
+        outputs = iter(())
+        call_info = {}
+        llm_source = "batch"
+        degraded = False
+        if missing:
+            try:
+                with self._tracked():
+                    (content, call_info), shared = self._request_batch(commands, known)
+            except SchedulerOverloaded as e:
+                # sending the commands one by one would only queue them again
+                print(f"[LLM] {e}, answering a batch of {len(missing)} commands without the LLM")
+                degraded = True
+            else:
+                parsed = self._parse_batch(content, len(missing))
+                if parsed is None:
+                    print(f"[LLM] Unusable answer to a batch of {len(missing)} commands, sending them one by one")
+                    return None
+                outputs = iter(parsed)
+                if shared:
+                    llm_source, call_info = "coalesced", {}
+
+        results = []
+        cwd = self.current_directory()
+        for command, (assumed_cwd, response, source) in zip(commands, known):
+            if response is not None and assumed_cwd != cwd:
+                # a command before this one changed directory, its lookup does not hold
+                break
+            details = {}
+            if response is None and degraded:
+                response, source = self._degraded_response(command)
+                details = {"degraded": True}
+            elif response is None:
+                response, source = self._batch_response(next(outputs), cwd), llm_source
+                details = dict(call_info, cwd=cwd)
+                if self.response_cache is not None and source == "batch":
+                    self.response_cache.put(ResponseCache.make_key(command, self.username, self.ssh_server_ip, cwd),
+                                            response)
+            self.record_exchange(command, response, source)
+            self.last_call.update(details, batch_size=len(commands))
+            results.append((response, self.last_call))
+            cwd = self._prompt_directory(response) or cwd
+        return results
+
+    def _lookup(self, command: str, cwd: str) -> Tuple[Optional[str], Optional[str]]:
+        """
+        :return: (response, source) from the response cache or the corpus, or (None, None)
+        """
+        if self.response_cache is not None:
+            response = self.response_cache.get(ResponseCache.make_key(command, self.username, self.ssh_server_ip, cwd))
+            if response is not None:
+                return response, "cache"
+        if self.corpus is not None:
+            # answers seen in earlier sessions, also across restarts
+            response = self.corpus.lookup(command, self.username, self.ssh_server_ip, cwd)
+            if response is not None:
+                return response, "corpus"
+        return None, None
+
+    def _request_batch(self, commands: List[str], known: List[Tuple[str, Optional[str], Optional[str]]]):
+        """
+        asks the LLM for the commands without a known answer; the known answers are part of the prompt
+        :return: ((answer, details of the call), whether the answer came from another session's request)
+        """
+        lines = []
+        for number, (command, (_, response, _)) in enumerate(zip(commands, known), 1):
+            lines.append(f"{number}. {command}")
+            if response is not None:
+                lines.append(f"   answered: {json.dumps(response)}")
+        count = sum(response is None for _, response, _ in known)
+
+        def request():
+            return self._api_caller(self.build_prompt(BATCH_PROMPT.format(commands="\n".join(lines), count=count)))
+
+        if self.single_flight is None:
+            return request(), False
+        # bots pasting the same script at the same time share one upstream call
+        key = (self.provider.value, self.model, "batch") + tuple(
+            ResponseCache.make_key(command, self.username, self.ssh_server_ip, cwd) + (response is None,)
+            for command, (cwd, response, _) in zip(commands, known)
+        )
+        return self.single_flight.do(key, request)
+
+    def _batch_response(self, output: str, cwd: str) -> str:
+        response = self._clean_content(output)
+        if PROMPT_REGEX.search(response):
+            return response
+        prompt = f"{self.username}@{self.ssh_server_ip}:{cwd}$ "
+        return response.rstrip("\r\n") + "\r\n" + prompt if response.strip() else prompt
 
+    @staticmethod
+    def _parse_batch(content: str, count: int) -> Optional[List[str]]:
+        """
+        :return: the outputs of a batch answer, or None if it is not a JSON array of count strings
+        """
+        # the array may be wrapped in a markdown code block or come with some chatter
+        match = JSON_ARRAY_REGEX.search(content.replace("\r\n", "\n"))
+        if match is None:
+            return None
+        try:
+            outputs = json.loads(match.group(0))
+        except ValueError:
+            return None
+        if not isinstance(outputs, list) or len(outputs) != count or not all(isinstance(o, str) for o in outputs):
+            return None
+        return outputs
+
+    def _call_llm(self, command: str, request_key, on_chunk: Optional[Callable[[str], None]]):
+        """
+        :return: (response, source, details of the call)
+        """
+        stream_to = on_chunk if self.stream else None
+        shared = False
+        if self.single_flight is not None:
+            # sessions sending the same command at the same time share one upstream call
+            (response, call_info), shared = self.single_flight.do(
+                (self.provider.value, self.model) + request_key,
+                lambda: self._api_caller(self.build_prompt(command), stream_to),
+            )
+        else:
+            response, call_info = self._api_caller(self.build_prompt(command), stream_to)
+
+        if shared:
+            if stream_to is not None:
+                stream_to(response)
+            return response, "coalesced", {}
+
+        if self.response_cache is not None and response:
+            self.response_cache.put(request_key, response)
+        return response, "llm", call_info
+
+    def _tracked(self):
+        return self.overload.track() if self.overload is not None else contextlib.nullcontext()
+
+    def _degraded_response(self, command: str):
+        """
+        answers without the LLM while it is overloaded or the scheduler rejected the
+        request: from the canned outputs of common commands, otherwise as an unknown command
+        :return: (response, source)
+        """
+        output = canned_output(command, self.username, self.ssh_server_ip)
+        if output is not None:
+            source = "template"
+        else:
+            source = "not_found"
+            output = f"{command.split()[0]}: command not found" if command.split() else ""
+
+        if self.overload is not None:
+            self.overload.record_degraded(source)
+        prompt = f"{self.username}@{self.ssh_server_ip}:{self.current_directory()}$ "
+        if not output:
+            return prompt, source
+        return output.replace("\n", "\r\n") + "\r\n" + prompt, source
+
+    def record_exchange(self, command: str, response: str, source: str):
+        """
+        adds a command and its response to the session and user history, so that
+        answers produced outside the LLM (cache, built-in commands) stay part of its context
+        """
         user_msg = Message(Role.USER, command)
         assistant_msg = Message(Role.ASSISTANT, response)
 
         self.histories.append(user_msg)
         self.histories.append(assistant_msg)
+        self._history_bytes += len(command) + len(response)
+        self._trim_history()
 
         self._add_to_user_history(user_msg, assistant_msg)
 
-        return response
-
-    def _api_caller(self, messages: List[Message]):
-        if self.provider != LLMProvider.OLLAMA:
-            if self.api_key is None:
+        self.commands += 1
+        self.last_call = {"source": source}
+
+    def request_priority(self) -> int:
+        """
+        scheduling priority of this session's next LLM request
+        """
+        established = self.commands >= ESTABLISHED_MIN_COMMANDS
+        interactive = self.keystrokes >= INTERACTIVE_MIN_KEYSTROKES
+        if established and interactive:
+            return PRIORITY_INTERACTIVE
+        if established or interactive:
+            return PRIORITY_ESTABLISHED
+        return PRIORITY_NEW
+
+    def _trim_history(self):
+        """
+        caps the in-memory history of the session at history_max_bytes; the oldest
+        exchanges go first and the history is cut down to three quarters of the
+        limit, so trimming does not run again on every command
+        """
+        if self._history_bytes <= self.history_max_bytes:
+            return
+
+        target = self.history_max_bytes * 3 // 4
+        kept = []
+        size = len(self.sys_prompt_message.content)
+        for message in reversed(self.histories):
+            if message.role == Role.SYSTEM.value:
+                continue
+            if size + len(message.content) > target:
+                break
+            kept.append(message)
+            size += len(message.content)
+        kept.reverse()
+        # never start in the middle of an exchange
+        while kept and kept[0].role != Role.USER.value:
+            size -= len(kept.pop(0).content)
+
+        self.history_trimmed += len(self.histories) - len(kept) - 1
+        self.histories = [self.sys_prompt_message] + kept
+        self._history_bytes = size
+
+    def _api_caller(self, messages: List[Message], on_chunk: Optional[Callable[[str], None]] = None):
+        """
+        waits for the scheduler, then sends the prompt through the provider router,
+        failing over to the next provider on errors
+        :return: (cleaned response, details of the call: routing decision and queue wait)
+        """
+        queue_wait = 0.0
+        prompt_tokens = 0
+        if self.scheduler is not None:
+            prompt_tokens = sum(estimate_tokens(message.content) for message in messages)
+            queue_wait = self.scheduler.acquire(prompt_tokens, self.request_priority())
+
+        def admit_hedge() -> bool:
+            # a hedge is a second upstream request, it is only sent if the rate limit has room for it
+            return self.scheduler is None or self.scheduler.try_acquire(prompt_tokens)
+
+        def call(endpoint: ProviderEndpoint) -> str:
+            if on_chunk is None:
+                return self._call_endpoint(endpoint, messages)
+
+            relayed = False
+
+            def relay(chunk: str):
+                nonlocal relayed
+                relayed = True
+                on_chunk(chunk)
+
+            try:
+                return self._call_endpoint(endpoint, messages, relay)
+            except Exception as e:
+                if relayed:
+                    raise PartialResponseError(f"{endpoint.name} failed mid-stream: {e}") from e
+                raise
+
+        # a streamed response is relayed as it arrives, so it cannot be raced against a second provider
+        response, routing = self.router.call(call, hedge=on_chunk is None, admit_hedge=admit_hedge)
+        if self.scheduler is not None:
+            self.scheduler.record_usage(estimate_tokens(response))
+
+        return response, {"routing": routing, "queue_wait_ms": round(queue_wait * 1000)}
+
+    def _call_endpoint(self, endpoint: ProviderEndpoint, messages: List[Message],
+                       on_chunk: Optional[Callable[[str], None]] = None) -> str:
+        if endpoint.provider != LLMProvider.OLLAMA:
+            if endpoint.api_key is None:
                 raise ValueError("API key is required")
 
-        if self.provider in [LLMProvider.OPENAI, LLMProvider.DEEPSEEK, LLMProvider.GROK, LLMProvider.OLLAMA]:
-            payload, headers = self._create_payload(messages)
-            response = self.session.post(self.api_endpoint, json=payload, headers=headers)
+        if endpoint.provider in [LLMProvider.OPENAI, LLMProvider.DEEPSEEK, LLMProvider.GROK, LLMProvider.OLLAMA]:
+            payload, headers = self._create_payload(endpoint, messages, stream=on_chunk is not None)
+
+            if on_chunk is not None:
+                return self._stream_response(endpoint, payload, headers, on_chunk)
+
+            response = endpoint.session.post(endpoint.api_endpoint, json=payload, headers=headers, timeout=self.timeout)
             response_data = response.json()
 
-            if self.provider == LLMProvider.OLLAMA:
+            if endpoint.provider == LLMProvider.OLLAMA:
                 content = response_data.get("message", {}).get("content", "")
             else:
                 if "choices" not in response_data or not response_data["choices"]:
@@ -150,20 +584,75 @@ class LLMHoneypot:
 
         return self._clean_content(content)
 
+    def _stream_response(self, endpoint: ProviderEndpoint, payload, headers, on_chunk: Callable[[str], None]) -> str:
+        response = endpoint.session.post(endpoint.api_endpoint, json=payload, headers=headers, timeout=self.timeout,
+                                         stream=True)
+        try:
+            if response.status_code != 200:
+                raise ValueError(f"LLM provider returned HTTP {response.status_code}")
+
+            cleaner = StreamCleaner()
+            parts = []
+
+            # chunk_size=None hands over data as soon as the provider flushes it
+            for raw_line in response.iter_lines(chunk_size=None):
+                delta, done = self._parse_stream_line(endpoint.provider, raw_line.decode("utf-8"))
+                if delta:
+                    cleaned = cleaner.feed(delta)
+                    if cleaned:
+                        parts.append(cleaned)
+                        on_chunk(cleaned)
+                if done:
+                    break
+        finally:
+            response.close()
+
+        return "".join(parts)
+
+    @staticmethod
+    def _parse_stream_line(provider: LLMProvider, line: str):
+        """
+        parses one line of a streamed completion
+        :return: (content delta, whether the stream is finished)
+        """
+        line = line.strip()
+        if not line:
+            return "", False
 
-    def _create_payload(self, messages: List[Message]):
+        if provider == LLMProvider.OLLAMA:
+            # Ollama streams newline-delimited JSON objects
+            data = json.loads(line)
+            return data.get("message", {}).get("content", ""), bool(data.get("done"))
+
+        # OpenAI-compatible providers stream server-sent events
+        if not line.startswith("data:"):
+            return "", False
+
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            return "", True
+
+        choices = json.loads(data).get("choices") or []
+        if not choices:
+            return "", False
+
+        return choices[0].get("delta", {}).get("content") or "", False
+
+
+    @staticmethod
+    def _create_payload(endpoint: ProviderEndpoint, messages: List[Message], stream: bool = False):
         payload = {
-            "model": self.model,
+            "model": endpoint.model,
             "messages": [msg.to_dict() for msg in messages],
-            "stream": False,
+            "stream": stream,
         }
 
         headers = {
             "Content-Type": "application/json"
         }
 
-        if self.provider in [LLMProvider.OPENAI, LLMProvider.DEEPSEEK, LLMProvider.GROK]:
-            headers["Authorization"] = f"Bearer {self.api_key}"
+        if endpoint.provider in [LLMProvider.OPENAI, LLMProvider.DEEPSEEK, LLMProvider.GROK]:
+            headers["Authorization"] = f"Bearer {endpoint.api_key}"
 
         return payload, headers
 
@@ -171,4 +660,3 @@ class LLMHoneypot:
     @staticmethod
     def _clean_content(content: str) -> str:
         return content.replace('\n', '\r\n').lstrip('\r\n')
-
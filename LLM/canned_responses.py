@@ -0,0 +1,135 @@
+import re
+import shlex
+from datetime import datetime
+from typing import Optional
+from urllib.parse import urlparse
+
+from LLM.response_cache import normalize_command
+
+# outputs of commands bots commonly run to fingerprint a machine, used while the LLM is overloaded;
+# {username} is replaced with the session's user
+TEMPLATES = {
+    "nproc": "2",
+    "free": (
+        "               total        used        free      shared  buff/cache   available\n"
+        "Mem:         4015432      912364     1850212        1084     1252856     2836980\n"
+        "Swap:        2097148           0     2097148"
+    ),
+    "free -m": (
+        "               total        used        free      shared  buff/cache   available\n"
+        "Mem:            3921         891        1806           1        1223        2770\n"
+        "Swap:           2047           0        2047"
+    ),
+    "free -h": (
+        "               total        used        free      shared  buff/cache   available\n"
+        "Mem:           3.8Gi       891Mi       1.8Gi       1.0Mi       1.2Gi       2.7Gi\n"
+        "Swap:          2.0Gi          0B       2.0Gi"
+    ),
+    "df -h": (
+        "Filesystem      Size  Used Avail Use% Mounted on\n"
+        "tmpfs           393M  1.1M  392M   1% /run\n"
+        "/dev/sda1        39G  7.9G   31G  21% /\n"
+        "tmpfs           2.0G     0  2.0G   0% /dev/shm\n"
+        "tmpfs           5.0M     0  5.0M   0% /run/lock\n"
+        "/dev/sda15      105M  6.1M   99M   6% /boot/efi\n"
+        "tmpfs           393M  4.0K  393M   1% /run/user/0"
+    ),
+    "lscpu": (
+        "Architecture:             x86_64\n"
+        "  CPU op-mode(s):         32-bit, 64-bit\n"
+        "  Address sizes:          40 bits physical, 48 bits virtual\n"
+        "  Byte Order:             Little Endian\n"
+        "CPU(s):                   2\n"
+        "  On-line CPU(s) list:    0,1\n"
+        "Vendor ID:                GenuineIntel\n"
+        "  Model name:             Intel Xeon Processor (Skylake, IBRS)\n"
+        "    CPU family:           6\n"
+        "    Model:                85\n"
+        "    Thread(s) per core:   1\n"
+        "    Core(s) per socket:   1\n"
+        "    Socket(s):            2\n"
+        "Virtualization features:\n"
+        "  Hypervisor vendor:      KVM\n"
+        "  Virtualization type:    full"
+    ),
+    "cat /proc/cpuinfo | grep name | wc -l": "2",
+    "cat /proc/cpuinfo | grep \"model name\" | head -n 1": "model name\t: Intel Xeon Processor (Skylake, IBRS)",
+    "ps": (
+        "    PID TTY          TIME CMD\n"
+        "   1841 pts/0    00:00:00 bash\n"
+        "   1862 pts/0    00:00:00 ps"
+    ),
+    "ps aux": (
+        "USER         PID %CPU %MEM    VSZ   RSS TTY      STAT START   TIME COMMAND\n"
+        "root           1  0.0  0.3 167744 12900 ?        Ss   Mar02   0:21 /sbin/init\n"
+        "root         412  0.0  0.4  48260 17208 ?        S<s  Mar02   0:09 /usr/lib/systemd/systemd-journald\n"
+        "root         689  0.0  0.1  12196  7680 ?        Ss   Mar02   0:00 sshd: /usr/sbin/sshd -D\n"
+        "root         702  0.0  0.0   6824  2816 ?        Ss   Mar02   0:02 /usr/sbin/cron -f\n"
+        "{username}      1841  0.0  0.1   8652  5504 pts/0    Ss   10:14   0:00 -bash\n"
+        "{username}      1862  0.0  0.1  10884  4352 pts/0    R+   10:15   0:00 ps aux"
+    ),
+    "w": (
+        " {time} up 41 days,  3:12,  1 user,  load average: 0.08, 0.03, 0.01\n"
+        "USER     TTY      FROM             LOGIN@   IDLE   JCPU   PCPU WHAT\n"
+        "{username:<8} pts/0    -                10:14    0.00s  0.02s  0.00s w"
+    ),
+    "uptime": " {time} up 41 days,  3:12,  1 user,  load average: 0.08, 0.03, 0.01",
+    "history": "    1  history",
+    "crontab -l": "no crontab for {username}",
+    "which wget": "/usr/bin/wget",
+    "which curl": "/usr/bin/curl",
+    "which python3": "/usr/bin/python3",
+    "ip a": (
+        "1: lo: <LOOPBACK,UP,LOWER_UP> mtu 65536 qdisc noqueue state UNKNOWN group default qlen 1000\n"
+        "    link/loopback 00:00:00:00:00:00 brd 00:00:00:00:00:00\n"
+        "    inet 127.0.0.1/8 scope host lo\n"
+        "2: eth0: <BROADCAST,MULTICAST,UP,LOWER_UP> mtu 1500 qdisc fq_codel state UP group default qlen 1000\n"
+        "    link/ether 52:54:00:3a:7c:11 brd ff:ff:ff:ff:ff:ff\n"
+        "    inet {ip}/24 brd {ip} scope global eth0"
+    ),
+}
+TEMPLATES["ip addr"] = TEMPLATES["ip a"]
+TEMPLATES["ps -ef"] = TEMPLATES["ps aux"]
+
+# commands printing nothing when they succeed
+SILENT_COMMANDS = {
+    "chmod", "chown", "chattr", "cp", "mv", "ln", "kill", "pkill", "killall", "sleep", "unset",
+    "ulimit", "sync", "service", "systemctl", "history", "crontab", "nohup", "sh", "bash",
+}
+
+UNSUPPORTED_SYNTAX = re.compile(r"[|;&`<>]|\$\(")
+
+
+def canned_output(command: str, username: str, ssh_server_ip: str) -> Optional[str]:
+    '''
+    plausible output of a common command without asking the LLM
+    :return: the output without the trailing prompt, or None if the command is not covered
+    '''
+    command = normalize_command(command)
+    template = TEMPLATES.get(command)
+    if template is not None:
+        return template.format(username=username, ip=ssh_server_ip, time=datetime.now().strftime("%H:%M:%S"))
+
+    if UNSUPPORTED_SYNTAX.search(command):
+        return None
+    try:
+        args = shlex.split(command)
+    except ValueError:
+        return None
+    if not args:
+        return None
+
+    if args[0] in SILENT_COMMANDS and len(args) > 1:
+        return ""
+    urls = [arg for arg in args[1:] if not arg.startswith("-")]
+    if args[0] == "wget" and urls:
+        host = urlparse(urls[0] if "://" in urls[0] else f"http://{urls[0]}").hostname or urls[0]
+        return (
+            f"--{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}--  {urls[0]}\n"
+            f"Resolving {host} ({host})... failed: Temporary failure in name resolution.\n"
+            f"wget: unable to resolve host address ‘{host}’"
+        )
+    if args[0] == "curl" and urls:
+        host = urlparse(urls[0] if "://" in urls[0] else f"http://{urls[0]}").hostname or urls[0]
+        return f"curl: (6) Could not resolve host: {host}"
+    return None
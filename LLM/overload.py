@@ -0,0 +1,152 @@
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Optional
+
+from logger.logger import log_event
+from metrics.metrics import register_collector
+
+
+class OverloadDetector:
+    '''
+    decides when LLM requests should be answered from cheaper sources instead
+
+    The detector watches the number of LLM requests in flight (including the
+    ones waiting in the scheduler queue) and an EWMA of how long they take.
+    Overload starts when either goes over its threshold and ends once both
+    are back below recover_ratio of it. While overloaded, one request per
+    probe_interval still goes to the LLM so the latency estimate keeps up
+    with the provider and recovery is noticed.
+    '''
+
+    def __init__(self,
+                 max_queue_depth: int = 32,
+                 max_latency: float = 15,
+                 recover_ratio: float = 0.5,
+                 probe_interval: float = 5,
+                 ewma_alpha: float = 0.3,
+                 ):
+        self.max_queue_depth = max_queue_depth
+        self.max_latency = max_latency
+        self.recover_ratio = recover_ratio
+        self.probe_interval = probe_interval
+        self.ewma_alpha = ewma_alpha
+
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.latency: Optional[float] = None
+        self.overloaded = False
+        self._overloaded_since = 0.0
+        self._last_probe = 0.0
+
+        self.episodes = 0
+        self.degraded = 0
+        self.degraded_by_tier: Counter = Counter()
+        self._episode_degraded = 0
+
+    def should_degrade(self) -> bool:
+        '''
+        :return: True if the next request should not go to the LLM
+        '''
+        now = time.monotonic()
+        transition = None
+        duration = None
+        with self._lock:
+            depth_ratio = self.in_flight / self.max_queue_depth
+            latency_ratio = (self.latency or 0.0) / self.max_latency
+            if not self.overloaded and (depth_ratio >= 1 or latency_ratio >= 1):
+                self.overloaded = True
+                self._overloaded_since = now
+                self._last_probe = now
+                self._episode_degraded = 0
+                self.episodes += 1
+                transition = "start"
+            elif self.overloaded and depth_ratio <= self.recover_ratio and latency_ratio <= self.recover_ratio:
+                self.overloaded = False
+                duration = round(now - self._overloaded_since, 1)
+                transition = "end"
+
+            degrade = self.overloaded
+            if degrade and depth_ratio < 1 and now - self._last_probe >= self.probe_interval:
+                self._last_probe = now
+                degrade = False
+            details = self._details(now)
+            if duration is not None:
+                details["overloaded_seconds"] = duration
+
+        if transition is not None:
+            print(f"[LLM] Overload {transition}: {details['in_flight']} requests in flight, "
+                  f"latency {details['latency_ms']}ms")
+            log_event(event_id="llm_overload", session_id=None, details=dict(details, state=transition))
+        return degrade
+
+    @contextmanager
+    def track(self):
+        '''
+        wraps an LLM request, counting it as in flight and measuring its latency
+        '''
+        with self._lock:
+            self.in_flight += 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            with self._lock:
+                self.in_flight -= 1
+                if self.latency is None:
+                    self.latency = elapsed
+                else:
+                    self.latency = self.ewma_alpha * elapsed + (1 - self.ewma_alpha) * self.latency
+
+    def record_degraded(self, tier: str):
+        with self._lock:
+            self.degraded += 1
+            self.degraded_by_tier[tier] += 1
+            self._episode_degraded += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(
+                self._details(time.monotonic()),
+                episodes=self.episodes,
+                degraded=self.degraded,
+                degraded_by_tier=dict(self.degraded_by_tier),
+            )
+
+    def _details(self, now: float) -> dict:
+        '''
+        expects the lock to be held
+        '''
+        return {
+            "overloaded": self.overloaded,
+            "in_flight": self.in_flight,
+            "latency_ms": None if self.latency is None else round(self.latency * 1000),
+            "overloaded_seconds": round(now - self._overloaded_since, 1) if self.overloaded else 0,
+            "degraded_in_episode": self._episode_degraded,
+        }
+
+
+_detector: Optional[OverloadDetector] = None
+_detector_lock = threading.Lock()
+
+
+def get_overload_detector(overload_config: dict) -> Optional[OverloadDetector]:
+    '''
+    returns the process-wide detector, or None when degradation is disabled
+    :param overload_config: the "overload" section returned by load_llm_config
+    '''
+    global _detector
+    if not overload_config["enabled"]:
+        return None
+    with _detector_lock:
+        if _detector is None:
+            _detector = OverloadDetector(
+                max_queue_depth=overload_config["max_queue_depth"],
+                max_latency=overload_config["max_latency"],
+                recover_ratio=overload_config["recover_ratio"],
+                probe_interval=overload_config["probe_interval"],
+            )
+            register_collector("llm_overload", _detector.stats)
+        return _detector
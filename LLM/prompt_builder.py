@@ -0,0 +1,118 @@
+from typing import List, Optional, Tuple
+
+MESSAGE_OVERHEAD_TOKENS = 4
+SUMMARY_MAX_COMMANDS = 30
+
+
+def estimate_tokens(text: str) -> int:
+    '''
+    rough token estimate (~4 characters per token), good enough for budgeting
+    without pulling in the provider's tokenizer
+    '''
+    return (len(text) + 3) // 4 + MESSAGE_OVERHEAD_TOKENS
+
+
+class PromptBuilder:
+    '''
+    builds the message list sent to the provider from a session's history,
+    keeping it under a token budget
+    '''
+
+    def __init__(self, max_tokens: int, max_turns: int, summarize: bool):
+        self.max_tokens = max_tokens
+        self.max_turns = max_turns
+        self.summarize = summarize
+
+    def build(self, system_message, histories: List, command_message, message_factory) -> List:
+        '''
+        :param system_message: system prompt, sent once at the head of the prompt
+        :param histories: session history; system messages in it are dropped
+        :param command_message: message carrying the new command
+        :param message_factory: callable(content) creating the summary message
+        :return: messages to send
+        '''
+        turns = self._dedupe(self._split_turns(histories))
+
+        budget = self.max_tokens - estimate_tokens(system_message.content) - estimate_tokens(command_message.content)
+
+        window: List[Tuple] = []
+        used = 0
+        for turn in reversed(turns):
+            if len(window) >= self.max_turns:
+                break
+            cost = sum(estimate_tokens(message.content) for message in turn)
+            if used + cost > budget:
+                break
+            window.append(turn)
+            used += cost
+        window.reverse()
+
+        messages = [system_message]
+
+        dropped = turns[:len(turns) - len(window)]
+        if dropped and self.summarize:
+            summary = self._summarize(dropped, budget - used)
+            if summary is not None:
+                messages.append(message_factory(summary))
+
+        for turn in window:
+            messages.extend(turn)
+        messages.append(command_message)
+        return messages
+
+    @staticmethod
+    def _split_turns(histories: List) -> List[Tuple]:
+        '''
+        groups the history into (user, assistant) exchanges, skipping system messages
+        '''
+        turns = []
+        pending_user = None
+        for message in histories:
+            if message.role == "system":
+                continue
+            if message.role == "user":
+                if pending_user is not None:
+                    turns.append((pending_user,))
+                pending_user = message
+            elif pending_user is not None:
+                turns.append((pending_user, message))
+                pending_user = None
+            else:
+                turns.append((message,))
+        if pending_user is not None:
+            turns.append((pending_user,))
+        return turns
+
+    @staticmethod
+    def _dedupe(turns: List[Tuple]) -> List[Tuple]:
+        '''
+        drops exchanges that are repeated verbatim later on (start-up `cd`, bots
+        rerunning the same reconnaissance commands), keeping the most recent one
+        '''
+        seen = set()
+        unique = []
+        for turn in reversed(turns):
+            key = tuple((message.role, message.content) for message in turn)
+            if key in seen:
+                continue
+            seen.add(key)
+            unique.append(turn)
+        unique.reverse()
+        return unique
+
+    @staticmethod
+    def _summarize(turns: List[Tuple], budget: int) -> Optional[str]:
+        '''
+        compacts exchanges that fell out of the window into a list of the commands that were run
+        '''
+        commands = [turn[0].content for turn in turns if turn[0].role == "user" and turn[0].content.strip()]
+        if not commands:
+            return None
+
+        commands = commands[-SUMMARY_MAX_COMMANDS:]
+        while commands:
+            summary = "Commands previously run in this session, oldest first: " + "; ".join(commands)
+            if estimate_tokens(summary) <= budget:
+                return summary
+            commands = commands[1:]
+        return None
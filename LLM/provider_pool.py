@@ -0,0 +1,54 @@
+import threading
+from typing import Dict, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+_sessions: Dict[Tuple, requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+
+def _create_session(pool_size: int, max_retries: int, retry_backoff: float) -> requests.Session:
+    retry = Retry(
+        total=max_retries,
+        backoff_factor=retry_backoff,
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=None,  # completions are POSTs, retry them as well
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    # pool_block keeps the number of open connections per provider bounded under bursts
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry, pool_block=True)
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_provider_session(provider: str, pool_size: int, max_retries: int, retry_backoff: float) -> requests.Session:
+    '''
+    returns the process-wide keep-alive session for a provider, creating it on first use;
+    all LLMHoneypot instances talking to the same provider share its connection pool
+    :param provider: provider name, one pool is kept per provider
+    :param pool_size: maximum number of pooled connections to the provider
+    :param max_retries: retries on connection errors and retryable status codes
+    :param retry_backoff: exponential backoff factor between retries, in seconds
+    '''
+    key = (provider, pool_size, max_retries, retry_backoff)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = _create_session(pool_size, max_retries, retry_backoff)
+            _sessions[key] = session
+        return session
+
+
+def close_provider_sessions():
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
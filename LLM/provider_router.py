@@ -0,0 +1,307 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+from metrics.metrics import register_collector
+
+# latency samples kept per endpoint for the hedging percentile
+LATENCY_WINDOW = 200
+
+
+class PartialResponseError(Exception):
+    '''
+    the request failed after part of a streamed response was already relayed to
+    the attacker; retrying it elsewhere would repeat that part, so it is not failed over
+    '''
+
+
+class EndpointHealth:
+    def __init__(self):
+        self.ewma: Optional[float] = None
+        self.samples: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0.0
+
+        self.requests = 0
+        self.failures = 0
+        self.hedged = 0
+
+    def is_healthy(self, now: float) -> bool:
+        return now >= self.unhealthy_until
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percentile))]
+
+
+class ProviderRouter:
+    '''
+    sends each LLM request to the best available provider endpoint
+
+    Endpoints are tried healthy ones first, fastest (by latency EWMA) first;
+    endpoints without measurements yet are tried before measured ones so they
+    get probed, and the configuration order breaks ties. A failed request is
+    retried on the next endpoint; failure_threshold consecutive failures take
+    an endpoint out of rotation for cooldown seconds, after which it is probed
+    again. With hedging enabled, a request to the first endpoint that takes
+    longer than its usual latency percentile is duplicated to the second one
+    and the first answer wins. Hedged requests run on a pool of hedge_workers
+    threads; while all of them are busy, requests are sent without hedging
+    from the calling thread rather than waiting for a free worker. A caller
+    may also veto a hedge, e.g. when the rate limit has no room for it.
+    '''
+
+    def __init__(self,
+                 endpoints: Sequence,
+                 failure_threshold: int = 3,
+                 cooldown: float = 30,
+                 ewma_alpha: float = 0.3,
+                 hedging: bool = False,
+                 hedge_percentile: float = 0.95,
+                 hedge_min_samples: int = 20,
+                 hedge_workers: int = 32,
+                 ):
+        '''
+        :param endpoints: objects with a unique name attribute, in order of preference
+        '''
+        self.endpoints = list(endpoints)
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.ewma_alpha = ewma_alpha
+        self.hedging = hedging
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_workers = hedge_workers
+
+        self._health: Dict[str, EndpointHealth] = {endpoint.name: EndpointHealth() for endpoint in self.endpoints}
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._busy_workers = 0
+
+        self.failovers = 0
+        self.hedges_skipped = 0
+
+    def call(self, fn: Callable, hedge: bool = True,
+             admit_hedge: Optional[Callable[[], bool]] = None) -> Tuple[str, dict]:
+        '''
+        :param fn: performs the request against the endpoint it is called with
+        :param hedge: whether the request may be duplicated; streamed requests must not be
+        :param admit_hedge: called right before a hedge is sent; the hedge is skipped if it returns False
+        :return: (result, routing decision); when every endpoint fails the last error is raised
+        '''
+        remaining = self.candidates()
+        attempts: List[dict] = []
+        last_error: Optional[Exception] = None
+
+        while remaining:
+            endpoint = remaining.pop(0)
+            hedge_delay = None
+            if hedge and self.hedging and not attempts and remaining:
+                hedge_delay = self._hedge_delay(endpoint)
+            if hedge_delay is not None and not self._reserve_worker():
+                hedge_delay = None
+
+            try:
+                if hedge_delay is None:
+                    result, winner, hedged = self._attempt(endpoint, fn, attempts), endpoint, False
+                else:
+                    result, winner, hedged = self._hedged_attempt(endpoint, remaining, hedge_delay, fn, attempts,
+                                                                  admit_hedge)
+                return result, {"provider": winner.name, "attempts": list(attempts), "hedged": hedged}
+            except PartialResponseError:
+                raise
+            except Exception as e:
+                last_error = e
+                if remaining:
+                    with self._lock:
+                        self.failovers += 1
+                    print(f"[LLM] {endpoint.name} failed ({type(e).__name__}: {e}), failing over to {remaining[0].name}")
+
+        raise last_error
+
+    def candidates(self) -> List:
+        '''
+        :return: endpoints in the order they are tried; unhealthy ones last, as a last resort
+        '''
+        now = time.monotonic()
+        with self._lock:
+            healthy = [endpoint for endpoint in self.endpoints if self._health[endpoint.name].is_healthy(now)]
+            unhealthy = [endpoint for endpoint in self.endpoints if not self._health[endpoint.name].is_healthy(now)]
+
+            def latency(endpoint):
+                ewma = self._health[endpoint.name].ewma
+                return 0.0 if ewma is None else ewma
+
+            healthy.sort(key=latency)
+            unhealthy.sort(key=lambda endpoint: self._health[endpoint.name].unhealthy_until)
+        return healthy + unhealthy
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            endpoints = {}
+            for name, health in self._health.items():
+                p95 = health.percentile(0.95)
+                endpoints[name] = {
+                    "healthy": health.is_healthy(now),
+                    "latency_ewma_ms": None if health.ewma is None else round(health.ewma * 1000),
+                    "latency_p95_ms": None if p95 is None else round(p95 * 1000),
+                    "requests": health.requests,
+                    "failures": health.failures,
+                    "hedged": health.hedged,
+                }
+            return {
+                "failovers": self.failovers,
+                "hedge_workers_busy": self._busy_workers,
+                "hedges_skipped": self.hedges_skipped,
+                "endpoints": endpoints,
+            }
+
+    def _attempt(self, endpoint, fn: Callable, attempts: List[dict]) -> str:
+        started = time.monotonic()
+        try:
+            result = fn(endpoint)
+        except Exception as e:
+            elapsed = time.monotonic() - started
+            self._record_failure(endpoint)
+            attempts.append({"provider": endpoint.name, "outcome": type(e).__name__, "latency_ms": round(elapsed * 1000)})
+            raise
+        elapsed = time.monotonic() - started
+        self._record_success(endpoint, elapsed)
+        attempts.append({"provider": endpoint.name, "outcome": "ok", "latency_ms": round(elapsed * 1000)})
+        return result
+
+    def _hedged_attempt(self, primary, remaining: List, delay: float, fn: Callable, attempts: List[dict],
+                        admit_hedge: Optional[Callable[[], bool]] = None):
+        '''
+        sends the request to primary and, if it has not answered after delay, to the next endpoint as well;
+        the hedged endpoint is taken off remaining; expects a worker to be reserved for the primary request
+        :return: (result, endpoint that answered, whether the request was hedged)
+        '''
+        executor = self._get_executor()
+        first = self._submit(executor, primary, fn, attempts)
+        done, _ = wait([first], timeout=delay)
+        if done:
+            # answered (or failed) within its usual latency
+            return first.result(), primary, False
+        if not self._reserve_worker():
+            # every worker is busy, the request is not duplicated
+            return first.result(), primary, False
+        if admit_hedge is not None and not admit_hedge():
+            self._release_worker()
+            with self._lock:
+                self.hedges_skipped += 1
+            return first.result(), primary, False
+
+        secondary = remaining.pop(0)
+        with self._lock:
+            self._health[primary.name].hedged += 1
+        print(f"[LLM] {primary.name} slower than {delay:.2f}s, hedging to {secondary.name}")
+        futures = {first: primary, self._submit(executor, secondary, fn, attempts): secondary}
+
+        pending = set(futures)
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # the slower request keeps running in the background, its latency still counts
+                    return future.result(), futures[future], True
+                error = future.exception()
+        raise error
+
+    def _hedge_delay(self, endpoint) -> Optional[float]:
+        with self._lock:
+            health = self._health[endpoint.name]
+            if len(health.samples) < self.hedge_min_samples:
+                return None
+            return health.percentile(self.hedge_percentile)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.hedge_workers, thread_name_prefix="llm-hedge")
+            return self._executor
+
+    def _reserve_worker(self) -> bool:
+        '''
+        reserves a hedge worker, so requests never wait in the executor's queue
+        :return: False if all workers are busy
+        '''
+        with self._lock:
+            if self._busy_workers >= self.hedge_workers:
+                self.hedges_skipped += 1
+                return False
+            self._busy_workers += 1
+            return True
+
+    def _release_worker(self, _future=None):
+        with self._lock:
+            self._busy_workers -= 1
+
+    def _submit(self, executor: ThreadPoolExecutor, endpoint, fn: Callable, attempts: List[dict]):
+        '''
+        runs an attempt on a reserved worker, which is released once the attempt ends
+        '''
+        future = executor.submit(self._attempt, endpoint, fn, attempts)
+        future.add_done_callback(self._release_worker)
+        return future
+
+    def _record_success(self, endpoint, elapsed: float):
+        with self._lock:
+            health = self._health[endpoint.name]
+            health.requests += 1
+            health.consecutive_failures = 0
+            health.unhealthy_until = 0.0
+            health.samples.append(elapsed)
+            if health.ewma is None:
+                health.ewma = elapsed
+            else:
+                health.ewma = self.ewma_alpha * elapsed + (1 - self.ewma_alpha) * health.ewma
+
+    def _record_failure(self, endpoint):
+        with self._lock:
+            health = self._health[endpoint.name]
+            health.requests += 1
+            health.failures += 1
+            health.consecutive_failures += 1
+            if health.consecutive_failures >= self.failure_threshold:
+                if health.is_healthy(time.monotonic()):
+                    print(f"[LLM] {endpoint.name} failed {health.consecutive_failures} times in a row, "
+                          f"out of rotation for {self.cooldown}s")
+                health.unhealthy_until = time.monotonic() + self.cooldown
+
+
+_routers: Dict[Tuple, ProviderRouter] = {}
+_routers_lock = threading.Lock()
+
+
+def get_provider_router(endpoints: Sequence, routing_config: dict) -> ProviderRouter:
+    '''
+    returns the process-wide router for a list of endpoints, so that health and
+    latency measurements are shared by all sessions
+    :param endpoints: endpoints in order of preference, identified by their name
+    :param routing_config: the "routing" section returned by load_llm_config
+    '''
+    key = tuple(endpoint.name for endpoint in endpoints)
+    with _routers_lock:
+        router = _routers.get(key)
+        if router is None:
+            hedging = routing_config["hedging"]
+            router = ProviderRouter(
+                endpoints,
+                failure_threshold=routing_config["failure_threshold"],
+                cooldown=routing_config["cooldown"],
+                ewma_alpha=routing_config["ewma_alpha"],
+                hedging=hedging["enabled"],
+                hedge_percentile=hedging["percentile"],
+                hedge_min_samples=hedging["min_samples"],
+                hedge_workers=hedging["max_workers"],
+            )
+            _routers[key] = router
+            register_collector("llm_providers", router.stats)
+        return router
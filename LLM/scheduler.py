@@ -0,0 +1,208 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+from metrics.metrics import register_collector
+
+# lower values are served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_ESTABLISHED = 1
+PRIORITY_NEW = 2
+
+
+class SchedulerOverloaded(Exception):
+    '''
+    the request could not be scheduled: the wait queue is full or the request waited too long
+    '''
+
+
+class TokenBucket:
+    '''
+    expects the scheduler's lock to be held; the level may go negative when
+    a request turns out to use more than it was charged for
+    '''
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self._updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def time_until(self, amount: float) -> float:
+        # a request larger than the bucket goes through once the bucket is full
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount: float):
+        self.level -= amount
+
+
+class LLMScheduler:
+    '''
+    process-wide admission of requests to the LLM providers
+
+    Requests are granted against a requests-per-second and a tokens-per-minute
+    token bucket, so a burst of sessions is spread out instead of running into
+    the provider's rate limits. Requests which cannot go out right away wait
+    in a bounded priority queue; the head of the queue is served first, so
+    interactive sessions get ahead of fresh bot sessions. Requests are
+    rejected when the queue is full or after waiting max_wait seconds.
+    Optional requests, such as hedges, use try_acquire() and are only sent
+    when the budget has room right away.
+    '''
+
+    def __init__(self,
+                 requests_per_second: Optional[float] = None,
+                 burst: Optional[int] = None,
+                 tokens_per_minute: Optional[int] = None,
+                 max_queued: int = 256,
+                 max_wait: float = 30,
+                 ):
+        self.request_bucket: Optional[TokenBucket] = None
+        if requests_per_second:
+            self.request_bucket = TokenBucket(requests_per_second, burst or max(1.0, requests_per_second))
+        self.token_bucket: Optional[TokenBucket] = None
+        if tokens_per_minute:
+            self.token_bucket = TokenBucket(tokens_per_minute / 60, tokens_per_minute)
+        self.max_queued = max_queued
+        self.max_wait = max_wait
+
+        self._cv = threading.Condition()
+        self._queue = []
+        self._sequence = itertools.count()
+
+        self.granted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.declined = 0
+        self.granted_by_priority: Counter = Counter()
+        self._wait_total = 0.0
+        self.max_wait_seen = 0.0
+
+    def acquire(self, tokens: int, priority: int = PRIORITY_NEW) -> float:
+        '''
+        blocks until the request may be sent
+        :param tokens: estimated tokens of the request
+        :param priority: one of the PRIORITY_* constants
+        :return: seconds spent waiting
+        '''
+        started = time.monotonic()
+        deadline = started + self.max_wait
+        entry = (priority, next(self._sequence))
+
+        with self._cv:
+            if len(self._queue) >= self.max_queued:
+                self.rejected += 1
+                raise SchedulerOverloaded(f"LLM request queue is full ({self.max_queued} waiting)")
+            heapq.heappush(self._queue, entry)
+
+            while True:
+                now = time.monotonic()
+                if self._queue[0] == entry:
+                    wait = self._time_until(tokens, now)
+                    if wait <= 0:
+                        self._take(tokens)
+                        heapq.heappop(self._queue)
+                        # the next request in line may be able to go as well
+                        self._cv.notify_all()
+                        break
+                else:
+                    wait = deadline - now
+
+                if now >= deadline:
+                    self._queue.remove(entry)
+                    heapq.heapify(self._queue)
+                    self.timeouts += 1
+                    self._cv.notify_all()
+                    raise SchedulerOverloaded(f"LLM request waited more than {self.max_wait}s")
+                self._cv.wait(min(wait, deadline - now))
+
+            waited = time.monotonic() - started
+            self.granted += 1
+            self.granted_by_priority[priority] += 1
+            self._wait_total += waited
+            self.max_wait_seen = max(self.max_wait_seen, waited)
+        return waited
+
+    def try_acquire(self, tokens: int) -> bool:
+        '''
+        grants a request only if it may be sent right away, without getting ahead of queued requests
+        :param tokens: estimated tokens of the request
+        :return: False if the request must not be sent
+        '''
+        with self._cv:
+            if self._queue or self._time_until(tokens, time.monotonic()) > 0:
+                self.declined += 1
+                return False
+            self._take(tokens)
+            self.granted += 1
+            return True
+
+    def record_usage(self, extra_tokens: int):
+        '''
+        charges tokens a request used beyond its estimate, e.g. the response
+        '''
+        if self.token_bucket is None or extra_tokens <= 0:
+            return
+        with self._cv:
+            self.token_bucket.refill(time.monotonic())
+            self.token_bucket.take(extra_tokens)
+
+    def stats(self) -> dict:
+        with self._cv:
+            return {
+                "queued": len(self._queue),
+                "granted": self.granted,
+                "granted_by_priority": dict(self.granted_by_priority),
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "declined": self.declined,
+                "wait_ms_avg": round(self._wait_total / self.granted * 1000) if self.granted else 0,
+                "wait_ms_max": round(self.max_wait_seen * 1000),
+            }
+
+    def _time_until(self, tokens: int, now: float) -> float:
+        wait = 0.0
+        for bucket, amount in ((self.request_bucket, 1), (self.token_bucket, tokens)):
+            if bucket is not None:
+                bucket.refill(now)
+                wait = max(wait, bucket.time_until(amount))
+        return wait
+
+    def _take(self, tokens: int):
+        if self.request_bucket is not None:
+            self.request_bucket.take(1)
+        if self.token_bucket is not None:
+            self.token_bucket.take(tokens)
+
+
+_scheduler: Optional[LLMScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler(rate_limit_config: dict) -> Optional[LLMScheduler]:
+    '''
+    returns the process-wide scheduler, or None when no budget is configured
+    :param rate_limit_config: the "rate_limit" section returned by load_llm_config
+    '''
+    global _scheduler
+    if not rate_limit_config["requests_per_second"] and not rate_limit_config["tokens_per_minute"]:
+        return None
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler(
+                requests_per_second=rate_limit_config["requests_per_second"],
+                burst=rate_limit_config["burst"],
+                tokens_per_minute=rate_limit_config["tokens_per_minute"],
+                max_queued=rate_limit_config["max_queued"],
+                max_wait=rate_limit_config["max_wait"],
+            )
+            register_collector("llm_scheduler", _scheduler.stats)
+        return _scheduler
@@ -0,0 +1,94 @@
+import threading
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+from metrics.metrics import register_collector
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Optional[str] = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    '''
+    coalesces concurrent identical requests: the first caller for a key runs
+    the request, callers arriving while it is in flight wait for its result
+    instead of sending their own
+    '''
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+        self.leaders = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    def do(self, key: Hashable, fn: Callable[[], str]) -> Tuple[str, bool]:
+        '''
+        :param key: identifies identical requests
+        :param fn: performs the request; only called by the first caller for key
+        :return: (result, shared) where shared is True if the result came from another caller's request;
+                 an error raised by fn is raised for every caller
+        '''
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.leaders += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            with self._lock:
+                self.errors += 1
+            raise
+        finally:
+            # later callers start a new request, waiting ones get this result
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def stats(self) -> dict:
+        with self._lock:
+            requests = self.leaders + self.coalesced
+            return {
+                "in_flight": len(self._calls),
+                "upstream_requests": self.leaders,
+                "coalesced": self.coalesced,
+                "coalesced_rate": round(self.coalesced / requests, 4) if requests else 0.0,
+                "errors": self.errors,
+            }
+
+
+_shared_single_flight: Optional[SingleFlight] = None
+_shared_single_flight_lock = threading.Lock()
+
+
+def get_single_flight() -> SingleFlight:
+    '''
+    returns the process-wide coalescing layer shared by all sessions
+    '''
+    global _shared_single_flight
+    with _shared_single_flight_lock:
+        if _shared_single_flight is None:
+            _shared_single_flight = SingleFlight()
+            register_collector("single_flight", _shared_single_flight.stats)
+        return _shared_single_flight
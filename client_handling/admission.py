@@ -0,0 +1,303 @@
+import asyncio
+import threading
+import time
+from collections import Counter
+from typing import Callable, Optional, Set
+
+from logger.logger import log_event
+from metrics.metrics import register_collector
+
+OVERLOAD_POLICIES = ("reject", "delay", "queue")
+# number of source IPs listed in a rejection summary
+SUMMARY_TOP_SOURCES = 20
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class AdmissionTicket:
+    '''
+    slot of one accepted connection; queued tickets hold a place in the
+    bounded queue until a connection slot becomes free
+    '''
+
+    def __init__(self, controller: "AdmissionController", ip: str, admitted: bool):
+        self.controller = controller
+        self.ip = ip
+        self.admitted = admitted
+        self.handshaking = admitted
+        self.released = False
+
+    def wait(self, timeout: float) -> bool:
+        '''
+        blocks until a queued connection is admitted
+        :return: False if no slot became free within timeout; the ticket is released then
+        '''
+        return self.controller._wait_queued(self, timeout)
+
+    async def wait_async(self, timeout: float) -> bool:
+        '''
+        variant of wait() for the asyncio front end, woken up when a slot is freed
+        '''
+        return await self.controller._wait_queued_async(self, timeout)
+
+    def handshake_done(self):
+        self.controller._handshake_done(self)
+
+    def release(self):
+        self.controller._release(self)
+
+
+class AdmissionController:
+    '''
+    admission control for the accept loop
+
+    Caps the number of open connections globally and per source IP and the
+    number of connections still in the SSH handshake, so a single scanner
+    cannot exhaust threads and file descriptors. When the global caps are
+    reached the overload policy decides: reject closes the connection right
+    away, delay stops accepting for a while (connections wait in the kernel
+    backlog) and queue parks the connection in a bounded queue until a slot
+    frees. Rejections are counted and logged as periodic summaries.
+    '''
+
+    def __init__(self,
+                 max_connections: int = 1024,
+                 max_connections_per_ip: int = 8,
+                 max_handshakes: int = 128,
+                 max_queued: int = 256,
+                 handshake_timeout: float = 30,
+                 overload_policy: str = "reject",
+                 overload_delay: float = 2,
+                 summary_interval: float = 60,
+                 ):
+        if overload_policy not in OVERLOAD_POLICIES:
+            raise ValueError(f"Unknown overload policy: {overload_policy}")
+
+        self.max_connections = max_connections
+        self.max_connections_per_ip = max_connections_per_ip
+        self.max_handshakes = max_handshakes
+        self.max_queued = max_queued
+        self.handshake_timeout = handshake_timeout
+        self.overload_policy = overload_policy
+        self.overload_delay = overload_delay
+        self.summary_interval = summary_interval
+
+        self._cv = threading.Condition()
+        self.active = 0
+        self.handshaking = 0
+        self.queued = 0
+        self._per_ip: Counter = Counter()
+        # called with the lock held whenever capacity may have been freed
+        self._capacity_listeners: Set[Callable[[], None]] = set()
+
+        self.admitted_total = 0
+        self.rejected_total = 0
+        self.rejected_by_reason: Counter = Counter()
+        # rejections since the last summary
+        self._window_reasons: Counter = Counter()
+        self._window_sources: Counter = Counter()
+        self._window_started = time.time()
+
+        self._summary_thread = threading.Thread(target=self._summary_loop, name="admission-summary", daemon=True)
+        self._summary_thread.start()
+
+    def admit(self, ip: str, wait: Optional[float] = None) -> Optional[AdmissionTicket]:
+        '''
+        applies the overload policy to a freshly accepted connection; the caller closes it when None is returned
+        :param ip: source IP of the connection
+        :param wait: for the delay policy, how long to wait for capacity; defaults to overload_delay
+        :return: an admitted or, with the queue policy, queued ticket
+        '''
+        with self._cv:
+            ticket, reason = self._try_admit(ip, queue=self.overload_policy == "queue")
+            # a source over its own limit is never worth holding up the accept loop for
+            if ticket is None and self.overload_policy == "delay" and reason != "per_ip_limit":
+                self._cv.wait_for(self._has_capacity, self.overload_delay if wait is None else wait)
+                ticket, reason = self._try_admit(ip)
+            if ticket is None:
+                self._count_rejection(ip, reason)
+            return ticket
+
+    def _try_admit(self, ip: str, queue: bool = False):
+        '''
+        expects the lock to be held
+        :return: (ticket, None) or (None, rejection reason)
+        '''
+        if self._per_ip[ip] >= self.max_connections_per_ip:
+            return None, "per_ip_limit"
+        if self._has_capacity():
+            self._per_ip[ip] += 1
+            self.active += 1
+            self.handshaking += 1
+            self.admitted_total += 1
+            return AdmissionTicket(self, ip, admitted=True), None
+        if queue and self.queued < self.max_queued:
+            self._per_ip[ip] += 1
+            self.queued += 1
+            return AdmissionTicket(self, ip, admitted=False), None
+        if queue:
+            return None, "queue_full"
+        if self.active >= self.max_connections:
+            return None, "connection_limit"
+        return None, "handshake_limit"
+
+    def stats(self) -> dict:
+        with self._cv:
+            return {
+                "active": self.active,
+                "handshaking": self.handshaking,
+                "queued": self.queued,
+                "sources": len(self._per_ip),
+                "admitted": self.admitted_total,
+                "rejected": self.rejected_total,
+                "rejected_by_reason": dict(self.rejected_by_reason),
+            }
+
+    def flush_summary(self):
+        '''
+        logs the rejections counted since the last summary as a single event
+        '''
+        with self._cv:
+            if not self._window_reasons:
+                return
+            total = sum(self._window_reasons.values())
+            details = {
+                "total": total,
+                "reasons": dict(self._window_reasons),
+                "sources": dict(self._window_sources.most_common(SUMMARY_TOP_SOURCES)),
+                "unique_sources": len(self._window_sources),
+                "window_seconds": round(time.time() - self._window_started, 1),
+            }
+            self._window_reasons.clear()
+            self._window_sources.clear()
+            self._window_started = time.time()
+
+        print(f"[ADMISSION] Rejected {total} connections from {details['unique_sources']} sources: {details['reasons']}")
+        log_event(event_id="connections_rejected", session_id=None, details=details)
+
+    def _has_capacity(self) -> bool:
+        return self.active < self.max_connections and self.handshaking < self.max_handshakes
+
+    def _count_rejection(self, ip: str, reason: str):
+        self.rejected_total += 1
+        self.rejected_by_reason[reason] += 1
+        self._window_reasons[reason] += 1
+        self._window_sources[ip] += 1
+
+    def _promote(self, ticket: AdmissionTicket) -> bool:
+        with self._cv:
+            if ticket.admitted:
+                return True
+            if ticket.released or not self._has_capacity():
+                return False
+            self.queued -= 1
+            self.active += 1
+            self.handshaking += 1
+            self.admitted_total += 1
+            ticket.admitted = True
+            ticket.handshaking = True
+            return True
+
+    def _wait_queued(self, ticket: AdmissionTicket, timeout: float) -> bool:
+        with self._cv:
+            if self._cv.wait_for(lambda: ticket.admitted or self._has_capacity(), timeout) and self._promote(ticket):
+                return True
+            self._count_rejection(ticket.ip, "queue_timeout")
+        ticket.release()
+        return False
+
+    async def _wait_queued_async(self, ticket: AdmissionTicket, timeout: float) -> bool:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            freed = loop.create_future()
+
+            def wake():
+                try:
+                    loop.call_soon_threadsafe(_resolve, freed)
+                except RuntimeError:
+                    # loop already closed, nobody is waiting anymore
+                    pass
+
+            with self._cv:
+                # registered before checking, so a slot freed in between is not missed
+                self._capacity_listeners.add(wake)
+            try:
+                if self._promote(ticket):
+                    return True
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(freed, remaining)
+                except asyncio.TimeoutError:
+                    pass
+            finally:
+                with self._cv:
+                    self._capacity_listeners.discard(wake)
+
+        with self._cv:
+            self._count_rejection(ticket.ip, "queue_timeout")
+        ticket.release()
+        return False
+
+    def _notify_capacity(self):
+        '''
+        expects the lock to be held
+        '''
+        self._cv.notify_all()
+        for listener in list(self._capacity_listeners):
+            listener()
+
+    def _handshake_done(self, ticket: AdmissionTicket):
+        with self._cv:
+            if ticket.handshaking:
+                ticket.handshaking = False
+                self.handshaking -= 1
+                self._notify_capacity()
+
+    def _release(self, ticket: AdmissionTicket):
+        with self._cv:
+            if ticket.released:
+                return
+            ticket.released = True
+            if ticket.handshaking:
+                ticket.handshaking = False
+                self.handshaking -= 1
+            if ticket.admitted:
+                self.active -= 1
+            else:
+                self.queued -= 1
+            self._per_ip[ticket.ip] -= 1
+            if self._per_ip[ticket.ip] <= 0:
+                del self._per_ip[ticket.ip]
+            self._notify_capacity()
+
+    def _summary_loop(self):
+        while True:
+            time.sleep(self.summary_interval)
+            try:
+                self.flush_summary()
+            except Exception as e:
+                print(f"[-] Admission summary error: {e}")
+
+
+def create_admission_controller(admission_config: dict) -> AdmissionController:
+    '''
+    :param admission_config: the "admission" section returned by load_server_config
+    '''
+    controller = AdmissionController(
+        max_connections=admission_config["max_connections"],
+        max_connections_per_ip=admission_config["max_connections_per_ip"],
+        max_handshakes=admission_config["max_handshakes"],
+        max_queued=admission_config["max_queued_connections"],
+        handshake_timeout=admission_config["handshake_timeout"],
+        overload_policy=admission_config["overload_policy"],
+        overload_delay=admission_config["overload_delay"],
+        summary_interval=admission_config["rejection_summary_interval"],
+    )
+    register_collector("admission", controller.stats)
+    return controller
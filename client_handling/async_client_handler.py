@@ -0,0 +1,130 @@
+import asyncio
+import threading
+import time
+from typing import Optional
+
+import paramiko
+
+from config_parser.config_parser import load_client_handler_config
+from logger.logger import log_event
+from client_handling.admission import AdmissionTicket
+from client_handling.client_handler import CHANNEL_ACCEPT_TIMEOUT, ClientHandler, apply_handshake_timeout, host_key
+
+
+class LoopEvent(threading.Event):
+    '''
+    threading.Event that also wakes up an asyncio loop when set, so events set
+    from paramiko's transport thread can be awaited without blocking a thread
+    '''
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        super().__init__()
+        self._loop = loop
+        self._waiter = loop.create_future()
+
+    def set(self):
+        super().set()
+        try:
+            self._loop.call_soon_threadsafe(self._wake)
+        except RuntimeError:
+            # loop already closed, nobody is waiting anymore
+            pass
+
+    def _wake(self):
+        if not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def wait_async(self, timeout=None) -> bool:
+        try:
+            await asyncio.wait_for(asyncio.shield(self._waiter), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+
+async def async_client_handle(client, addr, config, executor, ticket: Optional[AdmissionTicket] = None):
+    client_ip, client_port = addr
+    dst_ip, dst_port = client.getsockname()
+
+    client_config = load_client_handler_config(config)
+    loop = asyncio.get_running_loop()
+
+    transport = None
+    server = None
+
+    try:
+        if ticket is not None:
+            if not ticket.admitted and not await ticket.wait_async(ticket.controller.handshake_timeout):
+                print(f"[CLIENT HANDLER] No connection slot became free for {client_ip}:{client_port}.")
+                return
+            handshake_deadline = time.monotonic() + ticket.controller.handshake_timeout
+
+        # paramiko drives the socket from its own transport thread and expects blocking I/O
+        client.setblocking(True)
+
+        transport = paramiko.Transport(client)
+        if ticket is not None:
+            apply_handshake_timeout(transport, ticket.controller.handshake_timeout)
+        transport.local_version = client_config["ssh_banner"]
+        server = ClientHandler(client_ip, client_port, None, dst_ip, dst_port, config=client_config)
+        server.event = LoopEvent(loop)
+        server.register_session(transport)
+
+        transport.add_server_key(host_key)
+
+        negotiated = LoopEvent(loop)
+        transport.start_server(event=negotiated, server=server)
+        await negotiated.wait_async()
+
+        if not transport.is_active():
+            print(f"[CLIENT HANDLER] SSH negotiation failed for {client_ip}:{client_port}.")
+            return
+        server.mark_phase("handshake")
+
+        server.client_version = transport.remote_version
+        log_event(
+            event_id="client_version",
+            session_id=server.session_id,
+            src_ip=client_ip,
+            src_port=client_port,
+            message=server.client_version,
+        )
+
+        setup_deadline = handshake_deadline if ticket is not None else time.monotonic() + CHANNEL_ACCEPT_TIMEOUT
+
+        # the shell request is only sent after the channel has been opened, so accept() returns immediately
+        if not await server.event.wait_async(max(setup_deadline - time.monotonic(), 0)):
+            print(f"[CLIENT HANDLER] No channel was opened for {client_ip}.")
+            return
+
+        channel = transport.accept(0)
+
+        if channel is None:
+            print(f"[CLIENT HANDLER] No channel was opened for {client_ip}.")
+            return
+
+        if ticket is not None:
+            ticket.handshake_done()
+        server.mark_ready()
+
+        if server.exec_command is not None:
+            await loop.run_in_executor(executor, server.run_exec, channel, config)
+            return
+
+        print(f"[CLIENT HANDLER] Session started for {client_ip}:{client_port} with session ID: {server.session_id}")
+
+        channel.send(client_config["standard_banner"].encode())
+
+        await server.start_shell_async(channel, config, executor)
+
+    except Exception as e:
+        print(f"[CLIENT HANDLER ERROR] {e}")
+    finally:
+        if server is not None:
+            server.end_session()
+        if transport:
+            transport.close()
+        client.close()
+        if ticket is not None:
+            ticket.release()
+        print(f"[CLIENT HANDLER] Connection closed for {client_ip}:{client_port}.")
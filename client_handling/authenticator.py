@@ -0,0 +1,165 @@
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Optional
+
+from logger.logger import log_event
+from metrics.metrics import register_collector
+
+AGGREGATION_SCOPES = ("session", "ip")
+
+
+class Authenticator:
+    '''
+    password check with the regex compiled once and shared by all sessions
+    '''
+
+    def __init__(self, password_regex: str):
+        self.pattern = re.compile(password_regex)
+
+    def check(self, username: str, password: str) -> bool:
+        return self.pattern.match(password) is not None
+
+
+_authenticators: Dict[str, Authenticator] = {}
+_authenticators_lock = threading.Lock()
+
+
+def get_authenticator(password_regex: str) -> Authenticator:
+    with _authenticators_lock:
+        authenticator = _authenticators.get(password_regex)
+        if authenticator is None:
+            authenticator = Authenticator(password_regex)
+            _authenticators[password_regex] = authenticator
+        return authenticator
+
+
+class _FailureWindow:
+    def __init__(self, src_ip: str, session_id: Optional[str]):
+        self.src_ip = src_ip
+        self.session_id = session_id
+        self.sessions = set()
+        self.attempts = 0
+        self.credentials: Counter = Counter()
+        self.untracked_attempts = 0
+        self.first_attempt = time.time()
+        self.last_attempt = self.first_attempt
+
+
+class FailedLoginAggregator:
+    '''
+    rolls failed login attempts up into login_failed_summary events
+
+    Attempts are grouped per session or per source IP (scope) and flushed
+    every flush_interval seconds; session scoped groups are also flushed when
+    their session ends. Up to max_credentials distinct username/password pairs
+    are kept per group with their counts, attempts beyond that are only counted.
+    '''
+
+    def __init__(self, scope: str = "session", flush_interval: float = 60, max_credentials: int = 100):
+        if scope not in AGGREGATION_SCOPES:
+            raise ValueError(f"Unknown aggregation scope: {scope}")
+        self.scope = scope
+        self.flush_interval = flush_interval
+        self.max_credentials = max_credentials
+
+        self._windows: Dict[str, _FailureWindow] = {}
+        self._lock = threading.Lock()
+
+        self.attempts_total = 0
+        self.summaries_total = 0
+
+        self._thread = threading.Thread(target=self._flush_loop, name="auth-aggregator", daemon=True)
+        self._thread.start()
+
+    def record(self, session_id: str, src_ip: str, username: str, password: str):
+        key = session_id if self.scope == "session" else src_ip
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None:
+                window = _FailureWindow(src_ip, session_id if self.scope == "session" else None)
+                self._windows[key] = window
+            window.sessions.add(session_id)
+            window.attempts += 1
+            window.last_attempt = time.time()
+            credential = (username, password)
+            if credential in window.credentials or len(window.credentials) < self.max_credentials:
+                window.credentials[credential] += 1
+            else:
+                window.untracked_attempts += 1
+            self.attempts_total += 1
+
+    def end_session(self, session_id: str):
+        if self.scope != "session":
+            return
+        with self._lock:
+            window = self._windows.pop(session_id, None)
+        if window is not None:
+            self._log_summary(window)
+
+    def flush(self):
+        with self._lock:
+            windows = list(self._windows.values())
+            self._windows.clear()
+        for window in windows:
+            self._log_summary(window)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "failed_attempts": self.attempts_total,
+                "summaries": self.summaries_total,
+                "open_windows": len(self._windows),
+            }
+
+    def _log_summary(self, window: _FailureWindow):
+        with self._lock:
+            self.summaries_total += 1
+        log_event(
+            event_id="login_failed_summary",
+            session_id=window.session_id,
+            src_ip=window.src_ip,
+            details={
+                "attempts": window.attempts,
+                "sessions": len(window.sessions),
+                "unique_credentials": len(window.credentials),
+                "credentials": [
+                    {"username": username, "password": password, "count": count}
+                    for (username, password), count in window.credentials.items()
+                ],
+                "untracked_attempts": window.untracked_attempts,
+                "first_attempt": datetime.fromtimestamp(window.first_attempt).isoformat(timespec="seconds"),
+                "last_attempt": datetime.fromtimestamp(window.last_attempt).isoformat(timespec="seconds"),
+            },
+        )
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[-] Failed login summary error: {e}")
+
+
+_aggregator: Optional[FailedLoginAggregator] = None
+_aggregator_lock = threading.Lock()
+
+
+def get_failed_login_aggregator(aggregation_config: dict) -> FailedLoginAggregator:
+    '''
+    returns the process-wide aggregator, created from the first configuration it is called with
+    :param aggregation_config: the "failed_login_aggregation" section returned by load_client_handler_config
+    '''
+    global _aggregator
+    with _aggregator_lock:
+        if _aggregator is None:
+            _aggregator = FailedLoginAggregator(
+                scope=aggregation_config["scope"],
+                flush_interval=aggregation_config["flush_interval"],
+                max_credentials=aggregation_config["max_credentials"],
+            )
+            register_collector("failed_logins", _aggregator.stats)
+        return _aggregator
@@ -1,12 +1,15 @@
+import asyncio
 import os
 import threading
 import time
 import uuid
 from typing import Optional
 import paramiko
-import re
 from paramiko.rsakey import RSAKey
 from config_parser.config_parser import load_client_handler_config
+from client_handling.admission import AdmissionTicket
+from client_handling.authenticator import get_authenticator, get_failed_login_aggregator
+from client_handling.session_registry import SessionEntry, get_session_registry
 from logger.logger import log_event
 from emulated_shell.emulated_shell import EmulatedShell
 
@@ -26,10 +29,23 @@ class ClientHandler(paramiko.ServerInterface):
         self.client_version = client_version
         self.dst_ip = dst_ip
         self.dst_port = dst_port
+        # set once the client asked for a shell or sent an exec request
         self.event = threading.Event()
+        self.exec_command = None
+        self.pty_requested = False
+        self.session_entry: Optional[SessionEntry] = None
         self.emulated_shell = None
         self.input_username = input_username
         self.password_regex = config["password_regex"]
+        self.authenticator = get_authenticator(self.password_regex)
+        self.failed_logins = None
+        if config["failed_login_aggregation"]["enabled"]:
+            self.failed_logins = get_failed_login_aggregator(config["failed_login_aggregation"])
+
+        # milliseconds since the connection was accepted at which each setup phase completed
+        self.started_at = time.monotonic()
+        self.phase_times = {}
+        self._timing_logged = False
 
         log_event(
             event_id="session_start",
@@ -43,26 +59,104 @@ class ClientHandler(paramiko.ServerInterface):
     def get_session_id(self):
         return self.session_id
 
+    def mark_phase(self, phase: str):
+        if phase not in self.phase_times:
+            self.phase_times[phase] = round((time.monotonic() - self.started_at) * 1000, 1)
+
+    def log_timing(self):
+        '''
+        logs the setup phases reached by the session once; sessions that never get
+        a prompt are logged as well, with the phases they completed
+        '''
+        if self._timing_logged:
+            return
+        self._timing_logged = True
+        log_event(
+            event_id="session_timing",
+            session_id=self.session_id,
+            src_ip=self.client_ip,
+            src_port=self.client_port,
+            details={"phases_ms": dict(self.phase_times)},
+        )
+
+    def end_session(self):
+        '''
+        flushes what was collected about the session; called once the connection is closed
+        '''
+        self.log_timing()
+        if self.failed_logins is not None:
+            self.failed_logins.end_session(self.session_id)
+        registry = get_session_registry()
+        if registry is not None:
+            registry.unregister(self.session_id)
+
+    def register_session(self, transport: paramiko.Transport):
+        '''
+        puts the session under the reaper's watch, if this process runs one
+        '''
+        registry = get_session_registry()
+        if registry is not None:
+            self.session_entry = registry.register(self.session_id, self.client_ip, self.client_port, transport)
+
+    def mark_ready(self):
+        if self.session_entry is not None:
+            self.session_entry.mark_ready()
+
+    def _on_input(self):
+        if self.session_entry is not None:
+            self.session_entry.touch()
+
+    def _on_shell_ready(self):
+        self.mark_phase("first_prompt")
+        self.log_timing()
+
     def start_shell(self, channel, config):
         if self.input_username is None:
             self.input_username = "unknown"
 
-        self.emulated_shell = EmulatedShell(channel, self.session_id, self.client_ip, self.client_port, username=self.input_username, config=config)
+        self.emulated_shell = EmulatedShell(channel, self.session_id, self.client_ip, self.client_port, username=self.input_username, config=config, on_ready=self._on_shell_ready, on_input=self._on_input)
         self.emulated_shell.start_session()
 
+    def run_exec(self, channel, config):
+        if self.input_username is None:
+            self.input_username = "unknown"
+
+        self.emulated_shell = EmulatedShell(channel, self.session_id, self.client_ip, self.client_port, username=self.input_username, config=config)
+        self.emulated_shell.run_exec(self.exec_command, pty=self.pty_requested)
+        self.mark_phase("exec_done")
+
+    async def start_shell_async(self, channel, config, executor):
+        if self.input_username is None:
+            self.input_username = "unknown"
+
+        loop = asyncio.get_running_loop()
+        # loading the user's history hits the store, keep it off the event loop
+        self.emulated_shell = await loop.run_in_executor(
+            executor,
+            lambda: EmulatedShell(channel, self.session_id, self.client_ip, self.client_port, username=self.input_username, config=config, on_ready=self._on_shell_ready, on_input=self._on_input),
+        )
+        await self.emulated_shell.start_session_async(executor)
+
     def check_channel_request(self, kind: str, channelid: int) -> int:
         if kind == 'session':
+            self.mark_phase("channel_open")
             return paramiko.common.OPEN_SUCCEEDED
         return paramiko.common.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
 
     def check_auth_password(self, username, password):
         self.input_username = username
 
-        success = bool(re.match(self.password_regex, password))
+        success = self.authenticator.check(username, password)
+
+        if not success and self.failed_logins is not None:
+            # brute force hot path: only counted, logged later as part of a summary
+            self.failed_logins.record(self.session_id, self.client_ip, username, password)
+            return paramiko.common.AUTH_FAILED
 
         print(f"[CLIENT HANDLER] Login attempt: {username}:{password} from {self.client_ip} - {'SUCCESS' if success else 'FAILED'}")
 
         if success:
+            self.mark_phase("auth")
             log_event(
                 event_id="login_success",
                 session_id=self.session_id,
@@ -85,17 +179,19 @@ class ClientHandler(paramiko.ServerInterface):
 
     def check_channel_shell_request(self, channel):
         print(f"[CLIENT HANDLER] Shell request from {self.client_ip}:{self.client_port}")
+        self.mark_phase("shell_request")
         if self.event:
             self.event.set()
         return True
 
     def check_channel_pty_request(self, channel, term, width, height, pixelwidth, pixelheight, modes):
         print(f"[CLIENT HANDLER] PTY request received from {self.client_ip}:{self.client_port}")
+        self.pty_requested = True
         return True
 
     def check_channel_exec_request(self, channel, command):
         print(f"[CLIENT HANDLER] Exec request received from {self.client_ip}:{self.client_port}")
-        command = command.decode()
+        command = command.decode(errors="replace")
         log_event(
             event_id="command_exec",
             session_id=self.session_id,
@@ -103,26 +199,55 @@ class ClientHandler(paramiko.ServerInterface):
             src_port=self.client_port,
             command=command
         )
+        if self.event.is_set():
+            # only one shell or exec request per session
+            return False
+        self.exec_command = command
+        self.mark_phase("exec_request")
+        self.event.set()
         return True
 
 
-def client_handle(client, addr, config):
+CHANNEL_ACCEPT_TIMEOUT = 100
+
+
+def apply_handshake_timeout(transport: paramiko.Transport, timeout: float):
+    '''
+    bounds every phase before the shell starts, so stalled clients release their admission slot
+    '''
+    transport.banner_timeout = timeout
+    transport.handshake_timeout = timeout
+    transport.auth_timeout = timeout
+
+
+def client_handle(client, addr, config, ticket: Optional[AdmissionTicket] = None):
     client_ip, client_port = addr
     dst_ip, dst_port = client.getsockname()
   
     client_config = load_client_handler_config(config)
 
     transport = None
+    server = None
 
     try:
+        if ticket is not None:
+            if not ticket.admitted and not ticket.wait(ticket.controller.handshake_timeout):
+                print(f"[CLIENT HANDLER] No connection slot became free for {client_ip}:{client_port}.")
+                return
+            handshake_deadline = time.monotonic() + ticket.controller.handshake_timeout
 
         transport = paramiko.Transport(client)
+        if ticket is not None:
+            apply_handshake_timeout(transport, ticket.controller.handshake_timeout)
         transport.local_version = client_config["ssh_banner"]
         server = ClientHandler(client_ip, client_port, None, dst_ip, dst_port, config=client_config)
+        server.register_session(transport)
 
         transport.add_server_key(host_key)
 
+        # blocks until key exchange has finished
         transport.start_server(server=server)
+        server.mark_phase("handshake")
 
         server.client_version = transport.remote_version
         log_event(
@@ -133,27 +258,42 @@ def client_handle(client, addr, config):
             message=server.client_version,
         )
 
-        channel = transport.accept(100)
+        setup_deadline = handshake_deadline if ticket is not None else time.monotonic() + CHANNEL_ACCEPT_TIMEOUT
+
+        # channels can only be opened after authentication, so the username is known once this returns
+        channel = transport.accept(max(setup_deadline - time.monotonic(), 0))
 
         if channel is None:
             print(f"[CLIENT HANDLER] No channel was opened for {client_ip}.")
             return
 
-        print(f"[CLIENT HANDLER] Session started for {client_ip}:{client_port} with session ID: {server.session_id}")
+        # set by check_channel_shell_request or check_channel_exec_request
+        if not server.event.wait(max(setup_deadline - time.monotonic(), 0)):
+            print(f"[CLIENT HANDLER] No shell was requested by {client_ip}.")
+            return
 
-        while server.input_username is None:
-            time.sleep(0.1)
+        if ticket is not None:
+            ticket.handshake_done()
+        server.mark_ready()
 
-        channel.send(client_config["standard_banner"].encode())
+        if server.exec_command is not None:
+            server.run_exec(channel, config)
+            return
+
+        print(f"[CLIENT HANDLER] Session started for {client_ip}:{client_port} with session ID: {server.session_id}")
 
-        time.sleep(1)
+        channel.send(client_config["standard_banner"].encode())
 
         server.start_shell(channel, config=config)
 
     except Exception as e:
         print(f"[CLIENT HANDLER ERROR] {e}")
     finally:
+        if server is not None:
+            server.end_session()
         if transport:
             transport.close()
         client.close()
+        if ticket is not None:
+            ticket.release()
         print(f"[CLIENT HANDLER] Connection closed for {client_ip}:{client_port}.")
@@ -0,0 +1,163 @@
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+import paramiko
+
+from logger.logger import log_event
+from metrics.metrics import register_collector
+
+
+class SessionEntry:
+    def __init__(self, session_id: str, src_ip: str, src_port: int, transport: paramiko.Transport):
+        self.session_id = session_id
+        self.src_ip = src_ip
+        self.src_port = src_port
+        self.transport = transport
+        self.started_at = time.monotonic()
+        self.last_activity = self.started_at
+        # set once the shell or exec request has been served
+        self.ready = False
+
+    def touch(self):
+        self.last_activity = time.monotonic()
+
+    def mark_ready(self):
+        self.ready = True
+        self.touch()
+
+
+class SessionRegistry:
+    '''
+    keeps track of the live sessions of this process and reaps stale ones
+
+    A reaper thread closes the transport of sessions which did not finish the
+    handshake in time, were idle for too long or exceeded the maximum session
+    duration. Closing the transport ends the session's shell loop, which then
+    releases its thread (or task) and the session's memory.
+    '''
+
+    def __init__(self,
+                 idle_timeout: float = 600,
+                 max_session_duration: float = 3600,
+                 handshake_timeout: float = 30,
+                 reaper_interval: float = 5,
+                 ):
+        self.idle_timeout = idle_timeout
+        self.max_session_duration = max_session_duration
+        self.handshake_timeout = handshake_timeout
+        self.reaper_interval = reaper_interval
+
+        self._sessions: Dict[str, SessionEntry] = {}
+        self._lock = threading.Lock()
+
+        self.registered_total = 0
+        self.reaped_total = 0
+        self.reaped_by_reason: Counter = Counter()
+
+        self._thread = threading.Thread(target=self._reap_loop, name="session-reaper", daemon=True)
+        self._thread.start()
+
+    def register(self, session_id: str, src_ip: str, src_port: int, transport: paramiko.Transport) -> SessionEntry:
+        entry = SessionEntry(session_id, src_ip, src_port, transport)
+        with self._lock:
+            self._sessions[session_id] = entry
+            self.registered_total += 1
+        return entry
+
+    def unregister(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def reap(self) -> int:
+        '''
+        closes every stale session
+        :return: number of reaped sessions
+        '''
+        now = time.monotonic()
+        stale = []
+        with self._lock:
+            for entry in list(self._sessions.values()):
+                reason = self._stale_reason(entry, now)
+                if reason is not None:
+                    stale.append((entry, reason))
+                    del self._sessions[entry.session_id]
+                    self.reaped_total += 1
+                    self.reaped_by_reason[reason] += 1
+
+        for entry, reason in stale:
+            print(f"[CLIENT HANDLER] Reaping session {entry.session_id} of {entry.src_ip}:{entry.src_port} ({reason})")
+            try:
+                entry.transport.close()
+            except Exception as e:
+                print(f"[-] Failed to close transport of session {entry.session_id}: {e}")
+            log_event(
+                event_id="session_reaped",
+                session_id=entry.session_id,
+                src_ip=entry.src_ip,
+                src_port=entry.src_port,
+                details={
+                    "reason": reason,
+                    "duration": round(now - entry.started_at, 1),
+                    "idle": round(now - entry.last_activity, 1),
+                },
+            )
+        return len(stale)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "live": len(self._sessions),
+                "ready": sum(1 for entry in self._sessions.values() if entry.ready),
+                "registered": self.registered_total,
+                "reaped": self.reaped_total,
+                "reaped_by_reason": dict(self.reaped_by_reason),
+            }
+
+    def _stale_reason(self, entry: SessionEntry, now: float) -> Optional[str]:
+        if not entry.ready:
+            if now - entry.started_at > self.handshake_timeout:
+                return "handshake_timeout"
+            return None
+        if now - entry.started_at > self.max_session_duration:
+            return "session_timeout"
+        if now - entry.last_activity > self.idle_timeout:
+            return "idle_timeout"
+        return None
+
+    def _reap_loop(self):
+        while True:
+            time.sleep(self.reaper_interval)
+            try:
+                self.reap()
+            except Exception as e:
+                print(f"[-] Session reaper error: {e}")
+
+
+_registry: Optional[SessionRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def init_session_registry(server_config: dict) -> SessionRegistry:
+    '''
+    creates the process-wide registry used by the client handlers
+    :param server_config: configuration returned by load_server_config
+    '''
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            limits = server_config["session_limits"]
+            _registry = SessionRegistry(
+                idle_timeout=limits["idle_timeout"],
+                max_session_duration=limits["max_session_duration"],
+                # a little slack so the handshake deadline of the handler fires first
+                handshake_timeout=server_config["admission"]["handshake_timeout"] + limits["reaper_interval"],
+                reaper_interval=limits["reaper_interval"],
+            )
+            register_collector("sessions", _registry.stats)
+        return _registry
+
+
+def get_session_registry() -> Optional[SessionRegistry]:
+    return _registry
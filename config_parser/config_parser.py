@@ -17,6 +17,62 @@ DEFAULT_PASSWORD_REGEX = (
     "^(123456|root)$"
 )
 
+DEFAULT_FAILED_LOGIN_SCOPE = "session"
+DEFAULT_FAILED_LOGIN_FLUSH_INTERVAL = 60
+DEFAULT_FAILED_LOGIN_MAX_CREDENTIALS = 100
+
+DEFAULT_ASYNC_LLM_WORKERS = 32
+DEFAULT_LISTEN_BACKLOG = 128
+
+DEFAULT_MAX_CONNECTIONS = 1024
+DEFAULT_MAX_CONNECTIONS_PER_IP = 8
+DEFAULT_MAX_HANDSHAKES = 128
+DEFAULT_MAX_QUEUED_CONNECTIONS = 256
+DEFAULT_HANDSHAKE_TIMEOUT = 30
+DEFAULT_OVERLOAD_POLICY = "reject"
+DEFAULT_OVERLOAD_DELAY = 2
+DEFAULT_REJECTION_SUMMARY_INTERVAL = 60
+
+DEFAULT_IDLE_TIMEOUT = 600
+DEFAULT_MAX_SESSION_DURATION = 3600
+DEFAULT_REAPER_INTERVAL = 5
+
+DEFAULT_HOSTNAME = "ubuntu"
+DEFAULT_MAX_BATCH_SIZE = 20
+
+DEFAULT_LLM_CONNECT_TIMEOUT = 5
+DEFAULT_LLM_READ_TIMEOUT = 60
+DEFAULT_LLM_POOL_SIZE = 20
+DEFAULT_LLM_MAX_RETRIES = 2
+DEFAULT_LLM_RETRY_BACKOFF = 0.5
+
+DEFAULT_RESPONSE_CACHE_MAX_ENTRIES = 1024
+DEFAULT_RESPONSE_CACHE_TTL = 600
+
+DEFAULT_RESPONSE_CORPUS_PATH = "store/response_corpus.db"
+
+DEFAULT_PROMPT_MAX_TOKENS = 8000
+DEFAULT_PROMPT_MAX_TURNS = 100
+
+DEFAULT_SESSION_HISTORY_MAX_BYTES = 256 * 1024
+
+DEFAULT_RATE_LIMIT_MAX_QUEUED = 256
+DEFAULT_RATE_LIMIT_MAX_WAIT = 30
+
+DEFAULT_OVERLOAD_MAX_QUEUE_DEPTH = 32
+DEFAULT_OVERLOAD_MAX_LATENCY = 15
+DEFAULT_OVERLOAD_RECOVER_RATIO = 0.5
+DEFAULT_OVERLOAD_PROBE_INTERVAL = 5
+
+DEFAULT_ROUTING_FAILURE_THRESHOLD = 3
+DEFAULT_ROUTING_COOLDOWN = 30
+DEFAULT_ROUTING_EWMA_ALPHA = 0.3
+DEFAULT_HEDGE_PERCENTILE = 0.95
+DEFAULT_HEDGE_MIN_SAMPLES = 20
+DEFAULT_HEDGE_MAX_WORKERS = 32
+
+LLM_PROVIDERS = ["openai", "deepseek", "grok", "ollama"]
+
 schema = {
     "client_handler_config": {
         "type": "dict",
@@ -31,6 +87,17 @@ schema = {
                     "password_regex": {"type": "string", "required": False},
                 },
             },
+            "failed_login_aggregation": {
+                "type": "dict",
+                "required": False,
+                "nullable": True,
+                "schema": {
+                    "enabled": {"type": "boolean", "required": False},
+                    "scope": {"type": "string", "required": False, "allowed": ["session", "ip"]},
+                    "flush_interval": {"type": "number", "required": False, "min": 1},
+                    "max_credentials": {"type": "integer", "required": False, "min": 1},
+                },
+            },
             },
     },
     "llm_config": {
@@ -38,9 +105,149 @@ schema = {
         "required": True,
         "schema": {
             "llmCustomSysPrompt": {"type": "string", "required": False, "nullable": True},
-            "llmProvider": {"type": "string", "required": True, "allowed": ["openai", "deepseek", "grok", "ollama"]},
+            "llmProvider": {"type": "string", "required": True, "allowed": LLM_PROVIDERS},
             "llmModel": {"type": "string", "required": True},
             "apiSecretKey": {"type": "string", "required": False, "nullable": True},
+            "connectTimeout": {"type": "number", "required": False, "nullable": True, "min": 0},
+            "readTimeout": {"type": "number", "required": False, "nullable": True, "min": 0},
+            "poolSize": {"type": "integer", "required": False, "nullable": True, "min": 1},
+            "maxRetries": {"type": "integer", "required": False, "nullable": True, "min": 0},
+            "retryBackoff": {"type": "number", "required": False, "nullable": True, "min": 0},
+            "stream": {"type": "boolean", "required": False, "nullable": True},
+            "coalesceRequests": {"type": "boolean", "required": False, "nullable": True},
+            "sessionHistoryMaxBytes": {"type": "integer", "required": False, "nullable": True, "min": 1024},
+            "responseCache": {
+                "type": "dict",
+                "required": False,
+                "nullable": True,
+                "schema": {
+                    "enabled": {"type": "boolean", "required": False},
+                    "maxEntries": {"type": "integer", "required": False, "min": 1},
+                    "ttlSeconds": {"type": "number", "required": False, "min": 0},
+                },
+            },
+            "responseCorpus": {
+                "type": "dict",
+                "required": False,
+                "nullable": True,
+                "schema": {
+                    "enabled": {"type": "boolean", "required": False},
+                    "path": {"type": "string", "required": False},
+                },
+            },
+            "promptBudget": {
+                "type": "dict",
+                "required": False,
+                "nullable": True,
+                "schema": {
+                    "maxTokens": {"type": "integer", "required": False, "min": 1},
+                    "maxTurns": {"type": "integer", "required": False, "min": 0},
+                    "summarize": {"type": "boolean", "required": False},
+                },
+            },
+            "rateLimit": {
+                "type": "dict",
+                "required": False,
+                "nullable": True,
+                "schema": {
+                    "requestsPerSecond": {"type": "number", "required": False, "nullable": True, "min": 0},
+                    "burst": {"type": "integer", "required": False, "nullable": True, "min": 1},
+                    "tokensPerMinute": {"type": "integer", "required": False, "nullable": True, "min": 1},
+                    "maxQueued": {"type": "integer", "required": False, "min": 0},
+                    "maxWaitSeconds": {"type": "number", "required": False, "min": 0},
+                },
+            },
+            "overload": {
+                "type": "dict",
+                "required": False,
+                "nullable": True,
+                "schema": {
+                    "enabled": {"type": "boolean", "required": False},
+                    "maxQueueDepth": {"type": "integer", "required": False, "min": 1},
+                    "maxLatencySeconds": {"type": "number", "required": False, "min": 0.1},
+                    "recoverRatio": {"type": "number", "required": False, "min": 0, "max": 1},
+                    "probeIntervalSeconds": {"type": "number", "required": False, "min": 0},
+                },
+            },
+            "fallbackProviders": {
+                "type": "list",
+                "required": False,
+                "nullable": True,
+                "schema": {
+                    "type": "dict",
+                    "schema": {
+                        "llmProvider": {"type": "string", "required": True, "allowed": LLM_PROVIDERS},
+                        "llmModel": {"type": "string", "required": True},
+                        "apiSecretKey": {"type": "string", "required": False, "nullable": True},
+                    },
+                },
+            },
+            "routing": {
+                "type": "dict",
+                "required": False,
+                "nullable": True,
+                "schema": {
+                    "failureThreshold": {"type": "integer", "required": False, "min": 1},
+                    "cooldownSeconds": {"type": "number", "required": False, "min": 0},
+                    "ewmaAlpha": {"type": "number", "required": False, "min": 0.01, "max": 1},
+                    "hedging": {
+                        "type": "dict",
+                        "required": False,
+                        "nullable": True,
+                        "schema": {
+                            "enabled": {"type": "boolean", "required": False},
+                            "percentile": {"type": "number", "required": False, "min": 0.5, "max": 0.999},
+                            "minSamples": {"type": "integer", "required": False, "min": 1},
+                            "maxWorkers": {"type": "integer", "required": False, "min": 1},
+                        },
+                    },
+                },
+            },
+        },
+    },
+    "shell_config": {
+        "type": "dict",
+        "required": False,
+        "nullable": True,
+        "schema": {
+            "builtin_commands": {"type": "boolean", "required": False, "nullable": True},
+            "hostname": {"type": "string", "required": False, "nullable": True},
+            "paste_batching": {"type": "boolean", "required": False, "nullable": True},
+            "max_batch_size": {"type": "integer", "required": False, "nullable": True, "min": 2},
+        },
+    },
+    "server_config": {
+        "type": "dict",
+        "required": False,
+        "nullable": True,
+        "schema": {
+            "async_llm_workers": {"type": "integer", "required": False, "nullable": True, "min": 1},
+            "listen_backlog": {"type": "integer", "required": False, "nullable": True, "min": 1},
+            "admission": {
+                "type": "dict",
+                "required": False,
+                "nullable": True,
+                "schema": {
+                    "max_connections": {"type": "integer", "required": False, "min": 1},
+                    "max_connections_per_ip": {"type": "integer", "required": False, "min": 1},
+                    "max_handshakes": {"type": "integer", "required": False, "min": 1},
+                    "max_queued_connections": {"type": "integer", "required": False, "min": 0},
+                    "handshake_timeout": {"type": "number", "required": False, "min": 1},
+                    "overload_policy": {"type": "string", "required": False, "allowed": ["reject", "delay", "queue"]},
+                    "overload_delay": {"type": "number", "required": False, "min": 0},
+                    "rejection_summary_interval": {"type": "number", "required": False, "min": 1},
+                },
+            },
+            "session_limits": {
+                "type": "dict",
+                "required": False,
+                "nullable": True,
+                "schema": {
+                    "idle_timeout": {"type": "number", "required": False, "min": 1},
+                    "max_session_duration": {"type": "number", "required": False, "min": 1},
+                    "reaper_interval": {"type": "number", "required": False, "min": 0.1},
+                },
+            },
         },
     },
 }
@@ -58,6 +265,11 @@ def load_config_file(config_path):
 
     return config
 
+def _get_or_default(section, key, default):
+    value = section.get(key)
+    return default if value is None else value
+
+
 def load_llm_config(config):
     llm_config = config["llm_config"]
 
@@ -65,11 +277,96 @@ def load_llm_config(config):
     llm_model_env = os.getenv("LLM_MODEL", "").strip()
     api_key_env = os.getenv("API_SECRET_KEY", "").strip()
 
-    return {
+    primary = {
         "llm_provider": (llm_provider_env or llm_config.get("llmProvider", "openai")).lower(),
         "llm_model": llm_model_env or llm_config.get("llmModel"),
         "api_key": api_key_env or llm_config.get("apiSecretKey"),
+    }
+    fallbacks = [
+        {
+            "llm_provider": fallback["llmProvider"].lower(),
+            "llm_model": fallback["llmModel"],
+            "api_key": fallback.get("apiSecretKey"),
+        }
+        for fallback in llm_config.get("fallbackProviders") or []
+    ]
+
+    return {
+        **primary,
+        "providers": [primary] + fallbacks,
+        "routing": _load_routing_config(llm_config.get("routing") or {}),
+        "rate_limit": _load_rate_limit_config(llm_config.get("rateLimit") or {}),
+        "overload": _load_overload_config(llm_config.get("overload") or {}),
         "system_prompt": llm_config.get("llmCustomSysPrompt") or LLM_DEFAULT_SYS_PROMPT,
+        "connect_timeout": _get_or_default(llm_config, "connectTimeout", DEFAULT_LLM_CONNECT_TIMEOUT),
+        "read_timeout": _get_or_default(llm_config, "readTimeout", DEFAULT_LLM_READ_TIMEOUT),
+        "pool_size": llm_config.get("poolSize") or DEFAULT_LLM_POOL_SIZE,
+        "max_retries": _get_or_default(llm_config, "maxRetries", DEFAULT_LLM_MAX_RETRIES),
+        "retry_backoff": _get_or_default(llm_config, "retryBackoff", DEFAULT_LLM_RETRY_BACKOFF),
+        "stream": bool(llm_config.get("stream")),
+        "coalesce_requests": _get_or_default(llm_config, "coalesceRequests", True),
+        "session_history_max_bytes": _get_or_default(llm_config, "sessionHistoryMaxBytes", DEFAULT_SESSION_HISTORY_MAX_BYTES),
+        "response_cache": _load_response_cache_config(llm_config.get("responseCache") or {}),
+        "response_corpus": _load_response_corpus_config(llm_config.get("responseCorpus") or {}),
+        "prompt_budget": _load_prompt_budget_config(llm_config.get("promptBudget") or {}),
+    }
+
+
+def _load_response_cache_config(cache_config):
+    return {
+        "enabled": bool(cache_config.get("enabled")),
+        "max_entries": cache_config.get("maxEntries") or DEFAULT_RESPONSE_CACHE_MAX_ENTRIES,
+        "ttl": _get_or_default(cache_config, "ttlSeconds", DEFAULT_RESPONSE_CACHE_TTL),
+    }
+
+
+def _load_rate_limit_config(rate_limit_config):
+    return {
+        "requests_per_second": rate_limit_config.get("requestsPerSecond"),
+        "burst": rate_limit_config.get("burst"),
+        "tokens_per_minute": rate_limit_config.get("tokensPerMinute"),
+        "max_queued": _get_or_default(rate_limit_config, "maxQueued", DEFAULT_RATE_LIMIT_MAX_QUEUED),
+        "max_wait": _get_or_default(rate_limit_config, "maxWaitSeconds", DEFAULT_RATE_LIMIT_MAX_WAIT),
+    }
+
+
+def _load_overload_config(overload_config):
+    return {
+        "enabled": bool(overload_config.get("enabled")),
+        "max_queue_depth": overload_config.get("maxQueueDepth") or DEFAULT_OVERLOAD_MAX_QUEUE_DEPTH,
+        "max_latency": overload_config.get("maxLatencySeconds") or DEFAULT_OVERLOAD_MAX_LATENCY,
+        "recover_ratio": _get_or_default(overload_config, "recoverRatio", DEFAULT_OVERLOAD_RECOVER_RATIO),
+        "probe_interval": _get_or_default(overload_config, "probeIntervalSeconds", DEFAULT_OVERLOAD_PROBE_INTERVAL),
+    }
+
+
+def _load_routing_config(routing_config):
+    hedging = routing_config.get("hedging") or {}
+    return {
+        "failure_threshold": routing_config.get("failureThreshold") or DEFAULT_ROUTING_FAILURE_THRESHOLD,
+        "cooldown": _get_or_default(routing_config, "cooldownSeconds", DEFAULT_ROUTING_COOLDOWN),
+        "ewma_alpha": routing_config.get("ewmaAlpha") or DEFAULT_ROUTING_EWMA_ALPHA,
+        "hedging": {
+            "enabled": bool(hedging.get("enabled")),
+            "percentile": hedging.get("percentile") or DEFAULT_HEDGE_PERCENTILE,
+            "min_samples": hedging.get("minSamples") or DEFAULT_HEDGE_MIN_SAMPLES,
+            "max_workers": hedging.get("maxWorkers") or DEFAULT_HEDGE_MAX_WORKERS,
+        },
+    }
+
+
+def _load_response_corpus_config(corpus_config):
+    return {
+        "enabled": bool(corpus_config.get("enabled")),
+        "path": corpus_config.get("path") or DEFAULT_RESPONSE_CORPUS_PATH,
+    }
+
+
+def _load_prompt_budget_config(budget_config):
+    return {
+        "max_tokens": budget_config.get("maxTokens") or DEFAULT_PROMPT_MAX_TOKENS,
+        "max_turns": _get_or_default(budget_config, "maxTurns", DEFAULT_PROMPT_MAX_TURNS),
+        "summarize": _get_or_default(budget_config, "summarize", True),
     }
 
 
@@ -79,6 +376,57 @@ def load_client_handler_config(config):
         "ssh_banner": client_handler_config.get("ssh_banner") or DEFAULT_SSH_BANNER,
         "standard_banner": client_handler_config.get("standard_banner") or DEFAULT_STANDARD_BANNER,
         "password_regex": client_handler_config.get("authentication").get("password_regex") or DEFAULT_PASSWORD_REGEX,
+        "failed_login_aggregation": _load_failed_login_aggregation_config(
+            client_handler_config.get("failed_login_aggregation") or {}
+        ),
     }
 
 
+def _load_failed_login_aggregation_config(aggregation_config):
+    return {
+        "enabled": _get_or_default(aggregation_config, "enabled", False),
+        "scope": _get_or_default(aggregation_config, "scope", DEFAULT_FAILED_LOGIN_SCOPE),
+        "flush_interval": _get_or_default(aggregation_config, "flush_interval", DEFAULT_FAILED_LOGIN_FLUSH_INTERVAL),
+        "max_credentials": _get_or_default(aggregation_config, "max_credentials", DEFAULT_FAILED_LOGIN_MAX_CREDENTIALS),
+    }
+
+
+def load_shell_config(config):
+    shell_config = config.get("shell_config") or {}
+    return {
+        "builtin_commands": _get_or_default(shell_config, "builtin_commands", True),
+        "hostname": shell_config.get("hostname") or DEFAULT_HOSTNAME,
+        "paste_batching": _get_or_default(shell_config, "paste_batching", True),
+        "max_batch_size": shell_config.get("max_batch_size") or DEFAULT_MAX_BATCH_SIZE,
+    }
+
+
+def load_server_config(config):
+    server_config = config.get("server_config") or {}
+    return {
+        "async_llm_workers": server_config.get("async_llm_workers") or DEFAULT_ASYNC_LLM_WORKERS,
+        "listen_backlog": server_config.get("listen_backlog") or DEFAULT_LISTEN_BACKLOG,
+        "admission": _load_admission_config(server_config.get("admission") or {}),
+        "session_limits": _load_session_limits_config(server_config.get("session_limits") or {}),
+    }
+
+
+def _load_session_limits_config(limits_config):
+    return {
+        "idle_timeout": _get_or_default(limits_config, "idle_timeout", DEFAULT_IDLE_TIMEOUT),
+        "max_session_duration": _get_or_default(limits_config, "max_session_duration", DEFAULT_MAX_SESSION_DURATION),
+        "reaper_interval": _get_or_default(limits_config, "reaper_interval", DEFAULT_REAPER_INTERVAL),
+    }
+
+
+def _load_admission_config(admission_config):
+    return {
+        "max_connections": _get_or_default(admission_config, "max_connections", DEFAULT_MAX_CONNECTIONS),
+        "max_connections_per_ip": _get_or_default(admission_config, "max_connections_per_ip", DEFAULT_MAX_CONNECTIONS_PER_IP),
+        "max_handshakes": _get_or_default(admission_config, "max_handshakes", DEFAULT_MAX_HANDSHAKES),
+        "max_queued_connections": _get_or_default(admission_config, "max_queued_connections", DEFAULT_MAX_QUEUED_CONNECTIONS),
+        "handshake_timeout": _get_or_default(admission_config, "handshake_timeout", DEFAULT_HANDSHAKE_TIMEOUT),
+        "overload_policy": _get_or_default(admission_config, "overload_policy", DEFAULT_OVERLOAD_POLICY),
+        "overload_delay": _get_or_default(admission_config, "overload_delay", DEFAULT_OVERLOAD_DELAY),
+        "rejection_summary_interval": _get_or_default(admission_config, "rejection_summary_interval", DEFAULT_REJECTION_SUMMARY_INTERVAL),
+    }
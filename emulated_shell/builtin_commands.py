@@ -0,0 +1,535 @@
+import posixpath
+import re
+import shlex
+from typing import Dict, List, Optional, Set
+
+from LLM.LLM_integration import PROMPT_REGEX
+
+KERNEL_RELEASE = "6.8.0-1027-generic"
+KERNEL_VERSION = "#27-Ubuntu SMP PREEMPT_DYNAMIC Tue Apr  8 19:23:54 UTC 2025"
+MACHINE = "x86_64"
+
+HOME_ENTRIES = ["Desktop", "Documents", "Downloads", "Music", "Pictures", "Public", "Templates", "Videos"]
+HOME_DOTFILES = {
+    ".bash_logout": "# ~/.bash_logout: executed by bash(1) when login shell exits.\n",
+    ".bashrc": "# ~/.bashrc: executed by bash(1) for non-login shells.\n",
+    ".profile": "# ~/.profile: executed by the command interpreter for login shells.\n",
+}
+ROOT_ENTRIES = [
+    "bin", "boot", "dev", "etc", "home", "lib", "lib64", "lost+found", "media", "mnt", "opt",
+    "proc", "root", "run", "sbin", "snap", "srv", "sys", "tmp", "usr", "var",
+]
+
+# shell syntax the fast path does not interpret; such commands go to the LLM
+REDIRECTING_COMMANDS = {"echo"}
+UNSUPPORTED_SYNTAX = re.compile(r"[|;&`<(){}*?\[\]\\]|\$\(")
+BRACED_VARIABLE_REGEX = re.compile(r"\$\{\w+\}")
+VARIABLE_REGEX = re.compile(r"\$(\w+|\{\w+\})")
+
+
+class VirtualFilesystem:
+    '''
+    minimal in-memory filesystem backing the built-in commands of one session;
+    directories in `complete_dirs` have fully known contents, anything else is
+    left for the LLM to make up
+    '''
+
+    def __init__(self, username: str, hostname: str, home: str):
+        self.dirs: Set[str] = {"/"}
+        self.files: Dict[str, Optional[str]] = {}
+        self.complete_dirs: Set[str] = {"/", "/home", "/tmp", home}
+
+        for entry in ROOT_ENTRIES:
+            self.add_dir("/" + entry)
+        self.add_dir(home)
+        for entry in HOME_ENTRIES:
+            self.add_dir(posixpath.join(home, entry))
+            self.complete_dirs.add(posixpath.join(home, entry))
+        for name, content in HOME_DOTFILES.items():
+            self.files[posixpath.join(home, name)] = content
+
+        self.files.update({
+            "/etc/hostname": f"{hostname}\n",
+            "/etc/issue": "Ubuntu 24.04.2 LTS \\n \\l\n\n",
+            "/etc/os-release": (
+                'PRETTY_NAME="Ubuntu 24.04.2 LTS"\nNAME="Ubuntu"\nVERSION_ID="24.04"\n'
+                'VERSION="24.04.2 LTS (Noble Numbat)"\nVERSION_CODENAME=noble\nID=ubuntu\nID_LIKE=debian\n'
+                'HOME_URL="https://www.ubuntu.com/"\nSUPPORT_URL="https://help.ubuntu.com/"\n'
+                'BUG_REPORT_URL="https://bugs.launchpad.net/ubuntu/"\nUBUNTU_CODENAME=noble\n'
+            ),
+            "/etc/shells": "# /etc/shells: valid login shells\n/bin/sh\n/bin/bash\n/usr/bin/bash\n/bin/dash\n/usr/bin/dash\n",
+            "/etc/passwd": self._passwd(username, home),
+            "/proc/version": (
+                f"Linux version {KERNEL_RELEASE} (buildd@lcy02-amd64-100) (x86_64-linux-gnu-gcc-13 "
+                f"(Ubuntu 13.3.0-6ubuntu2~24.04) 13.3.0, GNU ld (GNU Binutils for Ubuntu) 2.42) {KERNEL_VERSION}\n"
+            ),
+        })
+
+    @staticmethod
+    def _passwd(username: str, home: str) -> str:
+        lines = [
+            "root:x:0:0:root:/root:/bin/bash",
+            "daemon:x:1:1:daemon:/usr/sbin:/usr/sbin/nologin",
+            "bin:x:2:2:bin:/bin:/usr/sbin/nologin",
+            "sys:x:3:3:sys:/dev:/usr/sbin/nologin",
+            "sync:x:4:65534:sync:/bin:/bin/sync",
+            "games:x:5:60:games:/usr/games:/usr/sbin/nologin",
+            "man:x:6:12:man:/var/cache/man:/usr/sbin/nologin",
+            "lp:x:7:7:lp:/var/spool/lpd:/usr/sbin/nologin",
+            "mail:x:8:8:mail:/var/mail:/usr/sbin/nologin",
+            "news:x:9:9:news:/var/spool/news:/usr/sbin/nologin",
+            "uucp:x:10:10:uucp:/var/spool/uucp:/usr/sbin/nologin",
+            "proxy:x:13:13:proxy:/bin:/usr/sbin/nologin",
+            "www-data:x:33:33:www-data:/var/www:/usr/sbin/nologin",
+            "backup:x:34:34:backup:/var/backups:/usr/sbin/nologin",
+            "list:x:38:38:Mailing List Manager:/var/list:/usr/sbin/nologin",
+            "irc:x:39:39:ircd:/run/ircd:/usr/sbin/nologin",
+            "_apt:x:42:65534::/nonexistent:/usr/sbin/nologin",
+            "nobody:x:65534:65534:nobody:/nonexistent:/usr/sbin/nologin",
+            "systemd-network:x:998:998:systemd Network Management:/:/usr/sbin/nologin",
+            "systemd-timesync:x:996:996:systemd Time Synchronization:/:/usr/sbin/nologin",
+            "messagebus:x:101:102::/nonexistent:/usr/sbin/nologin",
+            "systemd-resolve:x:992:992:systemd Resolver:/:/usr/sbin/nologin",
+            "sshd:x:106:65534::/run/sshd:/usr/sbin/nologin",
+        ]
+        if username != "root":
+            lines.append(f"{username}:x:1000:1000:{username}:{home}:/bin/bash")
+        return "\n".join(lines) + "\n"
+
+    def add_dir(self, path: str):
+        while path not in self.dirs:
+            self.dirs.add(path)
+            path = posixpath.dirname(path)
+
+    def is_dir(self, path: str) -> bool:
+        return path in self.dirs
+
+    def is_file(self, path: str) -> bool:
+        return path in self.files
+
+    def is_known_missing(self, path: str) -> bool:
+        '''
+        true if the path certainly does not exist, i.e. its parent's contents are fully known
+        '''
+        return not self.is_dir(path) and not self.is_file(path) and posixpath.dirname(path) in self.complete_dirs
+
+    def list_dir(self, path: str) -> List[str]:
+        prefix = path.rstrip("/") + "/"
+        entries = {
+            entry[len(prefix):] for entry in list(self.dirs) + list(self.files)
+            if entry.startswith(prefix) and entry != path and "/" not in entry[len(prefix):]
+        }
+        return sorted(entries, key=lambda name: name.lstrip(".").lower())
+
+    def write_file(self, path: str, content: Optional[str], append: bool = False):
+        if append and self.files.get(path) is not None:
+            content = self.files[path] + (content or "")
+        self.files[path] = content
+        self.add_dir(posixpath.dirname(path))
+
+    def remove(self, path: str):
+        self.files.pop(path, None)
+        prefix = path.rstrip("/") + "/"
+        self.dirs = {entry for entry in self.dirs if entry != path and not entry.startswith(prefix)}
+        self.files = {entry: content for entry, content in self.files.items() if not entry.startswith(prefix)}
+
+
+class BuiltinCommands:
+    '''
+    answers common deterministic commands locally so they never reach the LLM;
+    run() returns None for anything it does not handle
+    '''
+
+    def __init__(self, username: str, ssh_server_ip: str, hostname: str):
+        self.username = username
+        self.ssh_server_ip = ssh_server_ip
+        self.hostname = hostname
+        self.home = "/root" if username == "root" else f"/home/{username}"
+        self.cwd = self.home
+        self.vfs = VirtualFilesystem(username, hostname, self.home)
+        self.env: Dict[str, str] = {
+            "HOME": self.home,
+            "USER": username,
+            "LOGNAME": username,
+            "SHELL": "/bin/bash",
+            "PATH": "/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin:/usr/games:/usr/local/games:/snap/bin",
+            "LANG": "C.UTF-8",
+            "TERM": "xterm-256color",
+        }
+
+        self._handlers = {
+            "pwd": self._pwd,
+            "whoami": self._whoami,
+            "id": self._id,
+            "hostname": self._hostname,
+            "uname": self._uname,
+            "echo": self._echo,
+            "cd": self._cd,
+            "ls": self._ls,
+            "cat": self._cat,
+            "export": self._export,
+            "printenv": self._printenv,
+            "env": self._printenv,
+            "touch": self._touch,
+            "mkdir": self._mkdir,
+            "rm": self._rm,
+        }
+
+    def prompt(self) -> str:
+        return f"{self.username}@{self.ssh_server_ip}:{self._display_path(self.cwd)}$ "
+
+    def run(self, command: str) -> Optional[str]:
+        '''
+        :return: output followed by the next prompt, formatted like an LLM response, or None to fall back to the LLM
+        '''
+        command = command.strip()
+        if not command:
+            return self.prompt()
+
+        if self._unsupported(command):
+            return None
+
+        args = self._split(self._expand_variables(command))
+        if args is None:
+            return None
+        if not args:
+            return self.prompt()
+
+        if self._is_assignment(args):
+            return self._export(args)
+
+        handler = self._handlers.get(args[0])
+        if handler is None or self._unsupported_redirect(args):
+            return None
+
+        output = handler(args)
+        if output is None:
+            return None
+        if output:
+            return output.replace("\n", "\r\n").rstrip("\r\n") + "\r\n" + self.prompt()
+        return self.prompt()
+
+    def handles(self, command: str) -> bool:
+        '''
+        tells, without running it, whether run() takes the command on; run()
+        may still fall back to the LLM, e.g. for files it does not know
+        '''
+        command = command.strip()
+        if not command:
+            return True
+        if self._unsupported(command):
+            return False
+        args = self._split(command)
+        if args is None:
+            return False
+        if not args or self._is_assignment(args):
+            return True
+        return args[0] in self._handlers and not self._unsupported_redirect(args)
+
+    @staticmethod
+    def _unsupported(command: str) -> bool:
+        # ${VAR} is the only use of braces expanded here
+        return UNSUPPORTED_SYNTAX.search(BRACED_VARIABLE_REGEX.sub("", command)) is not None
+
+    @staticmethod
+    def _unsupported_redirect(args: List[str]) -> bool:
+        # only echo writes redirected output; elsewhere a '>' would be taken for a file name
+        return args[0] not in REDIRECTING_COMMANDS and any(">" in arg for arg in args[1:])
+
+    @staticmethod
+    def _split(command: str) -> Optional[List[str]]:
+        try:
+            return shlex.split(command)
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _is_assignment(args: List[str]) -> bool:
+        return "=" in args[0] and len(args) == 1 and re.match(r"^\w+=", args[0]) is not None
+
+    def observe(self, command: str, response: str):
+        '''
+        keeps the session state in line with a command answered by the LLM
+        '''
+        match = PROMPT_REGEX.search(response)
+        if match:
+            directory = match.group(1) or "~"
+            path = self._resolve(directory)
+            if path != self.cwd:
+                self.vfs.add_dir(path)
+                self.cwd = path
+
+        try:
+            args = shlex.split(command)
+        except ValueError:
+            return
+        if not args or args[0] not in ("wget", "curl"):
+            return
+
+        # remember downloaded files so later ls/cat stay consistent; contents stay unknown
+        value_flags = ("-O", "--output-document") if args[0] == "wget" else ("-o", "--output")
+        target = None
+        for i, arg in enumerate(args[:-1]):
+            if arg in value_flags:
+                target = args[i + 1]
+        if target is None and (args[0] == "wget" or "-O" in args or "--remote-name" in args):
+            urls = [arg for arg in args[1:] if not arg.startswith("-") and ("/" in arg or "." in arg)]
+            if urls:
+                target = posixpath.basename(urls[-1].split("?")[0].rstrip("/")) or "index.html"
+        if target and target != "-":
+            self.vfs.write_file(self._resolve(target), None)
+
+    def _display_path(self, path: str) -> str:
+        if path == self.home:
+            return "~"
+        if path.startswith(self.home + "/"):
+            return "~" + path[len(self.home):]
+        return path
+
+    def _resolve(self, path: str) -> str:
+        if path == "~" or path.startswith("~/"):
+            path = self.home + path[1:]
+        return posixpath.normpath(posixpath.join(self.cwd, path))
+
+    def _expand_variables(self, command: str) -> str:
+        '''
+        expands $VAR and ${VAR} outside single quotes
+        '''
+        parts = re.split(r"('[^']*')", command)
+        for i, part in enumerate(parts):
+            if not part.startswith("'"):
+                parts[i] = VARIABLE_REGEX.sub(lambda m: self._variable(m.group(1).strip("{}")), part)
+        return "".join(parts)
+
+    def _variable(self, name: str) -> str:
+        if name == "PWD":
+            return self.cwd
+        return self.env.get(name, "")
+
+    def _pwd(self, args):
+        return self.cwd if len(args) == 1 else None
+
+    def _whoami(self, args):
+        return self.username if len(args) == 1 else None
+
+    def _hostname(self, args):
+        return self.hostname if len(args) == 1 else None
+
+    def _id(self, args):
+        if len(args) != 1:
+            return None
+        if self.username == "root":
+            return "uid=0(root) gid=0(root) groups=0(root)"
+        user = self.username
+        return f"uid=1000({user}) gid=1000({user}) groups=1000({user}),4(adm),24(cdrom),27(sudo),30(dip),46(plugdev),110(lxd)"
+
+    def _uname(self, args):
+        fields = {
+            "s": "Linux",
+            "n": self.hostname,
+            "r": KERNEL_RELEASE,
+            "v": KERNEL_VERSION,
+            "m": MACHINE,
+            "p": MACHINE,
+            "i": MACHINE,
+            "o": "GNU/Linux",
+        }
+        selected = set()
+        for arg in args[1:]:
+            if arg == "--all" or arg == "-a":
+                selected.update(fields)
+            elif re.match(r"^-[snrvmpio]+$", arg):
+                selected.update(arg[1:])
+            else:
+                return None
+        if not selected:
+            selected.add("s")
+        return " ".join(fields[key] for key in "snrvmpio" if key in selected)
+
+    def _echo(self, args):
+        args = args[1:]
+        newline = True
+        if args and args[0] == "-n":
+            newline = False
+            args = args[1:]
+        if args and args[0].startswith("-") and args[0] != "-":
+            return None
+
+        redirect = None
+        for operator in (">>", ">"):
+            if operator in args:
+                index = args.index(operator)
+                if index != len(args) - 2:
+                    return None
+                redirect = (operator, args[-1])
+                args = args[:index]
+                break
+        if any(">" in arg for arg in args):
+            return None
+
+        text = " ".join(args) + ("\n" if newline else "")
+        if redirect is None:
+            return text
+
+        operator, target = redirect
+        path = self._resolve(target)
+        if self.vfs.is_dir(path):
+            return f"-bash: {target}: Is a directory"
+        if not self.vfs.is_dir(posixpath.dirname(path)):
+            if self.vfs.is_known_missing(posixpath.dirname(path)):
+                return f"-bash: {target}: No such file or directory"
+            return None
+        self.vfs.write_file(path, text, append=operator == ">>")
+        return ""
+
+    def _cd(self, args):
+        if len(args) > 2:
+            return "-bash: cd: too many arguments"
+
+        target = args[1] if len(args) == 2 else "~"
+        if target == "-":
+            target = self.env.get("OLDPWD")
+            if target is None:
+                return "-bash: cd: OLDPWD not set"
+
+        path = self._resolve(target)
+        if self.vfs.is_dir(path):
+            self.env["OLDPWD"] = self.cwd
+            self.cwd = path
+            return ""
+        if self.vfs.is_file(path):
+            return f"-bash: cd: {target}: Not a directory"
+        if self.vfs.is_known_missing(path):
+            return f"-bash: cd: {target}: No such file or directory"
+        return None
+
+    def _ls(self, args):
+        show_hidden = False
+        targets = []
+        for arg in args[1:]:
+            if arg in ("-a", "-A", "--all", "--almost-all"):
+                show_hidden = True
+            elif arg.startswith("-"):
+                return None
+            else:
+                targets.append(arg)
+
+        if len(targets) > 1:
+            return None
+
+        target = targets[0] if targets else "."
+        path = self._resolve(target)
+        if self.vfs.is_file(path):
+            return target
+        if self.vfs.is_known_missing(path):
+            return f"ls: cannot access '{target}': No such file or directory"
+        if path not in self.vfs.complete_dirs:
+            return None
+
+        entries = self.vfs.list_dir(path)
+        if not show_hidden:
+            entries = [entry for entry in entries if not entry.startswith(".")]
+        elif "-A" not in args and "--almost-all" not in args:
+            entries = [".", ".."] + entries
+        return "  ".join(entries)
+
+    def _cat(self, args):
+        if len(args) < 2 or any(arg.startswith("-") for arg in args[1:]):
+            return None
+
+        outputs = []
+        for target in args[1:]:
+            path = self._resolve(target)
+            if self.vfs.is_dir(path):
+                outputs.append(f"cat: {target}: Is a directory\n")
+            elif self.vfs.is_file(path):
+                content = self.vfs.files[path]
+                if content is None:
+                    return None
+                outputs.append(content)
+            elif self.vfs.is_known_missing(path):
+                outputs.append(f"cat: {target}: No such file or directory\n")
+            else:
+                return None
+        return "".join(outputs)
+
+    def _export(self, args):
+        assignments = args[1:] if args[0] == "export" else args
+        for assignment in assignments:
+            name, sep, value = assignment.partition("=")
+            if not re.match(r"^\w+$", name):
+                return f"-bash: export: `{assignment}': not a valid identifier"
+            if sep:
+                self.env[name] = value
+        return ""
+
+    def _printenv(self, args):
+        if len(args) == 1:
+            env = dict(self.env, PWD=self.cwd)
+            return "\n".join(f"{name}={value}" for name, value in sorted(env.items()))
+        if args[0] == "printenv" and len(args) == 2:
+            return self._variable(args[1])
+        return None
+
+    def _touch(self, args):
+        targets = args[1:]
+        if not targets or any(arg.startswith("-") for arg in targets):
+            return None
+        for target in targets:
+            path = self._resolve(target)
+            if not self.vfs.is_dir(posixpath.dirname(path)):
+                return None
+            if not self.vfs.is_file(path) and not self.vfs.is_dir(path):
+                self.vfs.write_file(path, "")
+        return ""
+
+    def _mkdir(self, args):
+        parents = "-p" in args
+        targets = [arg for arg in args[1:] if arg != "-p"]
+        if not targets or any(arg.startswith("-") for arg in targets):
+            return None
+
+        errors = []
+        for target in targets:
+            path = self._resolve(target)
+            if self.vfs.is_dir(path) or self.vfs.is_file(path):
+                if not parents:
+                    errors.append(f"mkdir: cannot create directory '{target}': File exists")
+                continue
+            if not parents and not self.vfs.is_dir(posixpath.dirname(path)):
+                if not self.vfs.is_known_missing(posixpath.dirname(path)):
+                    return None
+                errors.append(f"mkdir: cannot create directory '{target}': No such file or directory")
+                continue
+            self.vfs.add_dir(path)
+            self.vfs.complete_dirs.add(path)
+        return "\n".join(errors)
+
+    def _rm(self, args):
+        flags = [arg for arg in args[1:] if arg.startswith("-")]
+        targets = [arg for arg in args[1:] if not arg.startswith("-")]
+        if not targets or any(flag not in ("-f", "-r", "-rf", "-fr", "-R") for flag in flags):
+            return None
+        recursive = any("r" in flag.lower() for flag in flags)
+        force = any("f" in flag for flag in flags)
+
+        errors = []
+        for target in targets:
+            path = self._resolve(target)
+            if self.vfs.is_dir(path):
+                if not recursive:
+                    errors.append(f"rm: cannot remove '{target}': Is a directory")
+                    continue
+                if path == "/":
+                    errors.append(f"rm: it is dangerous to operate recursively on '{target}'")
+                    errors.append("rm: use --no-preserve-root to override this failsafe")
+                    continue
+                self.vfs.remove(path)
+            elif self.vfs.is_file(path):
+                self.vfs.remove(path)
+            elif self.vfs.is_known_missing(path):
+                if not force:
+                    errors.append(f"rm: cannot remove '{target}': No such file or directory")
+            else:
+                return None
+        return "\n".join(errors)
@@ -1,105 +1,427 @@
-from typing import Optional
-from LLM.LLM_integration import LLMHoneypot
+import asyncio
+import functools
+import re
+from typing import Callable, List, Optional, Tuple
+from LLM.LLM_integration import LLMHoneypot, PROMPT_REGEX
+from LLM.provider_router import PartialResponseError
+from config_parser.config_parser import load_shell_config
+from emulated_shell.builtin_commands import BuiltinCommands
+from emulated_shell.line_editor import LineEditor
 from logger.logger import log_event
 import socket
 
+RECV_SIZE = 4096
+# input chunks up to this size are taken as typed keystrokes (escape sequences included)
+KEYSTROKE_MAX_BYTES = 4
+
+NOT_FOUND_REGEX = re.compile(r": command not found$|^Command '[^']*' not found", re.MULTILINE)
+ERROR_REGEX = re.compile(r": (No such file or directory|Permission denied|Is a directory|Not a directory)$", re.MULTILINE)
+# shown when no LLM provider could answer; what bash prints on a box out of processes
+LLM_ERROR_OUTPUT = "-bash: fork: Resource temporarily unavailable"
+
+
+def guess_exit_status(output: str) -> int:
+    '''
+    exit status a real shell would most likely report for the given output
+    '''
+    # terminal output ends lines with \r\n, which the $ anchors would not match
+    output = output.replace("\r\n", "\n")
+    if NOT_FOUND_REGEX.search(output):
+        return 127
+    if ERROR_REGEX.search(output):
+        return 1
+    return 0
+
+
+@functools.lru_cache(maxsize=None)
+def resolve_server_ip() -> str:
+    '''
+    resolves the address shown in shell prompts; the lookup may block on DNS,
+    so it runs once (at startup) and the result is shared by all sessions
+    '''
+    try:
+        return socket.gethostbyname(socket.gethostname())
+    except OSError as e:
+        print(f"[SHELL] Could not resolve the server address, using 127.0.0.1: {e}")
+        return "127.0.0.1"
+
 
 class EmulatedShell:
 
-    def __init__(self, channel, session_id, src_ip, src_port, username, config):
+    def __init__(self, channel, session_id, src_ip, src_port, username, config,
+                 on_ready: Optional[Callable[[], None]] = None,
+                 on_input: Optional[Callable[[], None]] = None):
+        '''
+        :param on_ready: called once the first prompt has been sent
+        :param on_input: called whenever input is received, used for idle tracking
+        '''
         print(f"[SHELL] Emulated shell initialized")
         self.session_id = session_id
         self.src_ip = src_ip
         self.src_port = src_port
         self.channel = channel
         self.username = username
-        self.llm_honeypot = LLMHoneypot(username, socket.gethostbyname(socket.gethostname()), config=config)
+        self.on_ready = on_ready
+        self.on_input = on_input
+        ssh_server_ip = resolve_server_ip()
+        self.ssh_server_ip = ssh_server_ip
+        self.llm_honeypot = LLMHoneypot(username, ssh_server_ip, config=config)
+
+        shell_config = load_shell_config(config)
+        self.builtins = None
+        if shell_config["builtin_commands"]:
+            self.builtins = BuiltinCommands(username, ssh_server_ip, shell_config["hostname"])
+        self.paste_batching = shell_config["paste_batching"]
+        self.max_batch_size = shell_config["max_batch_size"]
+
+        self.line_editor = LineEditor()
 
 
     def start_session(self):
-        ssh_server_ip = socket.gethostbyname(socket.gethostname())
-        prompt = f"{self.username}@{ssh_server_ip}:~$ ".encode()
-        self.channel.send(prompt)
-        command = b""
-
-        while True:
-            char = self.channel.recv(1)
-
-            if not char:
-                print(f"[SHELL] Client with {self.src_ip}:{self.src_port} disconnected")
-                self.channel.send(b'\nConnection lost...\n')
-                log_event(
-                    event_id="session_disconnect",
-                    session_id=self.session_id,
-                    src_ip=self.src_ip,
-                    src_port=self.src_port
-                )
+        self._send_initial_prompt()
+
+        running = True
+        while running:
+            data = self.channel.recv(RECV_SIZE)
+
+            if not data:
+                self._on_disconnect()
                 break
 
-            if char == b'\x1b':
-                seq = self.channel.recv(2)
-                if seq in [b'[A', b'[B', b'[C', b'[D']:
+            for step in self._plan_input(self._process_input(data)):
+                if not self._handle_step(step):
+                    running = False
+                    break
+
+        self._terminate()
+
+    async def start_session_async(self, executor):
+        '''
+        asyncio counterpart of start_session: input is read when the channel
+        becomes readable instead of blocking a thread on recv, and LLM calls
+        run on the given executor so the event loop never waits on HTTP
+        :param executor: executor used for blocking LLM calls
+        '''
+        loop = asyncio.get_running_loop()
+        readable = asyncio.Event()
+        fd = self.channel.fileno()
+        loop.add_reader(fd, readable.set)
+
+        try:
+            self._send_initial_prompt()
+
+            running = True
+            while running:
+                await readable.wait()
+                readable.clear()
+
+                if not self.channel.recv_ready():
+                    if self.channel.eof_received or self.channel.closed:
+                        self._on_disconnect()
+                        break
                     continue
 
-            if char < b' ' and char not in [b'\r', b'\x7f']:
-                continue
+                data = self.channel.recv(RECV_SIZE)
+                if not data:
+                    self._on_disconnect()
+                    break
 
-            if char == b'\x7f':
-                if command:
-                    command = command[:-1]
-                    self.channel.send(b"\b \b")
-                continue
+                for step in self._plan_input(self._process_input(data)):
+                    if not await self._handle_step_async(step, executor):
+                        running = False
+                        break
+        finally:
+            loop.remove_reader(fd)
+
+        self._terminate()
+
+    def run_exec(self, command: str, pty: bool = False) -> int:
+        '''
+        answers a one-shot exec request (ssh host 'cmd'): sends the output without
+        a prompt, then the exit status, and closes the channel
+        :param pty: whether the client requested a terminal, which uses \r\n line endings
+        :return: the exit status sent to the client
+        '''
+        print(f"[SHELL] Exec command: {command} from {self.src_ip}")
+        try:
+            response = self._exec_response(command)
+        except Exception as e:
+            log_event(
+                event_id="command_error",
+                session_id=self.session_id,
+                src_ip=self.src_ip,
+                src_port=self.src_port,
+                username=self.username,
+                command=command,
+                response=f"LLM error: {str(e)}"
+            )
+            self.channel.send_exit_status(1)
+            self._terminate()
+            return 1
 
-            self.channel.send(char)
-            command += char
+        # the response is shaped like interactive output, drop the prompt the LLM or the builtins append
+        match = PROMPT_REGEX.search(response)
+        output = response[:match.start()] if match else response
+        exit_status = guess_exit_status(output)
+        if not pty:
+            output = output.replace("\r\n", "\n")
 
-            if char == b'\r':
-                self.channel.send(b'\n')
+        self._log_command(command, output, dict(self.llm_honeypot.last_call, exec=True, exit_status=exit_status))
 
-                cmd_str = command.strip().decode('utf-8')
+        if output:
+            self._send_text(output)
+        self.channel.send_exit_status(exit_status)
+        self._terminate()
+        return exit_status
+
+    def _exec_response(self, command: str) -> str:
+        response = self.builtins.run(command) if self.builtins is not None else None
+        if response is not None:
+            self.llm_honeypot.record_exchange(command, response, "builtin")
+            return response
+
+        response = self.llm_honeypot.execute_model(command)
+        if self.builtins is not None:
+            self.builtins.observe(command, response)
+        return response
+
+    def _send_initial_prompt(self):
+        prompt = f"{self.username}@{self.ssh_server_ip}:~$ ".encode()
+        self.channel.send(prompt)
+        if self.on_ready is not None:
+            self.on_ready()
+
+    def _process_input(self, data: bytes) -> List[Tuple[bytes, Optional[str]]]:
+        '''
+        runs a chunk of input through the line editor
+        :return: segments of (bytes to echo, completed command or None), in order
+        '''
+        if self.on_input is not None:
+            self.on_input()
+        if len(data) <= KEYSTROKE_MAX_BYTES:
+            self.llm_honeypot.keystrokes += 1
+        segments = self.line_editor.feed(data)
+        for _, cmd_str in segments:
+            if cmd_str is not None:
                 print(f"[SHELL] Received command: {cmd_str} from {self.src_ip}")
+        return segments
 
-                if cmd_str.lower() == "exit":
-                    log_event(
-                        event_id="command_input",
-                        session_id=self.session_id,
-                        src_ip=self.src_ip,
-                        src_port=self.src_port,
-                        username=self.username,
-                        command=cmd_str,
-                    )
-                    break
+    def _plan_input(self, segments: List[Tuple[bytes, Optional[str]]]) -> List[List[Tuple[bytes, Optional[str]]]]:
+        '''
+        groups the segments of a chunk of input into steps; consecutive commands for the
+        LLM (a pasted script) become one batch, everything else is handled on its own
+        :return: lists of segments, those with more than one segment are batches
+        '''
+        steps = []
+        batch = []
+        for segment in segments:
+            cmd_str = segment[1]
+            if (self.paste_batching and cmd_str and cmd_str.lower() != "exit"
+                    and (self.builtins is None or not self.builtins.handles(cmd_str))):
+                batch.append(segment)
+                if len(batch) == self.max_batch_size:
+                    steps.append(batch)
+                    batch = []
+                continue
 
-                # LLM INTEGRATION
-                try:
-                    response = self.llm_honeypot.execute_model(cmd_str)
-
-                    log_event(
-                        event_id="command_input",
-                        session_id=self.session_id,
-                        src_ip=self.src_ip,
-                        src_port=self.src_port,
-                        username=self.username,
-                        command=cmd_str,
-                        response=response
-                    )
-
-                    self.channel.send(response.encode())
-                except Exception as e:
-                    self.channel.send(f"Error processing command\r\n".encode())
-                    log_event(
-                        event_id="command_error",
-                        session_id=self.session_id,
-                        src_ip=self.src_ip,
-                        src_port=self.src_port,
-                        username=self.username,
-                        command=cmd_str,
-                        response=f"LLM error: {str(e)}"
-                    )
-                    break
+            # built-in commands see the state left by the commands before them
+            if batch:
+                steps.append(batch)
+                batch = []
+            steps.append([segment])
+        if batch:
+            steps.append(batch)
+        return steps
+
+    def _handle_step(self, step: List[Tuple[bytes, Optional[str]]]) -> bool:
+        '''
+        :return: False if the session should end
+        '''
+        echo, cmd_str = step[0]
+        if echo:
+            self.channel.send(echo)
+        if len(step) == 1:
+            return cmd_str is None or self._handle_command(cmd_str)
+
+        try:
+            results = self.llm_honeypot.execute_batch([segment[1] for segment in step])
+        except Exception as e:
+            self._on_batch_error(step, e)
+            return True
+
+        results = results or []
+        self._on_batch_response(step, results)
+        # commands the batch did not answer are sent one by one
+        for index, (echo, cmd_str) in enumerate(step[len(results):], len(results)):
+            if index:
+                self.channel.send(echo)
+            if not self._handle_command(cmd_str):
+                return False
+        return True
+
+    async def _handle_step_async(self, step: List[Tuple[bytes, Optional[str]]], executor) -> bool:
+        echo, cmd_str = step[0]
+        if echo:
+            self.channel.send(echo)
+        if len(step) == 1:
+            return cmd_str is None or await self._handle_command_async(cmd_str, executor)
 
-                command = b""
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(
+                executor,
+                self.llm_honeypot.execute_batch,
+                [segment[1] for segment in step],
+            )
+        except Exception as e:
+            self._on_batch_error(step, e)
+            return True
+
+        results = results or []
+        self._on_batch_response(step, results)
+        for index, (echo, cmd_str) in enumerate(step[len(results):], len(results)):
+            if index:
+                self.channel.send(echo)
+            if not await self._handle_command_async(cmd_str, executor):
+                return False
+        return True
+
+    def _on_batch_response(self, step: List[Tuple[bytes, Optional[str]]], results: List[Tuple[str, dict]]):
+        '''
+        sends the answers of a batch command by command, each after the echo of its line
+        '''
+        for index, ((echo, cmd_str), (response, details)) in enumerate(zip(step, results)):
+            if index:
+                self.channel.send(echo)
+            if self.builtins is not None:
+                self.builtins.observe(cmd_str, response)
+            self._log_command(cmd_str, response, details)
+            self._send_text(response)
+
+    def _handle_command(self, cmd_str: str) -> bool:
+        '''
+        answers a completed command, locally when possible and otherwise through the LLM
+        :return: False if the session should end
+        '''
+        if cmd_str.lower() == "exit":
+            self._log_command(cmd_str)
+            return False
+
+        if self._answer_locally(cmd_str):
+            return True
+
+        # LLM INTEGRATION
+        try:
+            response = self.llm_honeypot.execute_model(cmd_str, on_chunk=self._send_text)
+        except Exception as e:
+            self._on_command_error(cmd_str, e)
+            return True
+
+        self._on_llm_response(cmd_str, response)
+        return True
+
+    async def _handle_command_async(self, cmd_str: str, executor) -> bool:
+        if cmd_str.lower() == "exit":
+            self._log_command(cmd_str)
+            return False
+
+        if self._answer_locally(cmd_str):
+            return True
+
+        loop = asyncio.get_running_loop()
+        try:
+            response = await loop.run_in_executor(
+                executor,
+                functools.partial(self.llm_honeypot.execute_model, cmd_str, on_chunk=self._send_text),
+            )
+        except Exception as e:
+            self._on_command_error(cmd_str, e)
+            return True
+
+        self._on_llm_response(cmd_str, response)
+        return True
+
+    def _answer_locally(self, cmd_str: str) -> bool:
+        if self.builtins is None:
+            return False
+
+        response = self.builtins.run(cmd_str)
+        if response is None:
+            return False
+
+        if cmd_str:
+            self.llm_honeypot.record_exchange(cmd_str, response, "builtin")
+        else:
+            self.llm_honeypot.last_call = {"source": "builtin"}
+        self._on_command_response(cmd_str, response, streamed=False)
+        return True
+
+    def _on_llm_response(self, cmd_str: str, response: str):
+        if self.builtins is not None:
+            self.builtins.observe(cmd_str, response)
+        self._on_command_response(cmd_str, response, streamed=self.llm_honeypot.stream)
+
+    def _log_command(self, cmd_str: str, response: Optional[str] = None, details: Optional[dict] = None):
+        log_event(
+            event_id="command_input",
+            session_id=self.session_id,
+            src_ip=self.src_ip,
+            src_port=self.src_port,
+            username=self.username,
+            command=cmd_str,
+            response=response,
+            details=details,
+        )
+
+    def _send_text(self, text: str):
+        self.channel.send(text.encode())
+
+    def _on_command_response(self, cmd_str: str, response: str, streamed: bool):
+        self._log_command(cmd_str, response, self.llm_honeypot.last_call)
+        if not streamed:
+            # streamed responses have already been relayed chunk by chunk
+            self._send_text(response)
+
+    def _prompt(self) -> str:
+        if self.builtins is not None:
+            return self.builtins.prompt()
+        return f"{self.username}@{self.ssh_server_ip}:{self.llm_honeypot.current_directory()}$ "
+
+    def _on_command_error(self, cmd_str: str, error: Exception):
+        '''
+        answers a command the LLM failed on with a shell error and a new prompt; the session goes on
+        '''
+        print(f"[SHELL] LLM error for {cmd_str!r} from {self.src_ip}: {error}")
+        # part of a streamed response may already be on the attacker's screen
+        separator = "\r\n" if isinstance(error, PartialResponseError) else ""
+        self._send_text(f"{separator}{LLM_ERROR_OUTPUT}\r\n{self._prompt()}")
+        log_event(
+            event_id="command_error",
+            session_id=self.session_id,
+            src_ip=self.src_ip,
+            src_port=self.src_port,
+            username=self.username,
+            command=cmd_str,
+            response=f"LLM error: {str(error)}"
+        )
+
+    def _on_batch_error(self, step: List[Tuple[bytes, Optional[str]]], error: Exception):
+        for index, (echo, cmd_str) in enumerate(step):
+            if index:
+                self.channel.send(echo)
+            self._on_command_error(cmd_str, error)
+
+    def _on_disconnect(self):
+        print(f"[SHELL] Client with {self.src_ip}:{self.src_port} disconnected")
+        self.channel.send(b'\nConnection lost...\n')
+        log_event(
+            event_id="session_disconnect",
+            session_id=self.session_id,
+            src_ip=self.src_ip,
+            src_port=self.src_port
+        )
 
+    def _terminate(self):
         self.channel.close()
         log_event(
             event_id="session_terminated",
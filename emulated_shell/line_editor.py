@@ -0,0 +1,97 @@
+from typing import List, Optional, Tuple
+
+ESC = 0x1b
+CR = 0x0d
+LF = 0x0a
+BACKSPACE = 0x08
+DELETE = 0x7f
+CTRL_C = 0x03
+CTRL_U = 0x15
+
+
+class LineEditor:
+    '''
+    line discipline for the emulated terminal; consumes input in arbitrary
+    chunks (single keystrokes or whole pasted scripts) and produces the bytes
+    to echo back together with the completed lines
+    '''
+
+    def __init__(self):
+        self._line = bytearray()
+        self._escape = bytearray()
+        self._after_cr = False
+
+    def feed(self, data: bytes) -> List[Tuple[bytes, Optional[str]]]:
+        '''
+        :param data: raw bytes received from the channel
+        :return: segments of (bytes to echo, completed line or None); the echo of
+                 a segment must be sent before its line is handled
+        '''
+        segments = []
+        echo = bytearray()
+
+        for byte in data:
+            after_cr = self._after_cr
+            self._after_cr = False
+
+            if self._escape:
+                self._consume_escape(byte)
+                continue
+
+            if byte == ESC:
+                self._escape.append(byte)
+            elif byte == CR or (byte == LF and not after_cr):
+                # CRLF counts as a single line ending, a lone LF ends a line as well
+                self._after_cr = byte == CR
+                echo += b"\r\n"
+                segments.append((bytes(echo), self._take_line()))
+                echo = bytearray()
+            elif byte == LF:
+                continue
+            elif byte in (DELETE, BACKSPACE):
+                if self._erase_char():
+                    echo += b"\b \b"
+            elif byte == CTRL_U:
+                while self._erase_char():
+                    echo += b"\b \b"
+            elif byte == CTRL_C:
+                self._line.clear()
+                echo += b"^C\r\n"
+                segments.append((bytes(echo), ""))
+                echo = bytearray()
+            elif byte < 0x20:
+                continue
+            else:
+                self._line.append(byte)
+                echo.append(byte)
+
+        if echo:
+            segments.append((bytes(echo), None))
+        return segments
+
+    def _consume_escape(self, byte: int):
+        '''
+        swallows escape sequences (arrow keys, function keys, ...) which may be split across chunks
+        '''
+        self._escape.append(byte)
+        if len(self._escape) == 2:
+            if byte not in (ord("["), ord("O")):
+                self._escape.clear()
+        elif self._escape[1] == ord("O") or 0x40 <= byte <= 0x7e:
+            # SS3 sequences are one byte long, CSI sequences end with a final byte
+            self._escape.clear()
+
+    def _erase_char(self) -> bool:
+        if not self._line:
+            return False
+        # drop a whole UTF-8 character, not just its last byte
+        while self._line and 0x80 <= self._line[-1] <= 0xbf:
+            self._line.pop()
+        if self._line:
+            self._line.pop()
+        return True
+
+    def _take_line(self) -> str:
+        line = self._line.decode("utf-8", errors="replace").strip()
+        self._line.clear()
+        return line
@@ -1,18 +1,43 @@
 import argparse
+import asyncio
 import atexit
 import socket
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 
-from config_parser.config_parser import load_config_file
+from config_parser.config_parser import load_config_file, load_server_config
 from client_handling.client_handler import client_handle
-from store.user_history_store import UserHistoryStore
+from client_handling.async_client_handler import async_client_handle
+from client_handling.admission import create_admission_controller
+from client_handling.session_registry import init_session_registry
+from emulated_shell.emulated_shell import resolve_server_ip
+from store.user_history_store import UserHistoryStore, get_user_history_store
+from LLM.provider_pool import close_provider_sessions
+from logger.logger import log_event
+from metrics.metrics import collect_metrics
+from supervisor.supervisor import Supervisor
 
 with open("title.txt", 'r', encoding='UTF-8') as file:
     title = file.read()
 
-def start_server(address, port, config_file: Optional[str] = None):
+def create_listen_socket(address, port, reuse_port: bool = False, backlog: int = 128) -> socket.socket:
+    '''
+    :param reuse_port: let several worker processes bind the same port (SO_REUSEPORT)
+    :param backlog: kernel queue of connections not accepted yet
+    '''
+    socks = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    socks.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        socks.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    socks.bind((address, port))
+
+    socks.listen(backlog)
+    return socks
+
+
+def start_server(address, port, config_file: Optional[str] = None, reuse_port: bool = False):
     
     try:
         config = load_config_file(config_file)
@@ -20,31 +45,88 @@ def start_server(address, port, config_file: Optional[str] = None):
         print(f"[SSH Server] Failed to load config: {e}")
         exit(1)
 
-    socks = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    socks.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    socks.bind((address, port))
+    server_config = load_server_config(config)
+    admission = create_admission_controller(server_config["admission"])
+    init_session_registry(server_config)
 
-    socks.listen(100)
+    socks = create_listen_socket(address, port, reuse_port, server_config["listen_backlog"])
     print(f"[SSH Server] SSH Server listening on {address}:{port}")
 
     while True:
         try:
             client, address = socks.accept()
+
+            ticket = admission.admit(address[0])
+            if ticket is None:
+                # rejections are logged as periodic summaries by the admission controller
+                client.close()
+                continue
+
             print(f"[SSH Server] Incoming SSH connection from {address[0]}:{address[1]}")
 
-            ssh_thread = threading.Thread(target=client_handle, args=(client, address, config))
+            ssh_thread = threading.Thread(target=client_handle, args=(client, address, config, ticket))
             ssh_thread.start()
 
         except Exception as e:
             print(e)
 
 
-def start_cleanup_loop(store: UserHistoryStore, period: int = 1800):
+def start_async_server(address, port, config_file: Optional[str] = None, reuse_port: bool = False):
+    '''
+    asyncio front end: a single event loop accepts connections and drives the
+    shell sessions, while blocking LLM calls go to a bounded executor
+    '''
+    try:
+        config = load_config_file(config_file)
+    except ValueError as e:
+        print(f"[SSH Server] Failed to load config: {e}")
+        exit(1)
+
+    asyncio.run(_serve_async(address, port, config, reuse_port))
+
+
+async def _serve_async(address, port, config, reuse_port: bool = False):
+    server_config = load_server_config(config)
+    executor = ThreadPoolExecutor(max_workers=server_config["async_llm_workers"], thread_name_prefix="llm")
+    admission = create_admission_controller(server_config["admission"])
+    init_session_registry(server_config)
+
+    socks = create_listen_socket(address, port, reuse_port, server_config["listen_backlog"])
+    socks.setblocking(False)
+    print(f"[SSH Server] SSH Server (asyncio) listening on {address}:{port}")
+
+    loop = asyncio.get_running_loop()
+    sessions = set()
+
+    while True:
+        try:
+            client, address = await loop.sock_accept(socks)
+
+            if admission.overload_policy == "delay":
+                # waiting for capacity blocks, which the event loop must not do
+                ticket = await loop.run_in_executor(None, admission.admit, address[0])
+            else:
+                ticket = admission.admit(address[0])
+            if ticket is None:
+                client.close()
+                continue
+
+            print(f"[SSH Server] Incoming SSH connection from {address[0]}:{address[1]}")
+
+            task = loop.create_task(async_client_handle(client, address, config, executor, ticket))
+            sessions.add(task)
+            task.add_done_callback(sessions.discard)
+
+        except Exception as e:
+            print(e)
+
+
+def start_cleanup_loop(store: UserHistoryStore, period: int = 60):
     '''
     starts a loop which periodically cleans up the user's history
-    default period is 30 minutes
+    every run is time bounded, so it runs often instead of once in a while
     :param store: user history store
-    :param period: period length in seconds; default is 1800s = 30min
+    :param period: period length in seconds; default is 60s
     '''
     def cleanup_loop():
         while True:
@@ -57,12 +139,72 @@ def start_cleanup_loop(store: UserHistoryStore, period: int = 1800):
     thread = threading.Thread(target=cleanup_loop, daemon=True)
     thread.start()
 
+
+def start_metrics_loop(period: int = 60):
+    '''
+    starts a loop which periodically logs a snapshot of the registered metrics
+    :param period: period length in seconds; default is 60s
+    '''
+    def metrics_loop():
+        while True:
+            time.sleep(period)
+            try:
+                snapshot = collect_metrics()
+                if snapshot:
+                    log_event(event_id="metrics", session_id=None, details=snapshot)
+            except Exception as e:
+                print(f"[-] Metrics error: {e}")
+
+    thread = threading.Thread(target=metrics_loop, daemon=True)
+    thread.start()
+
+def run_worker(address, port, config_file: Optional[str], mode: str):
+    '''
+    body of a worker process in supervisor mode; history cleanup runs in the supervisor only
+    '''
+    # other workers write the same usernames, an in-process history cache would go stale
+    history_store = get_user_history_store(cache_max_users=0)
+    atexit.register(history_store.close)
+    atexit.register(close_provider_sessions)
+
+    resolve_server_ip()
+    start_metrics_loop()
+
+    if mode == "asyncio":
+        start_async_server(address, port, config_file, reuse_port=True)
+    else:
+        start_server(address, port, config_file, reuse_port=True)
+
+
+def start_supervisor(address, port, config_file: Optional[str], mode: str, workers: int):
+    '''
+    runs the server in several worker processes sharing the port through SO_REUSEPORT
+    '''
+    if not hasattr(socket, "SO_REUSEPORT"):
+        print("[SSH Server] Worker mode requires SO_REUSEPORT, which this platform does not support")
+        exit(1)
+
+    try:
+        # fail once here instead of in every restarted worker
+        load_config_file(config_file)
+    except ValueError as e:
+        print(f"[SSH Server] Failed to load config: {e}")
+        exit(1)
+
+    print(f"[SSH Server] Starting {workers} workers on {address}:{port}")
+    Supervisor(workers, run_worker, (address, port, config_file, mode)).run()
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
 
     parser.add_argument('-a', '--address', type=str, required=True)
     parser.add_argument('-p', '--port', type=int, required=True)
     parser.add_argument('-c', '--config', type=str, required=False, help="Path to custom config file")
+    parser.add_argument('-m', '--mode', type=str, choices=["threaded", "asyncio"], default="threaded",
+                        help="Connection front end: one thread per connection or a single asyncio event loop")
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help="Number of worker processes sharing the port; more than one starts a supervisor")
 
 
     args = parser.parse_args()
@@ -71,11 +213,22 @@ if __name__ == '__main__':
         print(title)
         print("Leviathan running...")
 
-        history_store = UserHistoryStore()
+        history_store = get_user_history_store()
         atexit.register(history_store.close)
         
         start_cleanup_loop(history_store)
-
-        start_server(args.address, args.port, args.config)
+        start_metrics_loop()
+
+        # resolve the address shown in prompts once instead of per session
+        print(f"[SSH Server] Server address: {resolve_server_ip()}")
+
+        if args.workers > 1:
+            start_supervisor(args.address, args.port, args.config, args.mode, args.workers)
+        elif args.mode == "asyncio":
+            atexit.register(close_provider_sessions)
+            start_async_server(args.address, args.port, args.config)
+        else:
+            atexit.register(close_provider_sessions)
+            start_server(args.address, args.port, args.config)
     except Exception as e:
         print(e)
@@ -0,0 +1,262 @@
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from typing import List, Optional, Tuple
+
+from elasticsearch import Elasticsearch
+
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class ElasticsearchShipper:
+    """
+    Ships log events to Elasticsearch with the bulk API from a background thread.
+
+    Events are batched by size and time. A batch that still fails after the
+    retries is appended to a local spool file, which is replayed batch by batch
+    once the cluster is reachable again. Every event gets its document id when
+    it is submitted, so replaying a partially shipped spool does not create
+    duplicates. The client is created lazily and health checks only ever run
+    on the shipper thread.
+    """
+
+    def __init__(self,
+                 host: str,
+                 index: str,
+                 spool_path: str,
+                 queue_size: int = 20000,
+                 batch_size: int = 500,
+                 flush_interval: float = 2.0,
+                 max_retries: int = 3,
+                 retry_backoff: float = 1.0,
+                 health_interval: float = 10.0,
+                 max_spool_size: int = 500 * 1024 * 1024,
+                 ):
+        self.host = host
+        self.index = index
+        self.spool_path = spool_path
+        self.replay_path = spool_path + ".replay"
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.health_interval = health_interval
+        self.max_spool_size = max_spool_size
+
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._client: Optional[Elasticsearch] = None
+        self._healthy = False
+        self._last_health_check = 0.0
+        self._replay_offset = 0
+        self._spool_lock = threading.Lock()
+        self._counters_lock = threading.Lock()
+        self._stopped = threading.Event()
+
+        self.shipped = 0
+        self.rejected = 0
+        self.spooled = 0
+        self.replayed = 0
+        self.dropped = 0
+        self.failed_batches = 0
+
+        self._thread = threading.Thread(target=self._run, name="es-shipper", daemon=True)
+        self._thread.start()
+
+    def submit(self, log_entry: dict):
+        item = (uuid.uuid4().hex, log_entry)
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            # never block the log writer, keep the event on disk instead
+            self._spool([item])
+
+    def close(self):
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        self._thread.join(timeout=self.flush_interval * 4)
+
+        remaining = []
+        while True:
+            try:
+                remaining.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        if remaining:
+            self._spool(remaining)
+
+    def stats(self) -> dict:
+        with self._counters_lock:
+            return {
+                "healthy": self._healthy,
+                "queue_depth": self.queue.qsize(),
+                "shipped": self.shipped,
+                "rejected": self.rejected,
+                "spooled": self.spooled,
+                "replayed": self.replayed,
+                "dropped": self.dropped,
+                "failed_batches": self.failed_batches,
+                "spool_size": self._spool_size(),
+            }
+
+    def _run(self):
+        while not self._stopped.is_set():
+            # while a spool is waiting to be replayed, only wait for live events briefly
+            replay_pending = self._healthy and (os.path.exists(self.replay_path) or os.path.exists(self.spool_path))
+            batch = self._next_batch(0 if replay_pending else self.flush_interval)
+            if batch:
+                self._ship(batch)
+            elif self._is_healthy():
+                self._replay_spool()
+
+    def _next_batch(self, timeout: float) -> List[Tuple[str, dict]]:
+        try:
+            batch = [self.queue.get(timeout=timeout)] if timeout else [self.queue.get_nowait()]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _ship(self, batch: List[Tuple[str, dict]]) -> bool:
+        pending = batch
+        for attempt in range(self.max_retries + 1):
+            if not self._is_healthy():
+                break
+            try:
+                pending = self._bulk(pending)
+            except Exception as e:
+                print(f"[LOGGER] Elasticsearch bulk request failed: {e}")
+                self._healthy = False
+            if not pending:
+                return True
+            if self._stopped.wait(self.retry_backoff * (2 ** attempt)):
+                break
+
+        with self._counters_lock:
+            self.failed_batches += 1
+        self._spool(pending)
+        return False
+
+    def _bulk(self, batch: List[Tuple[str, dict]]) -> List[Tuple[str, dict]]:
+        """
+        :return: the events that should be retried
+        """
+        operations = []
+        for doc_id, log_entry in batch:
+            operations.append({"index": {"_index": self.index, "_id": doc_id}})
+            operations.append(log_entry)
+
+        response = self._get_client().bulk(operations=operations)
+
+        retry = []
+        rejected = 0
+        if response.get("errors"):
+            for item, event in zip(response["items"], batch):
+                status = item.get("index", {}).get("status", 200)
+                if status in RETRYABLE_STATUS_CODES:
+                    retry.append(event)
+                elif status >= 300:
+                    # mapping errors and the like will never succeed, do not keep them around
+                    rejected += 1
+
+        with self._counters_lock:
+            self.shipped += len(batch) - len(retry) - rejected
+            self.rejected += rejected
+        return retry
+
+    def _get_client(self) -> Elasticsearch:
+        if self._client is None:
+            self._client = Elasticsearch(self.host, request_timeout=10)
+        return self._client
+
+    def _is_healthy(self) -> bool:
+        now = time.monotonic()
+        if self._healthy or now - self._last_health_check < self.health_interval:
+            return self._healthy
+
+        self._last_health_check = now
+        try:
+            self._healthy = bool(self._get_client().ping())
+        except Exception:
+            self._healthy = False
+        if self._healthy:
+            print("[LOGGER] Elasticsearch is reachable")
+        return self._healthy
+
+    def _spool(self, batch: List[Tuple[str, dict]]):
+        lines = "".join(json.dumps({"_id": doc_id, "doc": log_entry}) + "\n" for doc_id, log_entry in batch)
+        with self._spool_lock:
+            if self._spool_size() + len(lines) > self.max_spool_size:
+                with self._counters_lock:
+                    self.dropped += len(batch)
+                return
+            with open(self.spool_path, "a", encoding="utf-8") as f:
+                f.write(lines)
+        with self._counters_lock:
+            self.spooled += len(batch)
+
+    def _spool_size(self) -> int:
+        size = 0
+        for path in (self.spool_path, self.replay_path):
+            if os.path.exists(path):
+                size += os.path.getsize(path)
+        return size
+
+    def _replay_spool(self):
+        """
+        ships the next batch of spooled events; the spool is moved aside first so
+        events spooled meanwhile go to a fresh file
+        """
+        with self._spool_lock:
+            if not os.path.exists(self.replay_path):
+                if not os.path.exists(self.spool_path):
+                    return
+                os.replace(self.spool_path, self.replay_path)
+                self._replay_offset = 0
+
+        batch = []
+        with open(self.replay_path, "r", encoding="utf-8") as f:
+            f.seek(self._replay_offset)
+            while len(batch) < self.batch_size:
+                line = f.readline()
+                if not line:
+                    break
+                try:
+                    record = json.loads(line)
+                    batch.append((record["_id"], record["doc"]))
+                except (ValueError, KeyError):
+                    continue
+            offset = f.tell()
+
+        if not batch:
+            os.remove(self.replay_path)
+            self._replay_offset = 0
+            print("[LOGGER] Spooled events replayed to Elasticsearch")
+            return
+
+        try:
+            retry = self._bulk(batch)
+        except Exception as e:
+            print(f"[LOGGER] Elasticsearch replay failed: {e}")
+            self._healthy = False
+            return
+
+        if retry:
+            self._healthy = False
+            self._spool(retry)
+
+        with self._counters_lock:
+            self.replayed += len(batch) - len(retry)
+        self._replay_offset = offset
@@ -0,0 +1,140 @@
+import glob
+import gzip
+import os
+import queue
+import shutil
+import threading
+import time
+from datetime import datetime
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class LogRotator:
+    """
+    Compresses rotated log files on a dedicated thread and enforces retention.
+
+    The log writer only renames the full log file (an atomic switch) and hands
+    the rotated path over; gzip compression and deletion of old archives never
+    run on the writer or on a session thread.
+    """
+
+    def __init__(self,
+                 log_dir: str,
+                 base_name: str,
+                 compress_level: int = 6,
+                 retention_count: int = 20,
+                 retention_size: int = 2 * 1024 * 1024 * 1024,
+                 ):
+        self.log_dir = log_dir
+        self.base_name = base_name
+        self.compress_level = compress_level
+        self.retention_count = retention_count
+        self.retention_size = retention_size
+
+        self.queue: queue.Queue = queue.Queue()
+        self._counters_lock = threading.Lock()
+
+        self.rotations = 0
+        self.compressed = 0
+        self.failed = 0
+        self.deleted = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.last_compress_seconds = 0.0
+
+        self._thread = threading.Thread(target=self._run, name="log-rotator", daemon=True)
+        self._thread.start()
+
+        # finish rotations interrupted by a restart
+        for leftover in sorted(glob.glob(os.path.join(log_dir, f"{base_name}_*.log"))):
+            self.queue.put(leftover)
+
+    def rotate(self, log_file: str) -> str:
+        """
+        Atomically moves the current log file aside and schedules its compression.
+        Must be called by the owner of the log file after closing it.
+
+        :return: the path the log file was moved to
+        """
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        rotated = os.path.join(self.log_dir, f"{self.base_name}_{timestamp}.log")
+        suffix = 1
+        while os.path.exists(rotated) or os.path.exists(rotated + ".gz"):
+            rotated = os.path.join(self.log_dir, f"{self.base_name}_{timestamp}_{suffix}.log")
+            suffix += 1
+
+        os.replace(log_file, rotated)
+        with self._counters_lock:
+            self.rotations += 1
+        self.queue.put(rotated)
+        return rotated
+
+    def wait_idle(self):
+        self.queue.join()
+
+    def stats(self) -> dict:
+        with self._counters_lock:
+            return {
+                "rotations": self.rotations,
+                "pending": self.queue.qsize(),
+                "compressed": self.compressed,
+                "failed": self.failed,
+                "deleted": self.deleted,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "last_compress_seconds": round(self.last_compress_seconds, 3),
+            }
+
+    def _run(self):
+        while True:
+            rotated = self.queue.get()
+            try:
+                self._compress(rotated)
+                self._enforce_retention()
+            except Exception as e:
+                with self._counters_lock:
+                    self.failed += 1
+                print(f"[LOGGER] Failed to compress rotated log {rotated}: {e}")
+            finally:
+                self.queue.task_done()
+
+    def _compress(self, rotated: str):
+        started = time.monotonic()
+        target = rotated + ".gz"
+        partial = target + ".tmp"
+
+        with open(rotated, "rb") as f_in, gzip.open(partial, "wb", compresslevel=self.compress_level) as f_out:
+            shutil.copyfileobj(f_in, f_out, COPY_CHUNK_SIZE)
+
+        os.replace(partial, target)
+        size_in = os.path.getsize(rotated)
+        os.remove(rotated)
+
+        with self._counters_lock:
+            self.compressed += 1
+            self.bytes_in += size_in
+            self.bytes_out += os.path.getsize(target)
+            self.last_compress_seconds = time.monotonic() - started
+
+        print(f"[LOGGER] Rotated and compressed log to: {target}")
+
+    def _enforce_retention(self):
+        archives = sorted(
+            glob.glob(os.path.join(self.log_dir, f"{self.base_name}_*.log.gz")),
+            key=os.path.getmtime,
+            reverse=True,
+        )
+
+        kept_size = 0
+        over_limit = False
+        for index, archive in enumerate(archives):
+            size = os.path.getsize(archive)
+            if not over_limit and index < self.retention_count and kept_size + size <= self.retention_size:
+                kept_size += size
+                continue
+            # everything older than the first archive over the limit goes as well
+            over_limit = True
+            os.remove(archive)
+            with self._counters_lock:
+                self.deleted += 1
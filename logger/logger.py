@@ -1,49 +1,285 @@
+import atexit
 import json
 import os
-import shutil
+import queue
 import sys
-import gzip
+import threading
+import time
 from datetime import datetime
+from typing import Optional
 from dotenv import load_dotenv
-from elasticsearch import Elasticsearch
+
+from logger.es_shipper import ElasticsearchShipper
+from logger.log_rotator import LogRotator
+from metrics.metrics import register_collector
 
 LOG_DIR = "logs"
 BASE_LOG_FILE_NAME = "leviathan"
 LOG_FILE = os.path.join(LOG_DIR, f"{BASE_LOG_FILE_NAME}.log")
-MAX_LOG_SIZE = 1024 * 1024 * 100 # 100MB
 
 os.makedirs(LOG_DIR, exist_ok=True)
 
 load_dotenv()
 
+MAX_LOG_SIZE = int(os.getenv("LOG_MAX_SIZE", str(1024 * 1024 * 100)))  # 100MB
+LOG_COMPRESS_LEVEL = int(os.getenv("LOG_COMPRESS_LEVEL", "6"))
+LOG_RETENTION_COUNT = int(os.getenv("LOG_RETENTION_COUNT", "20"))
+LOG_RETENTION_SIZE = int(os.getenv("LOG_RETENTION_SIZE", str(2 * 1024 * 1024 * 1024)))  # 2GB
+
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "256"))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "0.5"))  # seconds
+LOG_FSYNC_INTERVAL = float(os.getenv("LOG_FSYNC_INTERVAL", "5"))  # seconds
+
 ELK_ENABLED = os.getenv("ELK_ENABLED", "false").lower() == "true"
 ES_HOST = os.getenv("ES_HOST", "http://localhost:9200")
 INDEX_NAME = "leviathan-logs"
+ES_SPOOL_FILE = os.getenv("ES_SPOOL_FILE", os.path.join(LOG_DIR, "es_spool.ndjson"))
+ES_BATCH_SIZE = int(os.getenv("ES_BATCH_SIZE", "500"))
+ES_FLUSH_INTERVAL = float(os.getenv("ES_FLUSH_INTERVAL", "2"))  # seconds
+ES_MAX_RETRIES = int(os.getenv("ES_MAX_RETRIES", "3"))
+ES_MAX_SPOOL_SIZE = int(os.getenv("ES_MAX_SPOOL_SIZE", str(500 * 1024 * 1024)))  # 500MB
+
+_es_shipper: Optional[ElasticsearchShipper] = None
+
+class LogWriter:
+    """
+    Background writer for log events. Callers only enqueue the event; a single
+    thread keeps the log file open, writes events in batches, flushes every
+    batch, fsyncs periodically and tracks the file size in memory for rotation.
+    When the queue is full, events are dropped instead of blocking the caller.
+    """
+
+    def __init__(self,
+                 path: str = LOG_FILE,
+                 rotator: Optional[LogRotator] = None,
+                 max_size: int = MAX_LOG_SIZE,
+                 queue_size: int = LOG_QUEUE_SIZE,
+                 batch_size: int = LOG_BATCH_SIZE,
+                 flush_interval: float = LOG_FLUSH_INTERVAL,
+                 fsync_interval: float = LOG_FSYNC_INTERVAL,
+                 ):
+        self.path = path
+        self.rotator = rotator
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._file = None
+        self._size = 0
+        self._last_fsync = time.monotonic()
+        self._stopped = threading.Event()
+        self._counters_lock = threading.Lock()
+
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, log_entry: dict) -> bool:
+        try:
+            self.queue.put_nowait(log_entry)
+            return True
+        except queue.Full:
+            with self._counters_lock:
+                self.dropped += 1
+            return False
+
+    def flush(self):
+        """
+        Blocks until every event enqueued so far has been written.
+        """
+        self.queue.join()
+
+    def close(self):
+        if self._stopped.is_set():
+            return
+        self.flush()
+        self._stopped.set()
+        self._thread.join(timeout=self.flush_interval * 4)
+        self._close_file()
+
+    def stats(self) -> dict:
+        with self._counters_lock:
+            return {
+                "queue_depth": self.queue.qsize(),
+                "written": self.written,
+                "dropped": self.dropped,
+                "batches": self.batches,
+                "file_size": self._size,
+            }
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                batch = [self.queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                self._maybe_fsync()
+                continue
+
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                print(f"[LOGGER] Failed to write log batch: {e}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _write_batch(self, batch):
+        lines = "".join(json.dumps(log_entry) + "\n" for log_entry in batch)
+
+        if self._file is None:
+            self._open_file()
+
+        data = lines.encode("utf-8")
+        self._file.write(data)
+        self._file.flush()
+        self._size += len(data)
+        self._maybe_fsync()
+
+        sys.stdout.write(lines)
+
+        with self._counters_lock:
+            self.written += len(batch)
+            self.batches += 1
+
+        for log_entry in batch:
+            send_to_elasticsearch(log_entry)
+
+        if self._size > self.max_size and self.rotator is not None:
+            # switch to a fresh file right away, compression happens on the rotator thread
+            self._close_file()
+            self.rotator.rotate(self.path)
+
+    def _open_file(self):
+        self._file = open(self.path, "ab")
+        self._size = self._file.tell()
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
 
-es = None
-if ELK_ENABLED:
-    try:
-        es = Elasticsearch(ES_HOST)
-    except Exception as e:
-        print(f"[LOGGER] Elasticsearch connection failed: {e}")
-        ELK_ENABLED = False
+    def _maybe_fsync(self):
+        if self._file is None:
+            return
+        now = time.monotonic()
+        if now - self._last_fsync >= self.fsync_interval:
+            os.fsync(self._file.fileno())
+            self._last_fsync = now
 
-def rotate_log():
+
+class QueueLogSink:
     """
-    Rotates and compresses the existing log file when it exceeds the size limit.
+    Stands in for the log writer in worker processes: events are handed to the
+    supervisor over a multiprocessing queue, which owns the log file, rotation
+    and the Elasticsearch shipper. Events are dropped when the queue is full.
     """
-    if os.path.exists(LOG_FILE) and os.path.getsize(LOG_FILE) > MAX_LOG_SIZE:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        new_log_name = os.path.join(LOG_DIR, f"{BASE_LOG_FILE_NAME}_{timestamp}.log")
 
-        shutil.move(LOG_FILE, new_log_name)
+    def __init__(self, log_queue):
+        self.queue = log_queue
+        self._counters_lock = threading.Lock()
+        self.forwarded = 0
+        self.dropped = 0
+
+    def submit(self, log_entry: dict) -> bool:
+        try:
+            self.queue.put_nowait(log_entry)
+        except queue.Full:
+            with self._counters_lock:
+                self.dropped += 1
+            return False
+        with self._counters_lock:
+            self.forwarded += 1
+        return True
+
+    def flush(self):
+        pass
+
+    def close(self):
+        # waits until the queue's feeder thread handed everything to the pipe
+        self.queue.close()
+        self.queue.join_thread()
+
+    def stats(self) -> dict:
+        with self._counters_lock:
+            return {
+                "forwarded": self.forwarded,
+                "dropped": self.dropped,
+            }
+
+
+_writer: Optional[LogWriter] = None
+_writer_lock = threading.Lock()
 
-        with open(new_log_name, "rb") as f_in, gzip.open(f"{new_log_name}.gz", "wb") as f_out:
-            shutil.copyfileobj(f_in, f_out)
 
-        os.remove(new_log_name)
+def _get_writer() -> LogWriter:
+    global _writer
+    writer = _writer
+    if writer is not None:
+        return writer
+    with _writer_lock:
+        if _writer is None:
+            rotator = LogRotator(
+                LOG_DIR,
+                BASE_LOG_FILE_NAME,
+                compress_level=LOG_COMPRESS_LEVEL,
+                retention_count=LOG_RETENTION_COUNT,
+                retention_size=LOG_RETENTION_SIZE,
+            )
+            register_collector("log_rotation", rotator.stats)
+            _writer = LogWriter(rotator=rotator)
+            register_collector("logger", _writer.stats)
+        return _writer
 
-        print(f"[LOGGER] Rotated and compressed log to: {new_log_name}.gz")
+
+def forward_logs(log_queue):
+    """
+    Sends every event of this process to log_queue instead of writing it.
+    Used by worker processes, must be called before the first event is logged.
+    """
+    global _writer
+    with _writer_lock:
+        _writer = QueueLogSink(log_queue)
+        register_collector("logger", _writer.stats)
+
+
+def write_log_entry(log_entry: dict) -> bool:
+    """
+    Hands an already built event to the log writer of this process.
+    """
+    return _get_writer().submit(log_entry)
+
+
+def close_logger():
+    """
+    Writes out all pending events and stops the log writer.
+    """
+    global _writer, _es_shipper
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        writer.close()
+
+    # the writer is stopped, nothing else can create or feed the shipper now
+    shipper, _es_shipper = _es_shipper, None
+    if shipper is not None:
+        shipper.close()
+
+
+atexit.register(close_logger)
 
 
 def log_event(event_id: str,
@@ -58,6 +294,7 @@ def log_event(event_id: str,
               command: str = None,
               message: str = None,
               response: str = None,
+              details: dict = None,
               ) -> None:
     """
     Logs an event in JSON format.
@@ -74,10 +311,9 @@ def log_event(event_id: str,
     :param command: input command
     :param message: message
     :param response: LLM response
+    :param details: additional structured fields (metrics, response source, ...)
     """
 
-    rotate_log()
-
     log_entry = {
         "timestamp": datetime.now().isoformat(timespec="seconds"),
         "event_type": event_id,
@@ -103,27 +339,36 @@ def log_event(event_id: str,
         log_entry["message"] = message
     if response is not None:
         log_entry["response"] = response
+    if details:
+        log_entry["details"] = details
 
-    log_json = json.dumps(log_entry)
-
-    with open(LOG_FILE, "a", encoding="utf-8") as f:
-        f.write(log_json + "\n")
-
-    print(log_json, file=sys.stdout)
-
-    send_to_elasticsearch(log_entry)
+    write_log_entry(log_entry)
 
 
 def send_to_elasticsearch(log_entry: dict):
-    if not ELK_ENABLED or es is None:
+    if not ELK_ENABLED:
         return
-    try:
-        print(f"[LOGGER] Sending to Elasticsearch: {log_entry}")
-        es.index(index=INDEX_NAME, document=log_entry)
-    except Exception as e:
-        print(f"[LOGGER] Failed to send log to Elasticsearch: {e}")
+    _get_es_shipper().submit(log_entry)
+
+
+def _get_es_shipper() -> ElasticsearchShipper:
+    global _es_shipper
+    if _es_shipper is None:
+        # only ever called from the log writer thread
+        _es_shipper = ElasticsearchShipper(
+            host=ES_HOST,
+            index=INDEX_NAME,
+            spool_path=ES_SPOOL_FILE,
+            batch_size=ES_BATCH_SIZE,
+            flush_interval=ES_FLUSH_INTERVAL,
+            max_retries=ES_MAX_RETRIES,
+            max_spool_size=ES_MAX_SPOOL_SIZE,
+        )
+        register_collector("elasticsearch", _es_shipper.stats)
+    return _es_shipper
 
 
 def clear_log_file():
+    close_logger()
     if os.path.exists(LOG_FILE):
         os.remove(LOG_FILE)
@@ -0,0 +1,33 @@
+import threading
+from typing import Callable, Dict
+
+_collectors: Dict[str, Callable[[], dict]] = {}
+_collectors_lock = threading.Lock()
+
+
+def register_collector(name: str, collector: Callable[[], dict]):
+    '''
+    registers a callable whose returned dict is included in every metrics snapshot
+    :param name: key of the collector's section in the snapshot
+    :param collector: callable returning the component's current counters
+    '''
+    with _collectors_lock:
+        _collectors[name] = collector
+
+
+def unregister_collector(name: str):
+    with _collectors_lock:
+        _collectors.pop(name, None)
+
+
+def collect_metrics() -> dict:
+    with _collectors_lock:
+        collectors = list(_collectors.items())
+
+    snapshot = {}
+    for name, collector in collectors:
+        try:
+            snapshot[name] = collector()
+        except Exception as e:
+            snapshot[name] = {"error": str(e)}
+    return snapshot
@@ -0,0 +1,83 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterator, List
+
+DEFAULT_POOL_SIZE = 4
+
+
+class ConnectionPool:
+    '''
+    bounded pool of SQLite connections shared by all session threads
+
+    Connections are opened on demand up to max_size and handed back after
+    each use, so the number of open connections (and file descriptors) does
+    not grow with the number of threads that ever read. A thread asking for
+    a connection while all of them are in use waits for one to be returned.
+    '''
+
+    def __init__(self, connect: Callable[[], sqlite3.Connection], max_size: int = DEFAULT_POOL_SIZE):
+        self._connect = connect
+        self.max_size = max_size
+
+        self._cv = threading.Condition()
+        self._idle: List[sqlite3.Connection] = []
+        self._open = 0
+        self._closed = False
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    @property
+    def size(self) -> int:
+        '''
+        number of open connections
+        '''
+        with self._cv:
+            return self._open
+
+    def _acquire(self) -> sqlite3.Connection:
+        with self._cv:
+            while True:
+                if self._closed:
+                    raise sqlite3.ProgrammingError("Cannot operate on a closed connection pool")
+                if self._idle:
+                    return self._idle.pop()
+                if self._open < self.max_size:
+                    self._open += 1
+                    break
+                self._cv.wait()
+
+        try:
+            return self._connect()
+        except BaseException:
+            with self._cv:
+                self._open -= 1
+                self._cv.notify()
+            raise
+
+    def _release(self, conn: sqlite3.Connection):
+        with self._cv:
+            if not self._closed:
+                self._idle.append(conn)
+                self._cv.notify()
+                return
+            self._open -= 1
+        conn.close()
+
+    def close(self):
+        '''
+        closes the idle connections; connections in use are closed when they are returned
+        '''
+        with self._cv:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+            self._cv.notify_all()
+        for conn in idle:
+            conn.close()
@@ -0,0 +1,328 @@
+import argparse
+import glob
+import gzip
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import Dict, Iterator, Optional, Tuple
+
+from LLM.response_cache import normalize_command
+from metrics.metrics import register_collector
+from store.connection_pool import DEFAULT_POOL_SIZE, ConnectionPool
+
+DEFAULT_CORPUS_PATH = "store/response_corpus.db"
+DEFAULT_LOG_DIR = "logs"
+DEFAULT_LOG_BASE_NAME = "leviathan"
+
+# responses kept per command, username and directory, most frequent first
+MAX_RESPONSES = 3
+MAX_OUTPUT_BYTES = 64 * 1024
+INDEX_BATCH_SIZE = 10000
+# stands in for the server address in stored outputs, filled in with the sensor's own at lookup
+SERVER_IP_PLACEHOLDER = "\x00server_ip\x00"
+
+# output and trailing prompt of a logged response, e.g. "Linux\r\nroot@10.0.0.1:~$ "
+RESPONSE_REGEX = re.compile(r"^(.*?)[^\s@]+@[^\s:]+:([^\r\n$]*)\$ ?$", re.DOTALL)
+# where an indexed response came from; builtin and canned answers are not worth keeping
+INDEXED_SOURCES = ("llm", "coalesced")
+# events after which a session's working directory is no longer needed
+SESSION_END_EVENTS = ("session_terminated", "session_disconnect", "session_reaped")
+
+
+def split_response(response: str) -> Optional[Tuple[str, str]]:
+    '''
+    :return: (output, working directory of the trailing prompt), or None if the response does not end with a prompt
+    '''
+    match = RESPONSE_REGEX.match(response)
+    if match is None:
+        return None
+    return match.group(1), match.group(2) or "~"
+
+
+class ResponseCorpus:
+    '''
+    read side of the on-disk corpus of responses built from past logs by CorpusIndexer
+
+    Responses are looked up by normalized command, username and working
+    directory; the stored output gets a prompt for the asking session.
+    '''
+
+    def __init__(self, db_path: str = DEFAULT_CORPUS_PATH, pool_size: int = DEFAULT_POOL_SIZE):
+        self.db_path = db_path
+        # sessions share a bounded pool, so connections do not pile up with session threads
+        self._pool = ConnectionPool(self._connect, pool_size)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+
+    def lookup(self, command: str, username: str, ssh_server_ip: str, cwd: str) -> Optional[str]:
+        '''
+        :return: the most frequent past response, formatted like an LLM response, or None
+        '''
+        try:
+            with self._pool.connection() as conn:
+                row = conn.execute(
+                    "SELECT output FROM responses WHERE command = ? AND username = ? AND cwd = ? "
+                    "ORDER BY hits DESC LIMIT 1",
+                    (normalize_command(command), username, cwd),
+                ).fetchone()
+        except sqlite3.Error as e:
+            # e.g. the indexer holding the write lock for too long; the LLM answers instead
+            print(f"[-] Response corpus lookup failed: {e}")
+            row = None
+
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        output = row[0].replace(SERVER_IP_PLACEHOLDER, ssh_server_ip)
+        return f"{output}{username}@{ssh_server_ip}:{cwd}$ "
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "connections": self._pool.size}
+
+    def close(self):
+        self._pool.close()
+
+
+class CorpusIndexer:
+    '''
+    builds the response corpus from the current and rotated (.gz) logs
+
+    Every command_input event answered by the LLM is counted by its normalized
+    command, username, working directory and output; only the max_responses
+    most frequent outputs of each command are kept. Indexing is incremental,
+    every log line is counted once however often the indexer runs, so it can
+    be run periodically (e.g. from cron).
+    '''
+
+    def __init__(self, db_path: str = DEFAULT_CORPUS_PATH, max_responses: int = MAX_RESPONSES,
+                 max_output_bytes: int = MAX_OUTPUT_BYTES):
+        self.db_path = db_path
+        self.max_responses = max_responses
+        self.max_output_bytes = max_output_bytes
+        # session id -> working directory after its last command, for events logged without their cwd
+        self._session_cwd: Dict[str, str] = {}
+
+        # rollback journal rather than WAL, so the honeypot can open the corpus read-only
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                command TEXT NOT NULL,
+                username TEXT NOT NULL,
+                cwd TEXT NOT NULL,
+                output_hash TEXT NOT NULL,
+                output TEXT NOT NULL,
+                hits INTEGER NOT NULL,
+                PRIMARY KEY (command, username, cwd, output_hash)
+            ) WITHOUT ROWID
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS indexed_files (
+                head TEXT PRIMARY KEY,
+                offset INTEGER NOT NULL,
+                complete INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(indexed_files)")}
+        if "complete" not in columns:
+            self.conn.execute("ALTER TABLE indexed_files ADD COLUMN complete INTEGER NOT NULL DEFAULT 0")
+        self.conn.commit()
+
+        self.stats: Counter = Counter()
+
+    def index_logs(self, log_dir: str = DEFAULT_LOG_DIR, base_name: str = DEFAULT_LOG_BASE_NAME) -> dict:
+        '''
+        indexes the rotated logs, oldest first, then the current one
+        :return: counters of this run
+        '''
+        rotated = sorted(glob.glob(os.path.join(log_dir, f"{base_name}_*.log.gz")) +
+                         glob.glob(os.path.join(log_dir, f"{base_name}_*.log")))
+        for path in rotated:
+            self.index_file(path)
+
+        current = os.path.join(log_dir, f"{base_name}.log")
+        if os.path.exists(current):
+            self.index_file(current)
+
+        self._prune()
+        return dict(self.stats)
+
+    def index_file(self, path: str):
+        '''
+        indexes the part of a log file not seen yet; files are recognized by their first
+        line, so the live log is read on where the last run stopped, also after it was
+        rotated and compressed. Rotated archives no longer change, once read to the end
+        they are skipped without decompressing them again
+        '''
+        archive = path.endswith(".gz")
+        opener = gzip.open if archive else open
+        with opener(path, "rb") as log_file:
+            first_line = log_file.readline()
+            if not first_line.endswith(b"\n"):
+                return
+            head = hashlib.sha1(first_line).hexdigest()
+            row = self.conn.execute("SELECT offset, complete FROM indexed_files WHERE head = ?", (head,)).fetchone()
+            if row is not None and row[1]:
+                self.stats["skipped_files"] += 1
+                return
+            offset = 0 if row is None else row[0]
+
+            log_file.seek(offset)
+            counts: Counter = Counter()
+            for line in self._complete_lines(log_file):
+                offset += len(line)
+                entry = self._parse(line)
+                if entry is not None:
+                    counts[entry] += 1
+                if len(counts) >= INDEX_BATCH_SIZE:
+                    self._store(counts)
+                    counts.clear()
+            self._store(counts)
+
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO indexed_files (head, offset, complete) VALUES (?, ?, ?) "
+                "ON CONFLICT (head) DO UPDATE SET offset = excluded.offset, complete = excluded.complete",
+                (head, offset, int(archive)),
+            )
+        self.stats["files"] += 1
+
+    @staticmethod
+    def _complete_lines(log_file) -> Iterator[bytes]:
+        for line in log_file:
+            # the writer may be in the middle of a line; it is picked up by the next run
+            if not line.endswith(b"\n"):
+                return
+            yield line
+
+    def _parse(self, line: bytes) -> Optional[Tuple[str, str, str, str]]:
+        '''
+        :return: (command, username, cwd, output) of an indexable event, or None
+        '''
+        try:
+            event = json.loads(line)
+        except ValueError:
+            self.stats["malformed_lines"] += 1
+            return None
+        event_type = event.get("event_type")
+        session_id = event.get("session_id")
+        if event_type == "session_start":
+            self._session_cwd[session_id] = "~"
+        elif event_type in SESSION_END_EVENTS:
+            self._session_cwd.pop(session_id, None)
+        if event_type != "command_input":
+            return None
+        self.stats["commands"] += 1
+
+        details = event.get("details") or {}
+        command = event.get("command")
+        response = event.get("response")
+        username = event.get("username")
+
+        parts = split_response(response) if isinstance(response, str) else None
+        # the directory the command ran in, which is what the honeypot looks up by; the
+        # trailing prompt shows the directory after it ran, e.g. after a cd
+        cwd = details.get("cwd", self._session_cwd.get(session_id))
+        if parts is not None and session_id is not None:
+            self._session_cwd[session_id] = parts[1]
+
+        # events logged before the source was recorded all came from the LLM
+        if details.get("source", "llm") not in INDEXED_SOURCES or details.get("exec") or details.get("degraded"):
+            return None
+        if not command or not username or parts is None or len(response) > self.max_output_bytes:
+            return None
+        if cwd is None:
+            # logged without its cwd and the session started before the indexed part of the log
+            self.stats["unknown_cwd"] += 1
+            return None
+        output = parts[0]
+
+        dst_ip = event.get("dst_ip")
+        prompt_ip = response[len(output):].split("@", 1)[1].split(":", 1)[0]
+        for ip in {prompt_ip, dst_ip} - {None}:
+            # only whole addresses, 10.0.0.1 must not be replaced inside 10.0.0.10
+            output = re.sub(rf"(?<![\d.]){re.escape(ip)}(?!\.?\d)", SERVER_IP_PLACEHOLDER, output)
+
+        self.stats["indexed"] += 1
+        return normalize_command(command), username, cwd, output
+
+    def _store(self, counts: Counter):
+        if not counts:
+            return
+        rows = [
+            (command, username, cwd, hashlib.sha1(output.encode()).hexdigest(), output, hits)
+            for (command, username, cwd, output), hits in counts.items()
+        ]
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO responses (command, username, cwd, output_hash, output, hits) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (command, username, cwd, output_hash) DO UPDATE SET hits = hits + excluded.hits",
+                rows,
+            )
+
+    def _prune(self):
+        '''
+        keeps the max_responses most frequent outputs of every command
+        '''
+        with self.conn:
+            deleted = self.conn.execute("""
+                DELETE FROM responses WHERE (command, username, cwd, output_hash) IN (
+                    SELECT command, username, cwd, output_hash FROM (
+                        SELECT command, username, cwd, output_hash, ROW_NUMBER() OVER (
+                            PARTITION BY command, username, cwd ORDER BY hits DESC
+                        ) AS rank FROM responses
+                    ) WHERE rank > ?
+                )
+            """, (self.max_responses,)).rowcount
+        self.stats["pruned"] += deleted
+        self.stats["entries"] = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+
+_corpora: Dict[str, Optional[ResponseCorpus]] = {}
+_corpora_lock = threading.Lock()
+
+
+def get_response_corpus(db_path: str) -> Optional[ResponseCorpus]:
+    '''
+    returns the process-wide corpus stored at db_path, or None if it has not been built yet
+    '''
+    with _corpora_lock:
+        if db_path not in _corpora:
+            corpus = None
+            if os.path.exists(db_path):
+                corpus = ResponseCorpus(db_path)
+                register_collector("response_corpus", corpus.stats)
+            else:
+                print(f"[-] Response corpus {db_path} not found, run python -m store.response_corpus to build it")
+            _corpora[db_path] = corpus
+        return _corpora[db_path]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Builds the response corpus from the current and rotated logs")
+    parser.add_argument('-l', '--logs', type=str, default=DEFAULT_LOG_DIR, help="Log directory")
+    parser.add_argument('-d', '--db', type=str, default=DEFAULT_CORPUS_PATH, help="Corpus database")
+    parser.add_argument('-n', '--max-responses', type=int, default=MAX_RESPONSES,
+                        help="Responses kept per command, username and directory")
+    args = parser.parse_args()
+
+    indexer = CorpusIndexer(args.db, max_responses=args.max_responses)
+    try:
+        print(f"[CORPUS] {indexer.index_logs(args.logs)}")
+    finally:
+        indexer.close()
@@ -1,56 +1,418 @@
 import sqlite3
 import threading
-from datetime import datetime, timedelta
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from metrics.metrics import register_collector
+from store.connection_pool import DEFAULT_POOL_SIZE, ConnectionPool
+
+# rough per-entry bookkeeping overhead used for the cache memory estimate
+CACHE_ENTRY_OVERHEAD = 64
+HISTORY_TTL = 3600
 
 
 class UserHistoryStore:
+    '''
+    SQLite backed history of the exchanges of every username
+
+    Writes are queued and committed in batches by a background writer thread
+    (write-behind), the database runs in WAL mode and reads use a bounded pool
+    of their own connections, so they do not wait for the writer. Histories of
+    recently seen usernames are kept in a bounded in-memory cache.
+
+    Expiry is an indexed epoch timestamp. Expired rows are deleted in small
+    batches which release the lock in between, every user keeps at most
+    max_rows_per_user rows, the live data is capped at max_db_size bytes and
+    freed pages are returned to the filesystem by incremental vacuum.
+    '''
 
-    def __init__(self, db_path = "store/user_history.db"):
+    def __init__(self,
+                 db_path = "store/user_history.db",
+                 batch_size: int = 500,
+                 flush_interval: float = 0.2,
+                 cache_max_users: int = 256,
+                 cache_max_bytes: int = 32 * 1024 * 1024,
+                 max_rows_per_user: int = 1000,
+                 max_db_size: int = 256 * 1024 * 1024,
+                 cleanup_batch_size: int = 500,
+                 cleanup_time_budget: float = 0.5,
+                 vacuum_pages: int = 1000,
+                 read_pool_size: int = DEFAULT_POOL_SIZE,
+                 ):
         self.db_path = db_path
-        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.max_rows_per_user = max_rows_per_user
+        self.max_db_size = max_db_size
+        self.cleanup_batch_size = cleanup_batch_size
+        self.cleanup_time_budget = cleanup_time_budget
+        self.vacuum_pages = vacuum_pages
+        self.expired_deleted = 0
+        self.capped_deleted = 0
+        self.vacuumed_pages = 0
+
+        self.cache_max_users = cache_max_users
+        self.cache_max_bytes = cache_max_bytes
+        # username -> [bytes, [(role, message, expire_at), ...]]
+        self._cache: "OrderedDict[str, list]" = OrderedDict()
+        self._cache_bytes = 0
+        self._cache_lock = threading.Lock()
+        # username -> [loads in flight, writes since the first of them started]; lets a
+        # load tell whether it raced with a write, only holds users being loaded
+        self._loading: Dict[str, List[int]] = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_evictions = 0
+
+        # writer connection, also used for maintenance
+        self.conn = self._connect()
         self.lock = threading.Lock()
+
+        self._pending: List[Tuple] = []
+        self._pending_users: Counter = Counter()
+        self._in_flight = 0
+        self._pending_cv = threading.Condition()
+        self._closed = False
+
+        # readers share a bounded pool, so connections do not pile up with session threads
+        self._read_pool = ConnectionPool(self._connect, read_pool_size)
+
         self._create_tables()
 
+        self._writer = threading.Thread(target=self._write_loop, name="history-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=10)
+        # only takes effect on a new database, existing ones are switched by _migrate
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
     def _create_tables(self):
         with self.lock:
             cursor = self.conn.cursor()
+            columns = {row[1]: row[2] for row in cursor.execute("PRAGMA table_info(history)")}
+            if columns.get("expire_at", "REAL").upper() != "REAL":
+                self._migrate()
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS history (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT, 
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
                     username TEXT NOT NULL,
                     role TEXT NOT NULL,
                     message TEXT NOT NULL,
-                    expire_at TEXT
+                    expire_at REAL
                 )
             """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_history_username ON history (username, id)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_history_expire_at ON history (expire_at)")
             self.conn.commit()
 
+    def _migrate(self):
+        '''
+        rebuilds a database with ISO text expiry timestamps into the numeric schema;
+        expects the lock to be held
+        '''
+        print("[-] Migrating user history store to numeric expiry timestamps")
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE history_migrated (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    username TEXT NOT NULL,
+                    role TEXT NOT NULL,
+                    message TEXT NOT NULL,
+                    expire_at REAL
+                )
+            """)
+            # the old timestamps were naive local times
+            self.conn.execute("""
+                INSERT INTO history_migrated (id, username, role, message, expire_at)
+                SELECT id, username, role, message, CAST(strftime('%s', expire_at, 'utc') AS REAL)
+                FROM history
+            """)
+            self.conn.execute("DROP TABLE history")
+            self.conn.execute("ALTER TABLE history_migrated RENAME TO history")
+        # rewrites the file so the auto_vacuum mode applies to the existing database
+        self.conn.execute("VACUUM")
+
     def add_to_user_history(self, username, data):
-        expire_at = (datetime.now() + timedelta(hours=1)).isoformat()
+        '''
+        queues entries for the writer thread; they are visible to load_user_history immediately
+        '''
+        expire_at = time.time() + HISTORY_TTL
+        rows = [(username, entry["role"], entry["message"], expire_at) for entry in data]
+        if not rows:
+            return
+        rows = rows[-self.max_rows_per_user:]
+
+        with self._cache_lock:
+            loading = self._loading.get(username)
+            if loading is not None:
+                loading[1] += 1
+            cached = self._cache.get(username)
+            if cached is not None:
+                entries = [(role, message, expire) for _, role, message, expire in rows]
+                cached[1].extend(entries)
+                delta = self._entries_size(entries)
+                overflow = len(cached[1]) - self.max_rows_per_user
+                if overflow > 0:
+                    delta -= self._entries_size(cached[1][:overflow])
+                    del cached[1][:overflow]
+                self._resize_cached(username, cached, delta)
+
+        with self._pending_cv:
+            self._pending.extend(rows)
+            self._pending_users[username] += len(rows)
+            self._pending_cv.notify_all()
+
+    def flush(self):
+        '''
+        blocks until every queued entry has been committed
+        '''
+        with self._pending_cv:
+            while (self._pending or self._in_flight) and self._writer.is_alive():
+                self._pending_cv.wait(self.flush_interval)
+
+    def _write_loop(self):
+        while True:
+            with self._pending_cv:
+                while not self._pending and not self._closed:
+                    self._pending_cv.wait()
+                if not self._pending and self._closed:
+                    return
+                batch = self._pending[:self.batch_size]
+                del self._pending[:self.batch_size]
+                self._in_flight = len(batch)
+
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                print(f"[-] History write error: {e}")
+            finally:
+                with self._pending_cv:
+                    for username, *_ in batch:
+                        self._pending_users[username] -= 1
+                        if self._pending_users[username] <= 0:
+                            del self._pending_users[username]
+                    self._in_flight = 0
+                    self._pending_cv.notify_all()
+
+    def _write_batch(self, batch: List[Tuple]):
         with self.lock:
-            for entry in data:
-                self.conn.execute("""
+            with self.conn:
+                self.conn.executemany("""
                     INSERT INTO history (username, role, message, expire_at)
                     VALUES (?, ?, ?, ?)
-                """, (username, entry["role"], entry["message"], expire_at))
-            self.conn.commit()
+                """, batch)
+                # keep the per-user cap exact, the username index makes this cheap
+                for username in {row[0] for row in batch}:
+                    cursor = self.conn.execute("""
+                        DELETE FROM history WHERE username = ? AND id <= (
+                            SELECT id FROM history WHERE username = ? ORDER BY id DESC LIMIT 1 OFFSET ?
+                        )
+                    """, (username, username, self.max_rows_per_user))
+                    self.capped_deleted += max(cursor.rowcount, 0)
 
     def load_user_history(self, username):
+        now = time.time()
+
+        with self._cache_lock:
+            cached = self._cache.get(username)
+            if cached is not None:
+                self.cache_hits += 1
+                self._cache.move_to_end(username)
+                entries = self._drop_expired(username, cached, now)
+                return [{"role": role, "message": message} for role, message, _ in entries]
+            self.cache_misses += 1
+            self._loading.setdefault(username, [0, 0])[0] += 1
+            version = self._loading[username][1]
+
+        with self._pending_cv:
+            has_pending = username in self._pending_users
+        if has_pending:
+            # read your own writes
+            self.flush()
+
+        try:
+            with self._read_pool.connection() as conn:
+                entries = conn.execute("""
+                    SELECT role, message, expire_at FROM history
+                    WHERE username = ? AND (expire_at IS NULL OR expire_at > ?)
+                    ORDER BY id
+                """, (username, now)).fetchall()
+        except Exception:
+            with self._cache_lock:
+                self._end_load(username)
+            raise
+
+        with self._cache_lock:
+            # only cache what was read if no write for this user slipped in meanwhile
+            if self._end_load(username) == version and username not in self._cache:
+                cached = [0, list(entries)]
+                self._cache[username] = cached
+                self._resize_cached(username, cached, self._entries_size(entries))
+
+        return [{"role": role, "message": message} for role, message, _ in entries]
+
+    def _end_load(self, username) -> int:
+        '''
+        expects the cache lock to be held
+        :return: number of writes for the user since the first load in flight started
+        '''
+        loading = self._loading[username]
+        loading[0] -= 1
+        if not loading[0]:
+            del self._loading[username]
+        return loading[1]
+
+    def cleanup(self) -> int:
+        '''
+        deletes expired rows and enforces the size cap in batches, releasing the lock
+        between batches so history writes are never blocked for long; stops after
+        cleanup_time_budget seconds and picks up the rest on the next run
+        :return: number of deleted rows
+        '''
+        now = time.time()
+        deadline = time.monotonic() + self.cleanup_time_budget
+        with self._cache_lock:
+            for username, cached in list(self._cache.items()):
+                self._drop_expired(username, cached, now)
+
+        deleted = 0
+        while time.monotonic() < deadline:
+            count = self._delete_batch("""
+                DELETE FROM history WHERE id IN (
+                    SELECT id FROM history WHERE expire_at <= ? ORDER BY expire_at LIMIT ?
+                )
+            """, (now, self.cleanup_batch_size))
+            deleted += count
+            self.expired_deleted += count
+            if count < self.cleanup_batch_size:
+                break
+
+        trimmed = False
+        while time.monotonic() < deadline and self._live_size() > self.max_db_size:
+            count = self._delete_batch("""
+                DELETE FROM history WHERE id IN (SELECT id FROM history ORDER BY id LIMIT ?)
+            """, (self.cleanup_batch_size,))
+            if not count:
+                break
+            deleted += count
+            self.capped_deleted += count
+            trimmed = True
+        if trimmed:
+            # the oldest rows of any user may be gone, cached histories are no longer exact
+            with self._cache_lock:
+                self._cache.clear()
+                self._cache_bytes = 0
+
+        self._incremental_vacuum()
+        return deleted
+
+    def _delete_batch(self, query: str, params: Tuple) -> int:
         with self.lock:
-            now = datetime.now().isoformat()
-            cursor = self.conn.execute("""
-                SELECT role, message FROM history
-                WHERE username = ? AND (expire_at IS NULL OR expire_at > ?)
-                ORDER BY id
-            """, (username, now))
-            return [{"role": role, "message": message} for role, message in cursor.fetchall()]
-
-    def cleanup(self):
+            with self.conn:
+                return max(self.conn.execute(query, params).rowcount, 0)
+
+    def _live_size(self) -> int:
         with self.lock:
-            now = datetime.now().isoformat()
-            self.conn.execute("DELETE FROM history WHERE expire_at IS NOT NULL AND expire_at <= ?", (now,))
-            self.conn.commit()
+            page_count = self.conn.execute("PRAGMA page_count").fetchone()[0]
+            free_pages = self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+            page_size = self.conn.execute("PRAGMA page_size").fetchone()[0]
+        return (page_count - free_pages) * page_size
+
+    def _incremental_vacuum(self):
+        with self.lock:
+            free_pages = self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if free_pages:
+                self.conn.execute(f"PRAGMA incremental_vacuum({min(free_pages, self.vacuum_pages)})").fetchall()
+                self.vacuumed_pages += min(free_pages, self.vacuum_pages)
+
+    def maintenance_stats(self) -> dict:
+        with self.lock:
+            rows = self.conn.execute("SELECT COUNT(*) FROM history").fetchone()[0]
+            page_count = self.conn.execute("PRAGMA page_count").fetchone()[0]
+            page_size = self.conn.execute("PRAGMA page_size").fetchone()[0]
+        return {
+            "rows": rows,
+            "file_bytes": page_count * page_size,
+            "expired_deleted": self.expired_deleted,
+            "capped_deleted": self.capped_deleted,
+            "vacuumed_pages": self.vacuumed_pages,
+            "read_connections": self._read_pool.size,
+        }
+
+    def cache_stats(self) -> dict:
+        with self._cache_lock:
+            lookups = self.cache_hits + self.cache_misses
+            return {
+                "users": len(self._cache),
+                "entries": sum(len(cached[1]) for cached in self._cache.values()),
+                "bytes": self._cache_bytes,
+                "hits": self.cache_hits,
+                "misses": self.cache_misses,
+                "hit_rate": round(self.cache_hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.cache_evictions,
+            }
+
+    @staticmethod
+    def _entries_size(entries) -> int:
+        return sum(len(role) + len(message) + CACHE_ENTRY_OVERHEAD for role, message, _ in entries)
+
+    def _drop_expired(self, username, cached, now):
+        '''
+        removes expired entries from a cached history; expects the cache lock to be held
+        '''
+        entries = cached[1]
+        live = [entry for entry in entries if entry[2] is None or entry[2] > now]
+        if len(live) != len(entries):
+            cached[1] = live
+            self._resize_cached(username, cached, self._entries_size(live) - cached[0])
+        return live
+
+    def _resize_cached(self, username, cached, delta: int):
+        '''
+        accounts for a size change of a cached history and evicts the least recently
+        used users while over the limits; expects the cache lock to be held
+        '''
+        cached[0] += delta
+        self._cache_bytes += delta
+        self._cache.move_to_end(username)
+        while self._cache and (len(self._cache) > self.cache_max_users or self._cache_bytes > self.cache_max_bytes):
+            _, evicted = self._cache.popitem(last=False)
+            self._cache_bytes -= evicted[0]
+            self.cache_evictions += 1
 
     def close(self):
+        with self._pending_cv:
+            if self._closed:
+                return
+            self._closed = True
+            self._pending_cv.notify_all()
+        self._writer.join()
+
+        self._read_pool.close()
+
         with self.lock:
-            self.conn.close()
\ No newline at end of file
+            self.conn.close()
+
+
+_shared_store: Optional[UserHistoryStore] = None
+_shared_store_lock = threading.Lock()
+
+
+def get_user_history_store(**options) -> UserHistoryStore:
+    '''
+    returns the process-wide store shared by all sessions
+    :param options: UserHistoryStore arguments, only used by the call creating the store
+    '''
+    global _shared_store
+    with _shared_store_lock:
+        if _shared_store is None:
+            _shared_store = UserHistoryStore(**options)
+            register_collector("history_cache", _shared_store.cache_stats)
+            register_collector("history_store", _shared_store.maintenance_stats)
+        return _shared_store
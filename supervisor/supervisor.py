@@ -0,0 +1,170 @@
+import multiprocessing
+import queue
+import signal
+import sys
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from logger.logger import forward_logs, log_event, write_log_entry
+from metrics.metrics import register_collector
+
+LOG_QUEUE_SIZE = 50000
+
+
+def _worker_main(worker_id: int, log_queue, target: Callable, args: Tuple):
+    '''
+    entry point of a worker process; its log events go to the supervisor
+    '''
+    # the supervisor decides when workers stop; exiting normally on SIGTERM runs
+    # the atexit hooks, which flush pending history writes and log events
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    forward_logs(log_queue)
+    print(f"[SUPERVISOR] Worker {worker_id} started")
+    target(*args)
+
+
+class Supervisor:
+    '''
+    runs the server in several worker processes and restarts the ones that die
+
+    Workers are forked from a fork server, a fresh interpreter, so they never
+    inherit the supervisor's threads or the locks they hold. Every worker
+    binds the same port with SO_REUSEPORT and the kernel spreads incoming
+    connections across them. Log events of all workers are written by the
+    supervisor, so there is a single log file, rotator and Elasticsearch shipper.
+    '''
+
+    def __init__(self,
+                 workers: int,
+                 target: Callable,
+                 args: Tuple = (),
+                 restart_backoff: float = 1.0,
+                 max_restart_backoff: float = 30.0,
+                 stable_after: float = 60.0,
+                 ):
+        '''
+        :param workers: number of worker processes
+        :param target: picklable function run by every worker, must listen with SO_REUSEPORT
+        :param args: arguments of target
+        :param restart_backoff: initial delay before restarting a crashed worker
+        :param max_restart_backoff: upper bound of the doubling restart delay
+        :param stable_after: seconds of uptime after which a worker's backoff is reset
+        '''
+        self.workers = workers
+        self.target = target
+        self.args = args
+        self.restart_backoff = restart_backoff
+        self.max_restart_backoff = max_restart_backoff
+        self.stable_after = stable_after
+
+        self._context = multiprocessing.get_context("forkserver")
+        self.log_queue = self._context.Queue(maxsize=LOG_QUEUE_SIZE)
+
+        self._processes: Dict[int, multiprocessing.Process] = {}
+        self._started_at: Dict[int, float] = {}
+        self._backoff: Dict[int, float] = {}
+        self._restart_at: Dict[int, float] = {}
+        self._stopped = threading.Event()
+        self._forwarder: Optional[threading.Thread] = None
+
+        self.restarts = 0
+
+    def run(self):
+        '''
+        starts the workers and supervises them until stop() is called or SIGTERM/SIGINT is received
+        '''
+        self._forwarder = threading.Thread(target=self._forward_logs, name="log-forwarder", daemon=True)
+        self._forwarder.start()
+        register_collector("supervisor", self.stats)
+
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda *_: self.stop())
+
+        for worker_id in range(self.workers):
+            self._start_worker(worker_id)
+
+        try:
+            while not self._stopped.wait(0.5):
+                self._check_workers()
+        except KeyboardInterrupt:
+            self.stop()
+        finally:
+            self._shutdown()
+
+    def stop(self):
+        self._stopped.set()
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "alive": sum(1 for process in list(self._processes.values()) if process.is_alive()),
+            "restarts": self.restarts,
+        }
+
+    def _start_worker(self, worker_id: int):
+        process = self._context.Process(
+            target=_worker_main,
+            args=(worker_id, self.log_queue, self.target, self.args),
+            name=f"leviathan-worker-{worker_id}",
+        )
+        process.start()
+        self._processes[worker_id] = process
+        self._started_at[worker_id] = time.monotonic()
+        self._restart_at.pop(worker_id, None)
+
+    def _check_workers(self):
+        now = time.monotonic()
+        for worker_id, process in list(self._processes.items()):
+            if process.is_alive():
+                if now - self._started_at[worker_id] >= self.stable_after:
+                    self._backoff.pop(worker_id, None)
+                continue
+
+            if worker_id not in self._restart_at:
+                # a worker crashing right after start backs off exponentially
+                delay = self._backoff.get(worker_id, self.restart_backoff / 2) * 2
+                delay = min(delay, self.max_restart_backoff)
+                self._backoff[worker_id] = delay
+                self._restart_at[worker_id] = now + delay
+
+                print(f"[SUPERVISOR] Worker {worker_id} (pid {process.pid}) exited with code {process.exitcode}, "
+                      f"restarting in {delay:.1f}s")
+                log_event(
+                    event_id="worker_exit",
+                    session_id=None,
+                    details={"worker": worker_id, "pid": process.pid, "exit_code": process.exitcode,
+                             "restart_in": delay},
+                )
+            elif now >= self._restart_at[worker_id]:
+                self.restarts += 1
+                self._start_worker(worker_id)
+                process.close()
+
+    def _forward_logs(self):
+        while True:
+            log_entry = self.log_queue.get()
+            if log_entry is None:
+                return
+            write_log_entry(log_entry)
+
+    def _shutdown(self):
+        print("[SUPERVISOR] Stopping workers")
+        for process in self._processes.values():
+            if process.is_alive():
+                process.terminate()
+        for process in self._processes.values():
+            process.join(timeout=5)
+            if process.is_alive():
+                process.kill()
+                process.join()
+
+        # everything the workers logged is in the queue now, let the forwarder write it out
+        try:
+            self.log_queue.put(None, timeout=5)
+        except queue.Full:
+            pass
+        if self._forwarder is not None:
+            self._forwarder.join(timeout=10)
@@ -1,3 +1,4 @@
+import json
 import os
 import tempfile
 import unittest
@@ -6,6 +7,8 @@ from unittest.mock import patch, MagicMock
 import yaml
 
 from LLM.LLM_integration import LLMHoneypot
+from LLM.scheduler import LLMScheduler, SchedulerOverloaded
+from store.response_corpus import CorpusIndexer
 from store.user_history_store import UserHistoryStore
 from config_parser.config_parser import load_config_file
 from tests.mock_config_data import get_mock_config, get_mock_ollama_config
@@ -84,6 +87,237 @@ class TestLLMHoneypotIntegration(unittest.TestCase):
         self.assertIn("ollama output", output)
         self.assertIn("user@host", output)
 
+    @patch("LLM.LLM_integration.requests.Session.post")
+    def test_sessions_share_provider_client(self, mock_post):
+        mock_response = MagicMock()
+        mock_response.json.return_value = {"choices": [{"message": {"content": "mock\r\nuser@host:~$ "}}]}
+        mock_post.return_value = mock_response
+
+        user_history = UserHistoryStore("store/test_user_history.db")
+        first = LLMHoneypot(username="Test", ssh_server_ip="127.0.0.1", config=self.loaded_config, history_store=user_history)
+        second = LLMHoneypot(username="Other", ssh_server_ip="127.0.0.1", config=self.loaded_config, history_store=user_history)
+
+        self.assertIs(first.session, second.session)
+
+        first.execute_model("ls")
+        self.assertIsNotNone(mock_post.call_args.kwargs["timeout"])
+
+    @patch("LLM.LLM_integration.requests.Session.post")
+    def test_execute_model_streaming(self, mock_post):
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.iter_lines.return_value = [
+            b'data: {"choices": [{"delta": {"content": "\\nline1\\n"}}]}',
+            b'',
+            b'data: {"choices": [{"delta": {"content": "line2\\nuser@host:~$ "}}]}',
+            b'data: [DONE]',
+        ]
+        mock_post.return_value = mock_response
+
+        self.loaded_config["llm_config"]["stream"] = True
+        user_history = UserHistoryStore("store/test_user_history.db")
+        honeypot = LLMHoneypot(username="Test", ssh_server_ip="127.0.0.1", config=self.loaded_config, history_store=user_history)
+
+        chunks = []
+        output = honeypot.execute_model("ls", on_chunk=chunks.append)
+
+        self.assertEqual(chunks, ["line1\r\n", "line2\r\nuser@host:~$ "])
+        self.assertEqual(output, "line1\r\nline2\r\nuser@host:~$ ")
+        self.assertEqual(honeypot.histories[-1].content, output)
+        self.assertTrue(mock_post.call_args.kwargs["json"]["stream"])
+
+    @patch("LLM.LLM_integration.requests.Session.post")
+    def test_execute_model_cache_hit(self, mock_post):
+        mock_response = MagicMock()
+        mock_response.json.return_value = {"choices": [{"message": {"content": "Linux\r\nCached@127.0.0.1:~$ "}}]}
+        mock_post.return_value = mock_response
+
+        self.loaded_config["llm_config"]["responseCache"] = {"enabled": True}
+        user_history = UserHistoryStore("store/test_user_history.db")
+        first = LLMHoneypot(username="Cached", ssh_server_ip="127.0.0.1", config=self.loaded_config, history_store=user_history)
+        second = LLMHoneypot(username="Cached", ssh_server_ip="127.0.0.1", config=self.loaded_config, history_store=user_history)
+        first.response_cache.clear()
+
+        first.execute_model("uname -a")
+        output = second.execute_model("uname  -a")
+
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertIn("Linux", output)
+        self.assertEqual(second.last_call["source"], "cache")
+        self.assertEqual(second.histories[-1].content, output)
+
+    @patch("LLM.LLM_integration.requests.Session.post")
+    def test_execute_model_fails_over_to_fallback_provider(self, mock_post):
+        failed = MagicMock()
+        failed.json.return_value = {"error": {"message": "Rate limit reached"}}
+        answered = MagicMock()
+        answered.json.return_value = {"message": {"role": "assistant", "content": "fallback\r\nuser@host:~$ "}}
+        mock_post.side_effect = lambda url, **kwargs: answered if url == LLMHoneypot.OLLAMA_ENDPOINT else failed
+
+        self.loaded_config["llm_config"]["fallbackProviders"] = [{"llmProvider": "ollama", "llmModel": "failover-test"}]
+        user_history = UserHistoryStore("store/test_user_history.db")
+        honeypot = LLMHoneypot(username="Test", ssh_server_ip="127.0.0.1", config=self.loaded_config, history_store=user_history)
+
+        output = honeypot.execute_model("failover test")
+
+        self.assertIn("fallback", output)
+        self.assertEqual(honeypot.last_call["routing"]["provider"], "ollama:failover-test")
+
+    @patch("LLM.LLM_integration.requests.Session.post")
+    def test_execute_model_degrades_when_overloaded(self, mock_post):
+        self.loaded_config["llm_config"]["overload"] = {"enabled": True}
+        user_history = UserHistoryStore("store/test_user_history.db")
+        honeypot = LLMHoneypot(username="Test", ssh_server_ip="127.0.0.1", config=self.loaded_config, history_store=user_history)
+
+        with patch.object(honeypot.overload, "should_degrade", return_value=True):
+            template = honeypot.execute_model("nproc")
+            self.assertEqual(honeypot.last_call, {"source": "template", "degraded": True})
+            unknown = honeypot.execute_model("./xmrig --donate-level 1")
+
+        mock_post.assert_not_called()
+        self.assertEqual(template, "2\r\nTest@127.0.0.1:~$ ")
+        self.assertEqual(unknown, "./xmrig: command not found\r\nTest@127.0.0.1:~$ ")
+        self.assertEqual(honeypot.last_call["source"], "not_found")
+        self.assertEqual(honeypot.histories[-1].content, unknown)
+
+    @patch("LLM.LLM_integration.requests.Session.post")
+    def test_execute_model_degrades_when_rejected_by_scheduler(self, mock_post):
+        user_history = UserHistoryStore("store/test_user_history.db")
+        honeypot = LLMHoneypot(username="Test", ssh_server_ip="127.0.0.1", config=self.loaded_config, history_store=user_history)
+        honeypot.scheduler = MagicMock()
+        honeypot.scheduler.acquire.side_effect = SchedulerOverloaded("LLM request queue is full (256 waiting)")
+
+        output = honeypot.execute_model("./rejected --by-scheduler")
+        results = honeypot.execute_batch(["nproc", "./dropper"])
+
+        mock_post.assert_not_called()
+        self.assertIsNone(honeypot.overload)
+        self.assertEqual(output, "./rejected: command not found\r\nTest@127.0.0.1:~$ ")
+        self.assertEqual([response for response, _ in results],
+                         ["2\r\nTest@127.0.0.1:~$ ", "./dropper: command not found\r\nTest@127.0.0.1:~$ "])
+        self.assertEqual(results[1][1], {"source": "not_found", "degraded": True, "batch_size": 2})
+
+    def test_hedges_are_charged_to_the_scheduler(self):
+        user_history = UserHistoryStore("store/test_user_history.db")
+        honeypot = LLMHoneypot(username="Test", ssh_server_ip="127.0.0.1", config=self.loaded_config, history_store=user_history)
+        honeypot.scheduler = LLMScheduler(requests_per_second=1, burst=1)
+        admitted = []
+
+        def call(fn, hedge, admit_hedge):
+            admitted.append(admit_hedge())
+            return "4\r\nTest@127.0.0.1:~$ ", {"provider": "grok", "attempts": [], "hedged": False}
+
+        honeypot.router = MagicMock()
+        honeypot.router.call.side_effect = call
+        honeypot.execute_model("nproc")
+
+        # the burst went to the request itself, the hedge would exceed the rate limit
+        self.assertEqual(admitted, [False])
+        self.assertEqual(honeypot.scheduler.stats()["declined"], 1)
+
+    @patch("LLM.LLM_integration.requests.Session.post")
+    def test_execute_model_answers_from_corpus(self, mock_post):
+        log_dir = tempfile.mkdtemp()
+        with open(os.path.join(log_dir, "leviathan.log"), "w") as f:
+            f.write(json.dumps({"event_type": "command_input", "username": "Test", "command": "cat /proc/loadavg",
+                                "response": "0.08 0.03 0.01 1/96 1862\r\nTest@10.0.0.1:~$ ",
+                                "details": {"source": "llm", "cwd": "~"}}) + "\n")
+        corpus_path = os.path.join(log_dir, "corpus.db")
+        indexer = CorpusIndexer(corpus_path)
+        indexer.index_logs(log_dir)
+        indexer.close()
+
+        self.loaded_config["llm_config"]["responseCorpus"] = {"enabled": True, "path": corpus_path}
+        user_history = UserHistoryStore("store/test_user_history.db")
+        honeypot = LLMHoneypot(username="Test", ssh_server_ip="127.0.0.1", config=self.loaded_config, history_store=user_history)
+
+        output = honeypot.execute_model("cat /proc/loadavg")
+
+        mock_post.assert_not_called()
+        self.assertEqual(output, "0.08 0.03 0.01 1/96 1862\r\nTest@127.0.0.1:~$ ")
+        self.assertEqual(honeypot.last_call["source"], "corpus")
+
+    @patch("LLM.LLM_integration.requests.Session.post")
+    def test_execute_batch(self, mock_post):
+        mock_response = MagicMock()
+        mock_response.json.return_value = {"choices": [{"message": {"content": (
+            '```json\n["\\nTest@127.0.0.1:/tmp$ ", "bash: ./x: Permission denied\\nTest@127.0.0.1:/tmp$ "]\n```'
+        )}}]}
+        mock_post.return_value = mock_response
+
+        user_history = UserHistoryStore("store/test_user_history.db")
+        honeypot = LLMHoneypot(username="Test", ssh_server_ip="127.0.0.1", config=self.loaded_config, history_store=user_history)
+
+        results = honeypot.execute_batch(["cd /tmp", "./x"])
+
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertEqual([response for response, _ in results],
+                         ["Test@127.0.0.1:/tmp$ ", "bash: ./x: Permission denied\r\nTest@127.0.0.1:/tmp$ "])
+        self.assertEqual(results[1][1]["batch_size"], 2)
+        self.assertEqual([message.content for message in honeypot.histories[-4:]],
+                         ["cd /tmp", results[0][0], "./x", results[1][0]])
+
+    @patch("LLM.LLM_integration.requests.Session.post")
+    def test_execute_batch_answers_known_commands_without_the_llm(self, mock_post):
+        self.loaded_config["llm_config"]["responseCache"] = {"enabled": True}
+        mock_response = MagicMock()
+        mock_response.json.return_value = {"choices": [{"message": {"content": (
+            '["batch-cached-a\\nTest@127.0.0.1:~$ ", "batch-cached-c\\nTest@127.0.0.1:~$ "]'
+        )}}]}
+        mock_post.return_value = mock_response
+
+        user_history = UserHistoryStore("store/test_user_history.db")
+        first = LLMHoneypot(username="Test", ssh_server_ip="127.0.0.1", config=self.loaded_config, history_store=user_history)
+        first.response_cache.put(("echo batch-b", "Test", "127.0.0.1", "~"), "batch-cached-b\r\nTest@127.0.0.1:~$ ")
+        results = first.execute_batch(["echo batch-a", "echo batch-b", "echo batch-c"])
+
+        self.assertEqual(mock_post.call_count, 1)
+        prompt = mock_post.call_args.kwargs["json"]["messages"][-1]["content"]
+        self.assertIn('2. echo batch-b\n   answered: "batch-cached-b', prompt)
+        self.assertIn("JSON array of 2 strings", prompt)
+        self.assertEqual([details["source"] for _, details in results], ["batch", "cache", "batch"])
+
+        # the same script pasted again is answered from the cache alone
+        second = LLMHoneypot(username="Test", ssh_server_ip="127.0.0.1", config=self.loaded_config, history_store=user_history)
+        results = second.execute_batch(["echo batch-a", "echo batch-b", "echo batch-c"])
+
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertEqual([response for response, _ in results], [
+            "batch-cached-a\r\nTest@127.0.0.1:~$ ",
+            "batch-cached-b\r\nTest@127.0.0.1:~$ ",
+            "batch-cached-c\r\nTest@127.0.0.1:~$ ",
+        ])
+        self.assertEqual({details["source"] for _, details in results}, {"cache"})
+
+    @patch("LLM.LLM_integration.requests.Session.post")
+    def test_execute_batch_with_unusable_answer(self, mock_post):
+        mock_response = MagicMock()
+        mock_response.json.return_value = {"choices": [{"message": {"content": "Test@127.0.0.1:~$ "}}]}
+        mock_post.return_value = mock_response
+
+        user_history = UserHistoryStore("store/test_user_history.db")
+        honeypot = LLMHoneypot(username="Test", ssh_server_ip="127.0.0.1", config=self.loaded_config, history_store=user_history)
+        history_length = len(honeypot.histories)
+
+        self.assertIsNone(honeypot.execute_batch(["nproc", "arch"]))
+        self.assertEqual(len(honeypot.histories), history_length)
+
+    def test_session_history_is_capped(self):
+        self.loaded_config["llm_config"]["sessionHistoryMaxBytes"] = 4096
+        user_history = UserHistoryStore("store/test_user_history.db")
+        honeypot = LLMHoneypot(username="Capped", ssh_server_ip="127.0.0.1", config=self.loaded_config, history_store=user_history)
+
+        for i in range(100):
+            honeypot.record_exchange(f"cat file{i}", "x" * 100 + f"\r\nCapped@127.0.0.1:/tmp{i}$ ", "builtin")
+
+        size = sum(len(message.content) for message in honeypot.histories)
+        self.assertLessEqual(size, 4096)
+        self.assertGreater(honeypot.history_trimmed, 0)
+        self.assertEqual(honeypot.histories[0], honeypot.sys_prompt_message)
+        self.assertEqual(honeypot.histories[1].role, "user")
+        self.assertEqual(honeypot.histories[-2].content, "cat file99")
+        self.assertEqual(honeypot.current_directory(), "/tmp99")
+
 
 if __name__ == '__main__':
     unittest.main()
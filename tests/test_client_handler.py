@@ -0,0 +1,52 @@
+import unittest
+from unittest.mock import patch
+
+from client_handling.authenticator import FailedLoginAggregator
+from client_handling.client_handler import ClientHandler
+
+
+class TestClientHandler(unittest.TestCase):
+    def setUp(self):
+        self.client_config = {"password_regex": "^root$", "failed_login_aggregation": {"enabled": False}}
+        with patch("client_handling.client_handler.log_event"):
+            self.handler = ClientHandler("10.0.0.1", 40000, None, "10.0.0.2", 22, config=self.client_config)
+
+    def test_session_timing_logged_once(self):
+        with patch("client_handling.client_handler.log_event") as mock_log:
+            self.handler.check_auth_password("root", "root")
+            self.handler.check_channel_request("session", 0)
+            self.handler.check_channel_shell_request(None)
+            self.handler._on_shell_ready()
+            self.handler.log_timing()
+
+        self.assertTrue(self.handler.event.is_set())
+        timing_events = [call for call in mock_log.call_args_list if call.kwargs["event_id"] == "session_timing"]
+        self.assertEqual(len(timing_events), 1)
+        phases = timing_events[0].kwargs["details"]["phases_ms"]
+        self.assertEqual(list(phases), ["auth", "channel_open", "shell_request", "first_prompt"])
+
+    def test_failed_logins_aggregated(self):
+        aggregator = FailedLoginAggregator(scope="session", max_credentials=2)
+        self.handler.failed_logins = aggregator
+
+        with patch("client_handling.client_handler.log_event") as handler_log, \
+                patch("client_handling.authenticator.log_event") as summary_log:
+            for password in ("123456", "admin", "123456", "letmein"):
+                self.handler.check_auth_password("root", password)
+            self.handler.check_auth_password("root", "root")
+            self.handler.end_session()
+            aggregator.flush()
+
+        # the successful login is still logged on its own
+        self.assertEqual([call.kwargs["event_id"] for call in handler_log.call_args_list], ["login_success", "session_timing"])
+        summary_log.assert_called_once()
+        self.assertEqual(summary_log.call_args.kwargs["event_id"], "login_failed_summary")
+        details = summary_log.call_args.kwargs["details"]
+        self.assertEqual(details["attempts"], 4)
+        self.assertEqual(details["unique_credentials"], 2)
+        self.assertEqual(details["untracked_attempts"], 1)
+        self.assertEqual(details["credentials"][0], {"username": "root", "password": "123456", "count": 2})
+
+
+if __name__ == '__main__':
+    unittest.main()
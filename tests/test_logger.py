@@ -0,0 +1,68 @@
+import glob
+import gzip
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from logger.log_rotator import LogRotator
+from logger.logger import LogWriter
+
+
+class TestLogWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.log_path = os.path.join(self.temp_dir.name, "test.log")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    @patch("logger.logger.sys.stdout")
+    def test_events_are_written_in_order(self, _):
+        writer = LogWriter(path=self.log_path, flush_interval=0.05)
+        for i in range(50):
+            writer.submit({"event_type": "test", "n": i})
+        writer.close()
+
+        with open(self.log_path, encoding="utf-8") as f:
+            events = [json.loads(line) for line in f]
+
+        self.assertEqual([event["n"] for event in events], list(range(50)))
+        self.assertEqual(writer.stats()["written"], 50)
+        self.assertEqual(writer.stats()["dropped"], 0)
+
+    @patch("logger.logger.sys.stdout")
+    def test_full_queue_drops_events(self, _):
+        writer = LogWriter(path=self.log_path, queue_size=1, flush_interval=0.05)
+        with patch.object(writer, "_write_batch", side_effect=lambda batch: writer._stopped.wait(0.2)):
+            results = [writer.submit({"n": i}) for i in range(20)]
+            writer.close()
+
+        self.assertIn(False, results)
+        self.assertEqual(writer.stats()["dropped"], results.count(False))
+
+    @patch("logger.log_rotator.print")
+    @patch("logger.logger.sys.stdout")
+    def test_rotation_compresses_in_background(self, *_):
+        rotator = LogRotator(self.temp_dir.name, "test", retention_count=2)
+        writer = LogWriter(path=self.log_path, rotator=rotator, max_size=200, batch_size=1, flush_interval=0.05)
+        for i in range(40):
+            writer.submit({"event_type": "test", "n": i})
+        writer.close()
+        rotator.wait_idle()
+
+        archives = glob.glob(os.path.join(self.temp_dir.name, "test_*.log.gz"))
+        self.assertEqual(len(archives), 2)
+        self.assertEqual(glob.glob(os.path.join(self.temp_dir.name, "test_*.log")), [])
+        with gzip.open(archives[0], "rt", encoding="utf-8") as f:
+            self.assertTrue(all(json.loads(line)["event_type"] == "test" for line in f))
+
+        stats = rotator.stats()
+        self.assertGreater(stats["rotations"], 2)
+        self.assertEqual(stats["deleted"], stats["rotations"] - 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
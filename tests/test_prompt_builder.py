@@ -0,0 +1,63 @@
+import unittest
+
+from LLM.LLM_integration import Message, Role
+from LLM.prompt_builder import PromptBuilder, estimate_tokens
+
+
+def summary_message(content):
+    return Message(Role.SYSTEM, content)
+
+
+class TestPromptBuilder(unittest.TestCase):
+
+    def setUp(self):
+        self.system = Message(Role.SYSTEM, "You are a Linux terminal.")
+        self.histories = [self.system]
+        for i in range(10):
+            self.histories.append(Message(Role.USER, f"cmd{i}"))
+            self.histories.append(Message(Role.ASSISTANT, f"out{i}\r\nroot@host:~$ "))
+
+    def test_single_system_prompt(self):
+        histories = self.histories + [self.system, Message(Role.USER, "cd"), Message(Role.ASSISTANT, "\r\nroot@host:~$ ")]
+        builder = PromptBuilder(max_tokens=10000, max_turns=100, summarize=False)
+
+        messages = builder.build(self.system, histories, Message(Role.USER, "ls"), summary_message)
+
+        self.assertEqual([m.role for m in messages].count("system"), 1)
+        self.assertEqual(messages[0], self.system)
+        self.assertEqual(messages[-1].content, "ls")
+        self.assertEqual(len(messages), 1 + 22 + 1)
+
+    def test_duplicate_exchanges_keep_latest(self):
+        startup = [Message(Role.USER, "cd"), Message(Role.ASSISTANT, "\r\nroot@host:~$ ")]
+        histories = startup + self.histories[1:5] + startup
+        builder = PromptBuilder(max_tokens=10000, max_turns=100, summarize=False)
+
+        messages = builder.build(self.system, histories, Message(Role.USER, "ls"), summary_message)
+
+        contents = [m.content for m in messages]
+        self.assertEqual(contents.count("cd"), 1)
+        self.assertEqual(contents[-3], "cd")
+
+    def test_window_respects_turn_limit_and_summarizes(self):
+        builder = PromptBuilder(max_tokens=10000, max_turns=3, summarize=True)
+
+        messages = builder.build(self.system, self.histories, Message(Role.USER, "ls"), summary_message)
+
+        self.assertEqual([m.content for m in messages[2:-1:2]], ["cmd7", "cmd8", "cmd9"])
+        self.assertIn("cmd0; cmd1", messages[1].content)
+        self.assertNotIn("cmd7", messages[1].content)
+
+    def test_window_respects_token_budget(self):
+        command = Message(Role.USER, "ls")
+        turn_cost = estimate_tokens("cmd9") + estimate_tokens("out9\r\nroot@host:~$ ")
+        max_tokens = estimate_tokens(self.system.content) + estimate_tokens("ls") + 2 * turn_cost
+        builder = PromptBuilder(max_tokens=max_tokens, max_turns=100, summarize=False)
+
+        messages = builder.build(self.system, self.histories, command, summary_message)
+
+        self.assertEqual([m.content for m in messages[1:-1:2]], ["cmd8", "cmd9"])
+
+
+if __name__ == '__main__':
+    unittest.main()
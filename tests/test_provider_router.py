@@ -0,0 +1,150 @@
+import threading
+import time
+import unittest
+
+from LLM.provider_router import PartialResponseError, ProviderRouter
+
+
+class Endpoint:
+    def __init__(self, name):
+        self.name = name
+
+
+class TestProviderRouter(unittest.TestCase):
+
+    def setUp(self):
+        self.primary = Endpoint("grok:primary")
+        self.fallback = Endpoint("ollama:fallback")
+
+    def test_fails_over_to_next_endpoint(self):
+        router = ProviderRouter([self.primary, self.fallback])
+
+        def fn(endpoint):
+            if endpoint is self.primary:
+                raise ValueError("No choices returned from LLM provider")
+            return "ok"
+
+        result, decision = router.call(fn)
+
+        self.assertEqual(result, "ok")
+        self.assertEqual(decision["provider"], "ollama:fallback")
+        self.assertEqual([attempt["outcome"] for attempt in decision["attempts"]], ["ValueError", "ok"])
+        self.assertEqual(router.stats()["failovers"], 1)
+
+    def test_raises_last_error_when_all_endpoints_fail(self):
+        router = ProviderRouter([self.primary, self.fallback])
+
+        def fn(endpoint):
+            raise ValueError(f"{endpoint.name} down")
+
+        with self.assertRaises(ValueError) as context:
+            router.call(fn)
+        self.assertIn("ollama:fallback", str(context.exception))
+
+    def test_partial_response_is_not_failed_over(self):
+        router = ProviderRouter([self.primary, self.fallback])
+        called = []
+
+        def fn(endpoint):
+            called.append(endpoint.name)
+            raise PartialResponseError("failed mid-stream")
+
+        with self.assertRaises(PartialResponseError):
+            router.call(fn)
+        self.assertEqual(called, ["grok:primary"])
+
+    def test_unhealthy_endpoint_is_tried_last(self):
+        router = ProviderRouter([self.primary, self.fallback], failure_threshold=2, cooldown=60)
+
+        def fn(endpoint):
+            if endpoint is self.primary:
+                raise TimeoutError("read timeout")
+            return "ok"
+
+        router.call(fn)
+        router.call(fn)
+
+        self.assertEqual(router.candidates(), [self.fallback, self.primary])
+        self.assertFalse(router.stats()["endpoints"]["grok:primary"]["healthy"])
+
+        _, decision = router.call(fn)
+        self.assertEqual(len(decision["attempts"]), 1)
+
+    def test_prefers_faster_endpoint(self):
+        router = ProviderRouter([self.primary, self.fallback])
+        router._record_success(self.primary, 2.0)
+        router._record_success(self.fallback, 0.1)
+
+        self.assertEqual(router.candidates(), [self.fallback, self.primary])
+
+    def test_hedges_slow_request(self):
+        router = ProviderRouter([self.primary, self.fallback], hedging=True, hedge_percentile=0.5, hedge_min_samples=3)
+        for _ in range(3):
+            router._record_success(self.primary, 0.05)
+        for _ in range(3):
+            router._record_success(self.fallback, 0.2)
+
+        def fn(endpoint):
+            if endpoint is self.primary:
+                time.sleep(1)
+                return "slow"
+            return "fast"
+
+        result, decision = router.call(fn)
+
+        self.assertEqual(result, "fast")
+        self.assertTrue(decision["hedged"])
+        self.assertEqual(decision["provider"], "ollama:fallback")
+        self.assertEqual(router.stats()["endpoints"]["grok:primary"]["hedged"], 1)
+
+    def test_no_hedging_while_workers_are_busy(self):
+        router = ProviderRouter([self.primary, self.fallback], hedging=True, hedge_percentile=0.5,
+                                hedge_min_samples=3, hedge_workers=1)
+        for _ in range(3):
+            router._record_success(self.primary, 0.01)
+            router._record_success(self.fallback, 0.5)
+        calling_thread = threading.current_thread()
+
+        def fn(endpoint):
+            time.sleep(0.1)
+            return "same thread" if threading.current_thread() is calling_thread else "worker"
+
+        # the only worker is taken, e.g. by a hedged request of another session
+        self.assertTrue(router._reserve_worker())
+        result, decision = router.call(fn)
+
+        self.assertEqual(result, "same thread")
+        self.assertFalse(decision["hedged"])
+        self.assertEqual(router.stats()["hedges_skipped"], 1)
+
+        router._release_worker()
+        result, decision = router.call(fn)
+        self.assertEqual(result, "worker")
+        self.assertEqual(decision["provider"], "grok:primary")
+
+    def test_hedge_needs_admission(self):
+        router = ProviderRouter([self.primary, self.fallback], hedging=True, hedge_percentile=0.5, hedge_min_samples=3)
+        for _ in range(3):
+            router._record_success(self.primary, 0.01)
+            router._record_success(self.fallback, 0.5)
+        requested = []
+
+        def fn(endpoint):
+            requested.append(endpoint.name)
+            time.sleep(0.1)
+            return endpoint.name
+
+        result, decision = router.call(fn, admit_hedge=lambda: False)
+
+        self.assertEqual(result, "grok:primary")
+        self.assertFalse(decision["hedged"])
+        self.assertEqual(requested, ["grok:primary"])
+        self.assertEqual(router.stats()["hedges_skipped"], 1)
+
+        result, decision = router.call(fn, admit_hedge=lambda: True)
+        self.assertTrue(decision["hedged"])
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+from unittest.mock import patch
+
+from LLM.response_cache import ResponseCache, normalize_command
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def test_normalize_command(self):
+        self.assertEqual(normalize_command("  uname   -a "), "uname -a")
+
+    def test_hit_and_miss_counters(self):
+        cache = ResponseCache(max_entries=4, ttl=60)
+        key = ResponseCache.make_key("uname  -a", "root", "127.0.0.1", "~")
+
+        self.assertIsNone(cache.get(key))
+        cache.put(key, "Linux\r\nroot@127.0.0.1:~$ ")
+        self.assertEqual(cache.get(ResponseCache.make_key("uname -a", "root", "127.0.0.1", "~")), "Linux\r\nroot@127.0.0.1:~$ ")
+        self.assertIsNone(cache.get(ResponseCache.make_key("uname -a", "root", "127.0.0.1", "/tmp")))
+
+        stats = cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 2)
+
+    def test_lru_eviction(self):
+        cache = ResponseCache(max_entries=2, ttl=60)
+        cache.put(("a",), "1")
+        cache.put(("b",), "2")
+        cache.get(("a",))
+        cache.put(("c",), "3")
+
+        self.assertIsNone(cache.get(("b",)))
+        self.assertEqual(cache.get(("a",)), "1")
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_ttl_expiry(self):
+        cache = ResponseCache(max_entries=2, ttl=10)
+        with patch("LLM.response_cache.time.monotonic", return_value=100):
+            cache.put(("a",), "1")
+        with patch("LLM.response_cache.time.monotonic", return_value=111):
+            self.assertIsNone(cache.get(("a",)))
+        self.assertEqual(cache.stats()["expirations"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
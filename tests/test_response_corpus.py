@@ -0,0 +1,160 @@
+import gzip
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+from store.response_corpus import CorpusIndexer, ResponseCorpus
+
+
+def command_input(command, response, username="root", session_id="s1", **details):
+    details = dict({"source": "llm", "cwd": "~"}, **details)
+    return json.dumps({
+        "timestamp": "2025-05-01T10:00:00",
+        "event_type": "command_input",
+        "session_id": session_id,
+        "src_ip": "203.0.113.7",
+        "username": username,
+        "command": command,
+        "response": response,
+        # a cwd of None stands for events logged before the cwd was recorded
+        "details": {key: value for key, value in details.items() if value is not None},
+    }) + "\n"
+
+
+class TestResponseCorpus(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.log_dir = self.tmp_dir.name
+        self.db_path = os.path.join(self.log_dir, "corpus.db")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _index(self):
+        indexer = CorpusIndexer(self.db_path)
+        stats = indexer.index_logs(self.log_dir)
+        indexer.close()
+        return stats
+
+    def _hits(self, command):
+        with sqlite3.connect(self.db_path) as conn:
+            return conn.execute("SELECT SUM(hits) FROM responses WHERE command = ?", (command,)).fetchone()[0]
+
+    def test_indexes_current_and_rotated_logs(self):
+        with gzip.open(os.path.join(self.log_dir, "leviathan_20250501T000000.log.gz"), "wt") as f:
+            f.write(command_input("nproc", "4\r\nroot@10.0.0.1:~$ "))
+            f.write(command_input("nproc", "4\r\nroot@10.0.0.1:~$ "))
+        with open(os.path.join(self.log_dir, "leviathan.log"), "w") as f:
+            f.write(command_input("nproc", "2\r\nroot@10.0.0.1:~$ "))
+            f.write(command_input("hostname -I", "10.0.0.1 \r\nroot@10.0.0.1:~$ "))
+            f.write(command_input("whoami", "root\r\nroot@10.0.0.1:~$ ", username="root", source="builtin"))
+            f.write(command_input("uname -a", "Linux", exec=True))
+
+        stats = self._index()
+        self.assertEqual(stats["indexed"], 4)
+
+        corpus = ResponseCorpus(self.db_path)
+        self.assertEqual(corpus.lookup("nproc", "root", "192.168.1.5", "~"), "4\r\nroot@192.168.1.5:~$ ")
+        self.assertEqual(corpus.lookup("hostname  -I", "root", "192.168.1.5", "~"), "192.168.1.5 \r\nroot@192.168.1.5:~$ ")
+        self.assertIsNone(corpus.lookup("nproc", "admin", "192.168.1.5", "~"))
+        self.assertIsNone(corpus.lookup("nproc", "root", "192.168.1.5", "/tmp"))
+        self.assertIsNone(corpus.lookup("whoami", "root", "192.168.1.5", "~"))
+        self.assertEqual(corpus.stats(), {"hits": 2, "misses": 3, "connections": 1})
+        corpus.close()
+
+    def test_lookups_share_a_bounded_pool(self):
+        with open(os.path.join(self.log_dir, "leviathan.log"), "w") as f:
+            f.write(command_input("nproc", "4\r\nroot@10.0.0.1:~$ "))
+        self._index()
+
+        corpus = ResponseCorpus(self.db_path, pool_size=3)
+        responses = []
+        threads = [
+            threading.Thread(target=lambda: responses.append(corpus.lookup("nproc", "root", "10.0.0.2", "~")))
+            for _ in range(100)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(responses, ["4\r\nroot@10.0.0.2:~$ "] * 100)
+        self.assertLessEqual(corpus.stats()["connections"], 3)
+        corpus.close()
+        self.assertEqual(corpus.stats()["connections"], 0)
+
+    def test_reindexing_counts_every_line_once(self):
+        live_log = os.path.join(self.log_dir, "leviathan.log")
+        with open(live_log, "w") as f:
+            f.write(command_input("nproc", "2\r\nroot@10.0.0.1:~$ "))
+        self._index()
+
+        with open(live_log, "a") as f:
+            f.write(command_input("nproc", "2\r\nroot@10.0.0.1:~$ "))
+            f.write('{"event_type": "command_input", "command": "nproc"')
+        self._index()
+        self.assertEqual(self._hits("nproc"), 2)
+
+        # the live log is rotated and compressed, then a new one is started
+        with open(live_log, "rb") as f_in, gzip.open(os.path.join(self.log_dir, "leviathan_20250501T000000.log.gz"), "wb") as f_out:
+            f_out.write(f_in.read().rsplit(b"\n", 1)[0] + b"\n")
+        with open(live_log, "w") as f:
+            f.write(command_input("nproc", "2\r\nroot@10.0.0.1:~$ ", session_id="s2"))
+        self._index()
+        self.assertEqual(self._hits("nproc"), 3)
+
+    def test_keeps_most_frequent_responses(self):
+        with open(os.path.join(self.log_dir, "leviathan.log"), "w") as f:
+            for i in range(5):
+                for _ in range(i + 1):
+                    f.write(command_input("date", f"day {i}\r\nroot@10.0.0.1:~$ "))
+
+        indexer = CorpusIndexer(self.db_path, max_responses=2)
+        indexer.index_logs(self.log_dir)
+        indexer.close()
+
+        with sqlite3.connect(self.db_path) as conn:
+            outputs = [row[0] for row in conn.execute("SELECT output FROM responses ORDER BY hits DESC")]
+        self.assertEqual(outputs, ["day 4\r\n", "day 3\r\n"])
+
+    def test_indexes_by_directory_the_command_ran_in(self):
+        with open(os.path.join(self.log_dir, "leviathan.log"), "w") as f:
+            f.write(command_input("cd /opt && ls", "app\r\nroot@10.0.0.1:/opt$ "))
+            f.write(command_input("ip route", "default via 10.0.0.10 dev eth0 src 10.0.0.1\r\nroot@10.0.0.1:/opt$ ",
+                                  cwd="/opt"))
+            # logged without the cwd, which follows from the session's earlier prompts
+            f.write(json.dumps({"event_type": "session_start", "session_id": "s2"}) + "\n")
+            f.write(command_input("cd /var", "root@10.0.0.1:/var$ ", session_id="s2", cwd=None))
+            f.write(command_input("ls", "log\r\nroot@10.0.0.1:/var$ ", session_id="s2", cwd=None))
+            f.write(command_input("ls", "cache\r\nroot@10.0.0.1:/usr$ ", session_id="s3", cwd=None))
+
+        stats = self._index()
+        self.assertEqual(stats["unknown_cwd"], 1)
+
+        corpus = ResponseCorpus(self.db_path)
+        self.assertEqual(corpus.lookup("cd /opt && ls", "root", "192.168.1.5", "~"), "app\r\nroot@192.168.1.5:~$ ")
+        self.assertIsNone(corpus.lookup("cd /opt && ls", "root", "192.168.1.5", "/opt"))
+        self.assertEqual(corpus.lookup("ip route", "root", "192.168.1.5", "/opt"),
+                         "default via 10.0.0.10 dev eth0 src 192.168.1.5\r\nroot@192.168.1.5:/opt$ ")
+        self.assertEqual(corpus.lookup("ls", "root", "192.168.1.5", "/var"), "log\r\nroot@192.168.1.5:/var$ ")
+        self.assertIsNone(corpus.lookup("ls", "root", "192.168.1.5", "/usr"))
+        corpus.close()
+
+    def test_skips_fully_indexed_archives(self):
+        archive = os.path.join(self.log_dir, "leviathan_20250501T000000.log.gz")
+        with gzip.open(archive, "wt") as f:
+            f.write(command_input("nproc", "4\r\nroot@10.0.0.1:~$ "))
+        self._index()
+
+        stats = self._index()
+        self.assertEqual(stats["skipped_files"], 1)
+        self.assertNotIn("commands", stats)
+        self.assertEqual(self._hits("nproc"), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
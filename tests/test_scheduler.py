@@ -0,0 +1,83 @@
+import threading
+import time
+import unittest
+
+from LLM.scheduler import PRIORITY_INTERACTIVE, PRIORITY_NEW, LLMScheduler, SchedulerOverloaded
+
+
+class TestLLMScheduler(unittest.TestCase):
+
+    def test_requests_per_second_budget(self):
+        scheduler = LLMScheduler(requests_per_second=10, burst=2)
+
+        waits = [scheduler.acquire(10) for _ in range(4)]
+
+        # the burst goes out right away, the rest is spaced 100ms apart
+        self.assertLess(waits[0] + waits[1], 0.05)
+        self.assertGreater(waits[2] + waits[3], 0.15)
+        self.assertEqual(scheduler.stats()["granted"], 4)
+
+    def test_tokens_per_minute_budget(self):
+        scheduler = LLMScheduler(tokens_per_minute=600, max_wait=0.2)
+
+        scheduler.acquire(500)
+        scheduler.record_usage(100)
+
+        with self.assertRaises(SchedulerOverloaded):
+            scheduler.acquire(100)
+        self.assertEqual(scheduler.stats()["timeouts"], 1)
+
+    def test_interactive_sessions_are_served_first(self):
+        scheduler = LLMScheduler(requests_per_second=5, burst=1)
+        scheduler.acquire(10)
+        order = []
+
+        def request(name, priority):
+            scheduler.acquire(10, priority)
+            order.append(name)
+
+        bot = threading.Thread(target=request, args=("bot", PRIORITY_NEW))
+        bot.start()
+        time.sleep(0.05)
+        human = threading.Thread(target=request, args=("human", PRIORITY_INTERACTIVE))
+        human.start()
+        bot.join()
+        human.join()
+
+        self.assertEqual(order, ["human", "bot"])
+
+    def test_queue_is_bounded(self):
+        scheduler = LLMScheduler(requests_per_second=1, burst=1, max_queued=1, max_wait=1)
+        scheduler.acquire(10)
+        waiter = threading.Thread(target=scheduler.acquire, args=(10,))
+        waiter.start()
+        time.sleep(0.05)
+
+        with self.assertRaises(SchedulerOverloaded):
+            scheduler.acquire(10)
+        waiter.join()
+        self.assertEqual(scheduler.stats()["rejected"], 1)
+
+
+    def test_try_acquire_never_waits(self):
+        scheduler = LLMScheduler(requests_per_second=1, burst=2, max_wait=1)
+
+        self.assertTrue(scheduler.try_acquire(10))
+        self.assertTrue(scheduler.try_acquire(10))
+        self.assertFalse(scheduler.try_acquire(10))
+        self.assertEqual(scheduler.stats()["granted"], 2)
+        self.assertEqual(scheduler.stats()["declined"], 1)
+
+    def test_try_acquire_does_not_get_ahead_of_the_queue(self):
+        scheduler = LLMScheduler(requests_per_second=10, burst=1, max_wait=1)
+        scheduler.acquire(10)
+        waiter = threading.Thread(target=scheduler.acquire, args=(10,))
+        waiter.start()
+        time.sleep(0.05)
+
+        self.assertFalse(scheduler.try_acquire(10))
+        waiter.join()
+
+
+if __name__ == '__main__':
+    unittest.main()
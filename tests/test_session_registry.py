@@ -0,0 +1,50 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from client_handling.session_registry import SessionRegistry
+
+
+class TestSessionRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = SessionRegistry(idle_timeout=10, max_session_duration=100, handshake_timeout=5, reaper_interval=60)
+
+    def test_reaps_stale_sessions(self):
+        handshaking = self.registry.register("handshaking", "10.0.0.1", 1, MagicMock())
+        idle = self.registry.register("idle", "10.0.0.2", 2, MagicMock())
+        idle.mark_ready()
+        active = self.registry.register("active", "10.0.0.3", 3, MagicMock())
+        active.mark_ready()
+
+        for entry in (handshaking, idle, active):
+            entry.started_at -= 20
+        idle.last_activity -= 20
+
+        with patch("client_handling.session_registry.log_event") as mock_log:
+            reaped = self.registry.reap()
+
+        self.assertEqual(reaped, 2)
+        handshaking.transport.close.assert_called_once()
+        idle.transport.close.assert_called_once()
+        active.transport.close.assert_not_called()
+        reasons = sorted(call.kwargs["details"]["reason"] for call in mock_log.call_args_list)
+        self.assertEqual(reasons, ["handshake_timeout", "idle_timeout"])
+
+        stats = self.registry.stats()
+        self.assertEqual(stats["live"], 1)
+        self.assertEqual(stats["reaped"], 2)
+
+    def test_max_session_duration(self):
+        entry = self.registry.register("long", "10.0.0.1", 1, MagicMock())
+        entry.mark_ready()
+        entry.started_at -= 200
+
+        with patch("client_handling.session_registry.log_event"):
+            self.assertEqual(self.registry.reap(), 1)
+        self.assertEqual(self.registry.stats()["reaped_by_reason"], {"session_timeout": 1})
+
+        self.registry.unregister("long")
+        self.assertEqual(self.registry.stats()["live"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
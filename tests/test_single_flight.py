@@ -0,0 +1,69 @@
+import threading
+import time
+import unittest
+
+from LLM.single_flight import SingleFlight
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def _run_concurrently(self, flight, key, fn, callers):
+        results = []
+        errors = []
+
+        def caller():
+            try:
+                results.append(flight.do(key, fn))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=caller) for _ in range(callers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results, errors
+
+    def test_concurrent_callers_share_one_request(self):
+        flight = SingleFlight()
+        calls = []
+
+        def fn():
+            calls.append(1)
+            time.sleep(0.2)
+            return "Linux\r\nroot@127.0.0.1:~$ "
+
+        results, errors = self._run_concurrently(flight, ("uname -a",), fn, 5)
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(calls), 1)
+        self.assertEqual({result for result, _ in results}, {"Linux\r\nroot@127.0.0.1:~$ "})
+        self.assertEqual(sum(1 for _, shared in results if shared), 4)
+
+        stats = flight.stats()
+        self.assertEqual(stats["upstream_requests"], 1)
+        self.assertEqual(stats["coalesced"], 4)
+        self.assertEqual(stats["in_flight"], 0)
+
+    def test_error_is_raised_for_every_caller(self):
+        flight = SingleFlight()
+
+        def fn():
+            time.sleep(0.2)
+            raise ValueError("No choices in response")
+
+        results, errors = self._run_concurrently(flight, ("ls",), fn, 3)
+
+        self.assertEqual(results, [])
+        self.assertEqual(len(errors), 3)
+        self.assertEqual(flight.stats()["errors"], 1)
+
+    def test_finished_request_is_not_reused(self):
+        flight = SingleFlight()
+
+        self.assertEqual(flight.do(("ls",), lambda: "first"), ("first", False))
+        self.assertEqual(flight.do(("ls",), lambda: "second"), ("second", False))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from logger.logger import log_event
+from supervisor.supervisor import Supervisor
+
+
+def crashing_worker(code):
+    log_event(event_id="worker_test", session_id=None, message="started")
+    raise SystemExit(code)
+
+
+class TestSupervisor(unittest.TestCase):
+    def test_restarts_crashed_workers_and_forwards_logs(self):
+        forwarded = []
+        supervisor = Supervisor(2, crashing_worker, (3,), restart_backoff=0.1, max_restart_backoff=0.2)
+
+        with patch("supervisor.supervisor.write_log_entry", forwarded.append):
+            thread = threading.Thread(target=supervisor.run, daemon=True)
+            thread.start()
+            deadline = time.monotonic() + 30
+            while supervisor.restarts < 4 and time.monotonic() < deadline:
+                time.sleep(0.1)
+            supervisor.stop()
+            thread.join(timeout=30)
+
+        self.assertFalse(thread.is_alive())
+        self.assertGreaterEqual(supervisor.restarts, 4)
+        started = [entry for entry in forwarded if entry["event_type"] == "worker_test"]
+        self.assertGreaterEqual(len(started), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,7 @@
 import os
+import sqlite3
+import threading
+import time
 import unittest
 
 from store.user_history_store import UserHistoryStore
@@ -10,8 +13,10 @@ class TestUserHistoryStore(unittest.TestCase):
         self.store = UserHistoryStore(db_path=self.test_db_path)
 
     def tearDown(self):
-        if os.path.exists(self.test_db_path):
-            os.remove(self.test_db_path)
+        self.store.close()
+        for path in (self.test_db_path, f"{self.test_db_path}-wal", f"{self.test_db_path}-shm"):
+            if os.path.exists(path):
+                os.remove(path)
 
     def test_add_load_history(self):
         username = "test"
@@ -29,7 +34,7 @@ class TestUserHistoryStore(unittest.TestCase):
         username = "test"
         with self.store.lock:
             self.store.conn.execute("""
-                        INSERT INTO history (username, role, message, expire_at) VALUES (?, ?, ?, datetime('now', '-1 hour'))
+                        INSERT INTO history (username, role, message, expire_at) VALUES (?, ?, ?, strftime('%s', 'now') - 3600)
                     """, (username, "user", "test"))
             self.store.conn.commit()
 
@@ -40,7 +45,7 @@ class TestUserHistoryStore(unittest.TestCase):
         username = "test"
         with self.store.lock:
             self.store.conn.execute("""
-                INSERT INTO history (username, role, message, expire_at) VALUES (?, ?, ?, datetime('now', '-1 hour'))
+                INSERT INTO history (username, role, message, expire_at) VALUES (?, ?, ?, strftime('%s', 'now') - 3600)
             """, (username, "user", "test"))
             self.store.conn.commit()
 
@@ -48,5 +53,142 @@ class TestUserHistoryStore(unittest.TestCase):
         result = self.store.load_user_history(username)
         self.assertEqual(len(result), 0)
 
+    def test_batched_writes_are_committed(self):
+        for i in range(1200):
+            self.store.add_to_user_history(f"user{i % 3}", [{"role": "user", "message": f"cmd{i}"}])
+        self.store.flush()
+
+        count = self.store.conn.execute("SELECT COUNT(*) FROM history").fetchone()[0]
+        self.assertEqual(count, 1200)
+        self.assertEqual(len(self.store.load_user_history("user1")), 400)
+        self.assertEqual(self.store.load_user_history("user0")[1]["message"], "cmd3")
+
+    def test_wal_and_indexes(self):
+        journal_mode = self.store.conn.execute("PRAGMA journal_mode").fetchone()[0]
+        indexes = {row[1] for row in self.store.conn.execute("PRAGMA index_list(history)")}
+
+        self.assertEqual(journal_mode, "wal")
+        self.assertIn("idx_history_username", indexes)
+        self.assertIn("idx_history_expire_at", indexes)
+
+    def test_history_cache(self):
+        self.store.add_to_user_history("root", [{"role": "user", "message": "ls"}])
+        self.assertEqual(len(self.store.load_user_history("root")), 1)
+
+        # writes after the first load go to the cached history as well
+        self.store.add_to_user_history("root", [{"role": "assistant", "message": "file"}])
+        loaded = self.store.load_user_history("root")
+        self.assertEqual([entry["message"] for entry in loaded], ["ls", "file"])
+
+        stats = self.store.cache_stats()
+        self.assertEqual(stats["users"], 1)
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertGreater(stats["bytes"], 0)
+
+    def test_history_cache_bounds_and_expiry(self):
+        store = UserHistoryStore(db_path=self.test_db_path, cache_max_users=2)
+        try:
+            for username in ("a", "b", "c"):
+                store.add_to_user_history(username, [{"role": "user", "message": "id"}])
+                store.load_user_history(username)
+            self.assertEqual(store.cache_stats()["users"], 2)
+            self.assertEqual(store.cache_stats()["evictions"], 1)
+
+            # expire the cached entries of "c", cleanup drops them from memory too
+            store._cache["c"][1] = [(role, message, 0.0) for role, message, _ in store._cache["c"][1]]
+            store.cleanup()
+            self.assertEqual(store.load_user_history("c"), [])
+        finally:
+            store.close()
+
+    def test_history_cache_forgets_evicted_users(self):
+        store = UserHistoryStore(db_path=self.test_db_path, cache_max_users=2)
+        try:
+            for i in range(50):
+                store.add_to_user_history(f"user{i}", [{"role": "user", "message": "id"}])
+                store.load_user_history(f"user{i}")
+            store.flush()
+
+            self.assertEqual(store.cache_stats()["users"], 2)
+            self.assertEqual(store._loading, {})
+        finally:
+            store.close()
+
+    def test_readers_share_a_bounded_pool(self):
+        self.store.add_to_user_history("root", [{"role": "user", "message": "id"}])
+        self.store.flush()
+
+        def load(i):
+            self.store.load_user_history(f"reader{i}")
+
+        threads = [threading.Thread(target=load, args=(i,)) for i in range(50)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertLessEqual(self.store.maintenance_stats()["read_connections"], self.store._read_pool.max_size)
+
+    def test_rows_per_user_cap(self):
+        store = UserHistoryStore(db_path=self.test_db_path, max_rows_per_user=10)
+        try:
+            for i in range(25):
+                store.add_to_user_history("root", [{"role": "user", "message": f"cmd{i}"}])
+            store.flush()
+            count = store.conn.execute("SELECT COUNT(*) FROM history WHERE username = 'root'").fetchone()[0]
+            loaded = store.load_user_history("root")
+        finally:
+            store.close()
+
+        self.assertEqual(count, 10)
+        self.assertEqual(loaded[0]["message"], "cmd15")
+
+    def test_cleanup_in_batches(self):
+        store = UserHistoryStore(db_path=self.test_db_path, cleanup_batch_size=7)
+        try:
+            with store.lock:
+                store.conn.executemany(
+                    "INSERT INTO history (username, role, message, expire_at) VALUES (?, ?, ?, ?)",
+                    [("test", "user", f"cmd{i}", time.time() - 10) for i in range(50)],
+                )
+                store.conn.commit()
+            store.add_to_user_history("test", [{"role": "user", "message": "live"}])
+
+            deleted = store.cleanup()
+            loaded = store.load_user_history("test")
+            auto_vacuum = store.conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        finally:
+            store.close()
+
+        self.assertEqual(deleted, 50)
+        self.assertEqual([entry["message"] for entry in loaded], ["live"])
+        self.assertEqual(auto_vacuum, 2)
+
+    def test_migrates_text_expiry(self):
+        self.store.close()
+        os.remove(self.test_db_path)
+        conn = sqlite3.connect(self.test_db_path)
+        conn.execute("""
+            CREATE TABLE history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT NOT NULL,
+                role TEXT NOT NULL,
+                message TEXT NOT NULL,
+                expire_at TEXT
+            )
+        """)
+        conn.execute("INSERT INTO history (username, role, message, expire_at) VALUES ('old', 'user', 'ls', datetime('now', 'localtime', '+1 hour'))")
+        conn.commit()
+        conn.close()
+
+        self.store = UserHistoryStore(db_path=self.test_db_path)
+        expire_at = self.store.conn.execute("SELECT expire_at FROM history").fetchone()[0]
+
+        self.assertIsInstance(expire_at, float)
+        self.assertAlmostEqual(expire_at, time.time() + 3600, delta=60)
+        self.assertEqual(len(self.store.load_user_history("old")), 1)
+
+
 if __name__ == '__main__':
     unittest.main()